@@ -7,27 +7,28 @@
 # https://stackoverflow.com/questions/68394825/ttk-combobox-triggers-listboxselect-event-in-different-tk-listbox
 # mido examples
 # https://github.com/snhirsch/katana-midi-bridge/blob/master/katana.py
+from time import perf_counter
+startTime = perf_counter()
 import logging
 import subprocess
-logging.basicConfig(filename='midi.log', level=logging.DEBUG)
+import threading
+import queue
+from zoomtrace import setup_logging
+setup_logging()
 from tkinter import *
 from tkinter import ttk
 import tkinter as tk
 from tkinter import font
-from collections import Counter
-from PIL import Image, ImageTk
-win = Tk()
-
-win.geometry("1800x900")
-bigfont = font.Font(family="LucidaConsole", size = 20)
-win.option_add("*Font", bigfont)
-    
-from construct import *
+from collections import Counter, OrderedDict
+# PIL (getImage) and numpy (zoomsimilar) are imported when first needed,
+# the window is shown before the pedal is synced and its files loaded.
+# So are mido and what uses it (zoompatch, zoomtransport, zoomauto,
+# zoomsetlist, zoomdevice), loadPedal imports them in the background.
 import json
 import os
-import shutil
 import sys
-import mido
+import copy
+from zoomlistview import VirtualList
 
 fxOn = [False, False, False, False, False, False, False, False, False]
 # we use this to keep tabs of the FX slot
@@ -38,45 +39,63 @@ fxOn = [False, False, False, False, False, False, False, False, False]
 fxSlotID = [0, 1, 2, 3, 4, 5, 6, 7, 8]
 # the FX's slot
 activeFX = None
-
-def FXM_ID(ioport, slot, fxid, gid):
-    sysex = mido.Message('sysex')
-    sendString = [0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, slot - 1, 1, fxid & 0x7f, (fxid>>7) & 0x7f, 0, gid & 0x7f, (gid >> 7) & 0x7f]
-    sysex.data = sendString
-    ioport.send(sysex)
-
-
-def FXM_PN(ioport, slot, pn, v):
-    sysex = mido.Message('sysex')
-    sendString = [0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, slot - 1, pn + 1, v & 0x7f, (v>>7) & 0x7f, 0, 0, 0]
-    sysex.data = sendString
-    ioport.send(sysex)
-
-
-def FXM_OnOff(ioport, slot, OnOff):
-    sysex = mido.Message('sysex')
-    sendString = [0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, slot - 1, 0x00, OnOff, 0x00, 0x00, 0x00, 0x00]
-    sysex.data = sendString
-    ioport.send(sysex)
-
-
-def LoadPatch(ioport, theIndex, bankSize):
-
-    cc = mido.Message('control_change')
-    cc.channel = 0
-    cc.control = 0
-    cc.value = 0
-    ioport.send( cc )
-
-    cc.control = 0x20
-    cc.value = int(theIndex / bankSize)
-    ioport.send( cc )
-
-    pc = mido.Message('program_change')
-    pc.channel = 0
-    pc.program = theIndex % bankSize
-    ioport.send( pc )
-
+# what we believe the pedal's edit buffer holds (decoded patch), None if unknown
+editBuffer = None
+# optional setlist (json file given on the command line)
+setlist = None
+# zoomsimilar.PatchMatrix of the loaded patches, None without numpy
+patchMatrix = None
+# patch index of each line in the similar patches list
+similarIndex = []
+# lower case group name -> indexes into fxPop, for the FX list
+fxGroupIndex = {}
+# prepared patches for showPatch (see patchView), least recently used first
+patchViews = OrderedDict()
+PATCH_VIEWS = 32
+# FX icons by file name, shared by the views
+iconCache = {}
+# zoomauto.Automation sweeping a parameter, None when the LFO is off
+automation = None
+# index of the last parameter slider moved, what the LFO sweeps
+lastParam = None
+# the window, created in main
+win = None
+# the FX slot widgets (see buildFXSlots) and the widgets and value of each
+# parameter (see paramFrame), made when first needed
+currFXLabelFrame = None
+currFXAvail = None
+params = [None for x in range(9)]
+paramVal = [None for x in range(9)]
+# CachedPort to the pedal (over a zoomtransport.Transport), opened before
+# the sync, which shares it
+ioport = None
+# (what, seconds since start) for the startup report
+startupTimes = []
+# background loader results, handed to the GUI thread by pollLoader
+loaderResults = queue.Queue()
+loaderDone = False
+exitStatus = 0
+
+
+def startupMark(what):
+    startupTimes.append((what, perf_counter() - startTime))
+    logging.info("startup: %s at %.3fs", what, startupTimes[-1][1])
+
+
+def startupReport():
+    last = 0.0
+    for what, t in startupTimes:
+        print("startup {:20} {:7.3f}s (+{:.3f}s)".format(what, t, t - last))
+        last = t
+
+
+def editBufferFX(slot):
+    # the FX starting at this physical slot of the edit buffer
+    from zoompatch import patch_layout
+    if editBuffer is None:
+        return None
+    heads, owner = patch_layout(editBuffer)
+    return heads.get(slot)
 
 
 # returns data ready for display
@@ -141,6 +160,7 @@ def getImage(name):
     # check for BYPASS
     if name == '':
         return None
+    from PIL import Image, ImageTk
     image = Image.open(name)
     zoomFactor=4
 
@@ -149,10 +169,58 @@ def getImage(name):
     return python_image
 
 
+def getIcon(name):
+    # getImage, once per file
+    if name not in iconCache:
+        iconCache[name] = getImage(name)
+    return iconCache[name]
+
+
+def patchView(theIndex):
+    # what showPatch needs for patch theIndex: the FX in their physical
+    # slots with their icons and parameters, kept for the last
+    # PATCH_VIEWS patches. Edits change the edit buffer not rawPatches,
+    # anything changing rawPatches[theIndex] must call forgetPatchView.
+    view = patchViews.get(theIndex)
+    if view is not None:
+        patchViews.move_to_end(theIndex)
+        return view
+    rp = rawPatches[theIndex]
+    slots = []
+    # walk the logical slots, noting the actual slot each starts in
+    i = 0
+    for j in range(rp['numFX']):
+        cfx = rp['FX'][j]
+        params = []
+        for q in range(len(cfx['Parameters'])):
+            baseParam = cfx['Parameters'][q]
+            params.append((baseParam["param{}".format(q+1)], baseParam['name'], baseParam['mmax']))
+        slots.append({'slot': i, 'name': cfx['name'], 'enabled': cfx['enabled'],
+            'image': getIcon(cfx['filename']), 'params': params})
+        i = i + cfx['numSlots']
+    view = {'label': "Patch: {}\nDescription: {}".format(rp['patchname'], rp['description']),
+        'slots': slots}
+    patchViews[theIndex] = view
+    if len(patchViews) > PATCH_VIEWS:
+        patchViews.popitem(last = False)
+    return view
+
+
+def forgetPatchView(theIndex = None):
+    # drop one patch's view, or all of them
+    if theIndex is None:
+        patchViews.clear()
+    else:
+        patchViews.pop(theIndex, None)
+
+
 def fx_clicked(i, theFX):
     global fxOn
     global activeFX
+    from zoompatch import FXM_OnOff
     logging.info(i)
+    if ioport is None:
+        return
     # set global current FX
     activeFX = theFX
     print("Active FX = {}".format(activeFX))
@@ -167,6 +235,9 @@ def fx_clicked(i, theFX):
         theFX['onoff'].config(bg = "red", relief = RAISED, borderwidth=1)
         theFX['label'].configure( bg="red", borderwidth=10)
         FXM_OnOff(ioport, activeFX['slot'], 0)
+    bufFX = editBufferFX(activeFX['slot'])
+    if bufFX is not None:
+        bufFX['enabled'] = fxOn[i]
 
 
 def fx_selected(FX):
@@ -179,12 +250,14 @@ def fx_selected(FX):
     if rawdata is not None and len(rawdata) != 0:
         # zero out the params
         for i in range(len(params)):
-            params[i][0].grid_forget()
+            if params[i] is not None:
+                params[i][0].grid_forget()
         logging.info(len(rawdata))
         data = rawdata['FX']
         pdata = rawdata['Parameters']
         numParams = data['numParams']
         for i in range(numParams):
+            paramFrame(i)
             # move current slots's FX values into the Parameter frame.
             paramVal[i].set(activeFX['params'][i])
             print(pdata[i]['name'])
@@ -196,8 +269,11 @@ def fx_selected(FX):
 
 
 def param_slider_changed(val, i, ioport):
+    global lastParam
+    from zoompatch import FXM_PN
     logging.info(i)
-    if activeFX is not None:
+    lastParam = i
+    if activeFX is not None and ioport is not None:
         newval = int(float(val))
         # move current slots's FX values into the Parameter frame.
         (params[i][3]).config(text = paramVal[i].get())
@@ -206,11 +282,56 @@ def param_slider_changed(val, i, ioport):
         print("activeFX, i, val is {} {} {}".format(activeFX, i, newval))
         # check i v i + 1
         FXM_PN(ioport, activeFX['slot'], i + 1, newval)
+        bufFX = editBufferFX(activeFX['slot'])
+        if bufFX is not None and i < len(bufFX['Parameters']):
+            bufFX['Parameters'][i]["param{}".format(i+1)] = newval
+
+def lfoToEditBuffer(sweep, again = True):
+    # the LFO sends from its own thread, the edit buffer is only changed
+    # here in the GUI thread: each lane's last value sent (an int, read as
+    # the thread leaves it) goes into the edit buffer's FX. Stops once
+    # sweep is no longer the running automation.
+    if sweep is not automation:
+        return
+    for lane in sweep.lanes:
+        bufFX = editBufferFX(lane.slot)
+        v = lane.last
+        if v is not None and bufFX is not None and lane.param <= len(bufFX['Parameters']):
+            bufFX['Parameters'][lane.param - 1]["param{}".format(lane.param)] = v
+    if again:
+        win.after(100, lfoToEditBuffer, sweep)
+
+def toggleLfo():
+    # sweep the last parameter moved from 0 to its maximum, the messages
+    # are sent from the automation thread
+    global automation
+    if automation is not None:
+        automation.stop()
+        # where the LFO left the pedal
+        lfoToEditBuffer(automation, False)
+        print("Automation {}".format(automation.stats()))
+        automation = None
+    if not lfoOn.get():
+        return
+    if activeFX is None or lastParam is None or ioport is None:
+        print("Move a parameter first")
+        lfoOn.set(False)
+        return
+    from zoomauto import Automation, Lane, Lfo
+    mmax = int(float(params[lastParam][2].cget('to')))
+    automation = Automation(ioport)
+    automation.add(Lane(activeFX['slot'], lastParam + 1, Lfo("sine", float(lfoRate.get())), 0, mmax))
+    automation.start()
+    win.after(100, lfoToEditBuffer, automation)
 
 # i is the FX permutation
 # allFX means we have handle on all FX slots and states
 def fx_id_clicked(i, allFX, avail_FX):
+    global editBuffer
+    from zoompatch import FXM_ID
     logging.info(i)
+    if ioport is None:
+        return
 
     # OK so I was using avail_FX to grab the current selected FX
     # then derive data ... but now I want to have a shorter list
@@ -242,6 +363,7 @@ def fx_id_clicked(i, allFX, avail_FX):
             baseParam = rawdata['Parameters'][q]
             # a raw FX doesnt have a param1, param2 but instead mdefault
             allFX[i]['params'][q] = baseParam['mdefault']
+            paramFrame(q)
             # move current slots's FX values into the Parameter frame.
             paramVal[q].set(allFX[i]['params'][q])
             print(baseParam['name'])
@@ -255,7 +377,7 @@ def fx_id_clicked(i, allFX, avail_FX):
             allFX[i]['label'].configure( image = None)
             allFX[i]['label'].image = None
             return
-        img = getImage(fileName)
+        img = getIcon(fileName)
         if img is not None:
             allFX[i]['label'].configure( image = img)
             allFX[i]['label'].image = img
@@ -263,29 +385,85 @@ def fx_id_clicked(i, allFX, avail_FX):
             # both missing and multi width.
             #runCommand('../../B1XFour/FXM_ID.sh {} {} {}'.format(allFX[i]['slot'], fxid, gid))
             FXM_ID(ioport, allFX[i]['slot'], fxid, gid)
+            # keep our copy of the edit buffer in step, the pedal
+            # loads the new FX with its defaults
+            bufFX = editBufferFX(allFX[i]['slot'])
+            if bufFX is None or bufFX['numSlots'] != data['numSlots']:
+                # slot layout changed, we no longer know what the pedal holds
+                editBuffer = None
+            else:
+                bufFX.update({'fxid': fxid, 'gid': gid, 'name': data['name'],
+                    'numSlots': data['numSlots'], 'filename': fileName})
+                bufFX['Parameters'] = [dict(p, **{"param{}".format(q+1): p['mdefault']})
+                    for q, p in enumerate(rawdata['Parameters'])]
     # should I also update the JSON for this patch?
 
 def buildCurrFXGUI(win, avail_FX, FX):
-    # create a label frame and put the widgets in there
+    # create a label frame, buildFXSlots puts the widgets in there
+    global currFXLabelFrame, currFXAvail
     wid = 200
-    baseHeight = 50
     currFXLabelFrame = LabelFrame(win, text="Current FX", height=350, width = wid * len(FX))
     currFXLabelFrame.pack(fill="both", expand="yes")
+    currFXAvail = avail_FX
+
+def buildFXSlots():
+    # the widgets of each FX slot, once there is a pedal to send to
+    FX = currFX
+    wid = 200
+    baseHeight = 50
+    if FX[0]['label'] is not None:
+        return
     for i in range(len(FX)):
         logging.info(i)
         FX[i]['slot'] = i + 1
         FX[i]['label'] = tk.Button(currFXLabelFrame, image = None,
             command = lambda  arg1 = FX[i]: fx_selected(arg1) )
         FX[i]['label'].place(x = wid * i, y = baseHeight)
-        FX[i]['onoff'] = tk.Button(currFXLabelFrame, text= "FX{} OnOff".format(i+1), 
+        FX[i]['onoff'] = tk.Button(currFXLabelFrame, text= "FX{} OnOff".format(i+1), state = controlState(),
             command = lambda  arg1 = i, arg2 = FX[i]: fx_clicked(arg1, arg2) )
         FX[i]['onoff'].place(x = wid * i, y = 200 + baseHeight)
         # here we pass the whole FX cache because new slots need to be adjusted
-        FX[i]['effect'] = tk.Button(currFXLabelFrame, text= "FX{} ID".format(i+1), 
-            command = lambda  arg1 = i, arg2 = FX, arg3 = avail_FX:
+        FX[i]['effect'] = tk.Button(currFXLabelFrame, text= "FX{} ID".format(i+1), state = controlState(),
+            command = lambda  arg1 = i, arg2 = FX, arg3 = currFXAvail:
                 fx_id_clicked(arg1, arg2, arg3) )
         FX[i]['effect'].place(x = wid * i, y = 250 + baseHeight)
 
+def paramFrame(i):
+    # the frame, name, slider and value of parameter i, made the first
+    # time it is shown
+    if params[i] is None:
+        paramVal[i] = tk.IntVar()
+        # dont forget to bias the parameter by 1
+        pLF = tk.LabelFrame(mainParamLabelFrame, text="P{}".format(i+1), bg="green")
+        sl = ttk.Label(pLF, text="Param{}".format(i))
+        sl.grid(column= 0, row=0, sticky="w")
+        # ioport is looked up when the slider moves
+        s = ttk.Scale(pLF, from_ = 0, to = 100, orient='horizontal',
+            variable=paramVal[i], 
+            command=lambda  arg1, arg2=i: param_slider_changed(arg1, arg2, ioport))
+        s.grid(row=0, column=1, sticky = "w")
+        if ioport is None:
+            s.state(["disabled"])
+        scvl = ttk.Label(pLF, text="Value: ")
+        scvl.grid(row=1, column=0, sticky = "w")
+        scvlv = ttk.Label(pLF, text="10")
+        scvlv.grid(row=1, column=1, sticky="w")
+        params[i] = [pLF, sl, s, scvlv]
+    return params[i]
+
+def controlState():
+    # FX and parameter controls send to the pedal, so wait for it
+    return NORMAL if ioport is not None else DISABLED
+
+def enableControls():
+    for theFX in currFX:
+        for key in ('onoff', 'effect'):
+            if theFX[key] is not None:
+                theFX[key].config(state = controlState())
+    for p in params:
+        if p is not None:
+            p[2].state(["!disabled"] if ioport is not None else ["disabled"])
+
 def runCommand(cmd):
     print("STARTING INIT")
     p = subprocess.Popen(cmd, shell=True, stderr=subprocess.PIPE)
@@ -299,24 +477,16 @@ def runCommand(cmd):
     print("FINISHED INIT")
 
 
-# Tk's way is you _know_ what you bound this to.
-def userSelectedPatch(event):
-    print("In USERSELECTEDPATCH")
-    selection = event.widget.curselection()
-    if selection:
-        theIndex = selection[0]
-        theValue = event.widget.get(theIndex)
-    else:
-        theIndex=0
-        theValue=0
-
+# show patch theIndex in the GUI, returns the patch
+def showPatch(theIndex):
     rp = rawPatches[theIndex]
+    view = patchView(theIndex)
 
-    patchLabel.config(text = "Patch: {}\nDescription: {}".format(rp['patchname'], rp['description']))
+    patchLabel.config(text = view['label'])
     patchLabel.pack(side=TOP, anchor="w")
+    buildFXSlots()
     # Zero out existing GUI first
     for i in range(0, len(currFX)):
-        print("zeroing out gui {}".format(i))
         currFX[i]['onoff'].config(text = "FX{} {}".format(i+1, "OFF"))
         currFX[i]['onoff'].config(bg = "red", relief = RAISED, borderwidth=1)
         currFX[i]['label'].image = None
@@ -325,21 +495,16 @@ def userSelectedPatch(event):
         currFX[i]['effect'].config(text = "FX{} ID".format(i+1))
         currFX[i]['name'] = "Bypass" 
             
-    # we have index into the patch,
-    # so walk the FX
-    endLoop = rp['numFX']
-    i = 0 # actual slot
-    j = 0 # logical slot
-    # walk the logical slots (j), but set FX value in actual slot (i).
-    while j < endLoop:
-        cfx = rp['FX'][j]
-        img = getImage(cfx['filename'])
+    # set each FX in its actual slot
+    for vfx in view['slots']:
+        i = vfx['slot']
+        img = vfx['image']
         theFX=currFX[i]
-        theFX['name'] = cfx['name']
+        theFX['name'] = vfx['name']
         theFX['slot'] = i + 1
         theFX['label'].configure( image = img)
         theFX['label'].image = img
-        if cfx['enabled'] == True:
+        if vfx['enabled'] == True:
             theFX['onoff'].config(text = "FX{} {}".format(i+1, "ON"))
             theFX['onoff'].config(bg = "green", relief = SUNKEN, borderwidth=4)
             if img:
@@ -349,24 +514,90 @@ def userSelectedPatch(event):
             theFX['onoff'].config(bg = "red", relief = RAISED, borderwidth=1)
             if img:
                 theFX['label'].configure( bg="red", borderwidth=10)
-        i = i + cfx['numSlots']
-        for q in range(len(cfx['Parameters'])):
-            baseParam = cfx['Parameters'][q]
-            theFX['params'][q] = baseParam["param{}".format(q+1)]
+        for q in range(len(vfx['params'])):
+            value, name, mmax = vfx['params'][q]
+            theFX['params'][q] = value
+            paramFrame(q)
             # move current slots's FX values into the Parameter frame.
-            paramVal[q].set(theFX['params'][q])
-            print(baseParam['name'])
-            print(baseParam['mmax'])
-            (params[q][1]).configure(text = baseParam['name'])
-            (params[q][2]).configure(to = baseParam['mmax'])
-            (params[q][3]).config(text = paramVal[q].get())
+            paramVal[q].set(value)
+            (params[q][1]).configure(text = name)
+            (params[q][2]).configure(to = mmax)
+            (params[q][3]).config(text = value)
             (params[q][0]).grid(row = int( q / 3), column = q % 3, sticky="w")
-        j = j + 1
+    showSimilar(theIndex)
+    return rp
+
+
+def showSimilar(theIndex):
+    global similarIndex
+    if patchMatrix is None:
+        return
+    similarListBox.delete(0, 'end')
+    similarIndex = []
+    for j, dist in patchMatrix.nearest(theIndex, 5):
+        similarIndex.append(j)
+        similarListBox.insert('end', "[{}] {} ({:.2f})".format(j, rawPatches[j]['patchname'], dist))
+
+
+def userSelectedSimilar(event):
+    # select the patch in the main list, as if it was clicked there
+    selection = event.widget.curselection()
+    if not selection or selection[0] >= len(similarIndex):
+        return
+    theIndex = similarIndex[selection[0]]
+    patchListBox.select_item(theIndex)
+    patchListBox.event_generate("<<ListboxSelect>>")
+
+
+# Tk's way is you _know_ what you bound this to.
+def userSelectedPatch(event):
+    global editBuffer
+    print("In USERSELECTEDPATCH")
+    selection = event.widget.curselection()
+    if selection:
+        # the list may be filtered, we want the patch number
+        theIndex = event.widget.item(selection[0])
+        theValue = event.widget.get(selection[0])
+    else:
+        theIndex=0
+        theValue=0
 
+    rp = showPatch(theIndex)
+    if ioport is None:
+        return
+    from zoompatch import LoadPatch, apply_patch_diff
 
     # ok so how about we actually change the patch??
-    bankSize = int(model['bankSize'])
-    LoadPatch(ioport, theIndex, bankSize)
+    if audition.get() and editBuffer is not None:
+        # morph the edit buffer into the patch without switching/saving
+        editBuffer, sent = apply_patch_diff(ioport, editBuffer, rp)
+        print("Audition {} with {} messages".format(rp['patchname'], sent))
+    else:
+        bankSize = int(model['bankSize'])
+        LoadPatch(ioport, theIndex, bankSize)
+        editBuffer = copy.deepcopy(rp)
+        ioport.seed(rp)
+        if setlist is not None:
+            setlist.invalidate()
+
+
+def setlistStep(direction):
+    global editBuffer
+    if setlist is None:
+        return
+    if direction > 0:
+        entry = setlist.next(ioport)
+    else:
+        entry = setlist.prev(ioport)
+    if entry is None:
+        return
+    theIndex = entry['patch']
+    patchListBox.select_item(theIndex)
+    rp = showPatch(theIndex)
+    editBuffer = copy.deepcopy(rp)
+    ioport.seed(rp)
+    setlistLabel.config(text = "Setlist {}/{}: {} ({:.2f}ms)".format(setlist.position + 1,
+        len(setlist.entries), entry['name'] or rp['patchname'], setlist.timings[-1] * 1000))
 
 
 def userSelectedFX(event):
@@ -387,13 +618,7 @@ def userSelectedFX(event):
 def avail_FXGrp_clicked(event):
     print("\tAVAIL_FXGRP")
     selection = event.widget.get()
-    FXListBox.delete(0, 'end')
-    for item in fxPop:
-        if item['groupname'].lower() == (selection).lower():
-            FXListBox.insert('end', item['name'])
-
-    FXListBox.config(yscrollcommand = scrollbarFXFrame.set)
-    scrollbarFXFrame.config(command = FXListBox.yview)
+    FXListBox.set_filter(fxGroupIndex.get(selection.lower(), []))
 
 
 def GenFX(lim):
@@ -406,66 +631,205 @@ def InitializeFXState(currFX):
         fx = {'onoff' : None, 'label': None, 'slot': x + 1, 'effect': None, 'name' : None}
         x = x + 1
 
+def syncPedal(transport):
+    # what 'zoomzt2_shooking.py -R -w my_pedal.zt2' does, in the current
+    # directory, over the editor's transport behind any edits
+    from zoomzt2_shooking import zoomzt2
+    from zoomdevice import IdentityCache
+    from zoomdataset import DatasetStore
+    from zoomtransport import BULK
+    pedal = zoomzt2()
+    pedal.transport = transport
+    pedal.priority = BULK
+    pedal.cache = IdentityCache()
+    pedal.datasets = DatasetStore()
+    try:
+        if not pedal.connect():
+            return False
+        try:
+            data = pedal.sync()
+        finally:
+            pedal.disconnect()
+        with open("my_pedal.zt2", "wb") as outfile:
+            outfile.write(data)
+    except IOError:
+        logging.exception("Syncing pedal")
+        return False
+    finally:
+        if pedal.metrics.requests():
+            pedal.metrics.dump("metrics.json")
+    return True
+
+
+def loadPedal(results):
+    # runs in the background: open the port, sync the pedal and load its
+    # files. Everything found is put on results for pollLoader, tkinter
+    # is only used from the GUI thread.
+    try:
+        import mido
+        from zoomdevice import find_ports
+        from zoompatch import CachedPort
+        from zoomauto import LockedPort
+        from zoomtransport import Transport, TransportPort, INTERACTIVE
+        results.put(("midi", None))
+        port = None
+        transport = None
+        for inName, outName in find_ports():
+            logging.info("%s, %s", inName, outName)
+            # drop messages which would not change the pedal's state,
+            # locked as the LFO sends from its own thread. The transport
+            # owns the port, edits go ahead of anything else queued on it.
+            transport = Transport(mido.open_input(inName), mido.open_output(outName), inName)
+            port = LockedPort(CachedPort(TransportPort(transport, INTERACTIVE)))
+            print("Using Input:", inName)
+            break
+        results.put(("ioport", port))
+
+        # populate the directory (we are in mypedal), the sync is queued
+        # on the transport at BULK so edits are not held up by it
+        if transport is None or not syncPedal(transport):
+            results.put(("error", ["Unable to sync the pedal",
+                "Try replugging pedal into Pi. Ensure you only have one Zoom connected."]))
+            return
+        results.put(("synced", None))
+        # OK so now we should have allpatches.json and allfx.json
+        if not(os.path.exists("allfx.json") and os.path.exists("allpatches.json")):
+            results.put(("error", ["Something wrong - expected to have created allfx.json and allpatches.json",
+                "Try replugging pedal into Pi. Ensure you only have one Zoom connected."]))
+            return
+
+        print("Loading Pedal")
+        with open('model.dat', 'r') as fxFile:
+            results.put(("model", json.loads(fxFile.read())))
+        print("Loading FXs")
+        with open('allfx.json', 'r') as fxFile:
+            theFX = json.loads(fxFile.read())
+        results.put(("fx", theFX))
+        print("Loading Patches")
+        with open('allpatches.json', 'r') as patchesFile:
+            thePatches = json.loads(patchesFile.read())
+        results.put(("patches", thePatches))
+
+        # similar patches, needs numpy
+        try:
+            from zoomsimilar import PatchMatrix
+            results.put(("similar", PatchMatrix(thePatches, theFX)))
+        except ImportError:
+            print("No numpy, similar patches disabled")
+        results.put(("done", None))
+    except Exception as e:
+        logging.exception("Loading pedal")
+        results.put(("error", ["Loading pedal failed: {}".format(e)]))
+
+
+def pollLoader():
+    try:
+        while True:
+            what, value = loaderResults.get_nowait()
+            loaderResult(what, value)
+    except queue.Empty:
+        pass
+    if not loaderDone:
+        win.after(50, pollLoader)
+
+
+def loaderResult(what, value):
+    global ioport, model, rawFX, rawPatches, fxPop, fxNameIndex, fxGrp, fxGroupIndex
+    global patchMatrix, setlist, setlistLabel, similarListBox, loaderDone, exitStatus
+    startupMark(what)
+    if what == "error":
+        for line in value:
+            print(line)
+        modelLabel.config(text = value[0])
+        loaderDone = True
+        exitStatus = 1
+    elif what == "synced":
+        modelLabel.config(text = "Loading pedal...")
+    elif what == "ioport":
+        ioport = value
+        print("ioport {}".format(ioport))
+        if ioport is not None:
+            buildFXSlots()
+            enableControls()
+    elif what == "model":
+        model = value
+        print(model)
+        # render the model etc
+        # {'model': 'G5n', 'numPatches': 200, 'bankSize': 4, 'ptcSize': 760, 'version': '3.00', 'gce3version': '1.20'}
+        modelLabel.config(text = "{} ver {} GCE Model {} ver. {} patches, {} per bank"
+            .format(model['model'], model['version'], model['gce3version'], model['numPatches'], model['bankSize']))
+        if setlistFile is not None:
+            from zoomsetlist import Setlist
+            setlist = Setlist.load(setlistFile, int(model['bankSize']))
+            setlistFrame = tk.Frame(textPatchLabelFrame)
+            setlistFrame.pack(side = TOP, anchor = "w")
+            tk.Button(setlistFrame, text = "<<", command = lambda: setlistStep(-1)).pack(side = LEFT)
+            tk.Button(setlistFrame, text = ">>", command = lambda: setlistStep(1)).pack(side = LEFT)
+            setlistLabel = tk.Label(setlistFrame, text = "Setlist: {} entries".format(len(setlist.entries)))
+            setlistLabel.pack(side = LEFT)
+            win.bind("<Next>", lambda event: setlistStep(1))
+            win.bind("<Prior>", lambda event: setlistStep(-1))
+    elif what == "fx":
+        rawFX = value
+        fxPop, fxNameIndex, fxGrp = populateFX()
+        avail_FXGrp.config(values = fxGrp)
+        # the FX of each group, so changing group is just a new view
+        fxGroupIndex = {}
+        for ri in range(len(fxPop)):
+            fxGroupIndex.setdefault(fxPop[ri]['groupname'].lower(), []).append(ri)
+        FXListBox.set_items([item['name'] for item in fxPop])
+        if len(fxGrp) > 1:
+            FXListBox.set_filter(fxGroupIndex[fxGrp[1].lower()])
+    elif what == "patches":
+        rawPatches = value
+        forgetPatchView()
+        patchListBox.set_items(populatePatches())
+    elif what == "similar":
+        patchMatrix = value
+        similarFrame = tk.LabelFrame(textPatchLabelFrame, text = "Similar")
+        similarFrame.pack(side = TOP, fill = X)
+        similarListBox = tk.Listbox(similarFrame, height = 5, exportselection = False)
+        similarListBox.pack(side = TOP, fill = X)
+        similarListBox.bind("<<ListboxSelect>>", userSelectedSimilar)
+    elif what == "done":
+        loaderDone = True
+        startupReport()
+
+
 currFX = GenFX(9)
 if __name__ == "__main__":
     
+    # setlist path is relative to where we were started
+    setlistFile = None
+    if len(sys.argv) > 1:
+        setlistFile = os.path.abspath(sys.argv[1])
+
     # change to it
     """
     os.chdir("mypedal")
     """
-    # remote directory mypedal
-    if os.path.exists("mypedal"):
-        shutil.rmtree("mypedal")
-    # create it, it will be 755
-    os.mkdir("mypedal")
+    # keep mypedal between runs, effects we already have come from the
+    # dataset store (see zoomdataset.py) rather than the pedal. Only clear
+    # the results so we can tell if the sync worked.
+    if not os.path.exists("mypedal"):
+        # create it, it will be 755
+        os.mkdir("mypedal")
     # change to it
     os.chdir("mypedal")
-    # populate the directory. Assumption is you run this from
-    # ZoomPedalFun/python directory
-    # we then create and move to subdirectory mypedal
-    # so the script is up one directory level
-    cmd = 'python ../zoomzt2_shooking.py -R -w my_pedal.zt2'
-    runCommand(cmd)
-    #"""
-    # OK so now we should have allpatches.json and allfx.json
-    if not(os.path.exists("allfx.json") and os.path.exists("allpatches.json")):
-        print("Something wrong - expected to have created allfx.json and allpatches.json")
-        print("Try replugging pedal into Pi. Ensure you only have one Zoom connected.")
-        sys.exit(1)
-
-    midiname = "ZOOM G"
-    for port in mido.get_input_names():
-        logging.info("{}, {}".format(port, midiname))
-        if port[:len(midiname)]==midiname:
-            ioport = mido.open_ioport(port)
-            print("Using Input:", port)
-            break
-    print("ioport {}".format(ioport))
-    
-    print("Loading Pedal")
-    with open('model.dat', 'r') as fxFile:
-        model=fxFile.read()
-    #model=json5.loads(model)
-    model=json.loads(model)
-    print(model)
-    print("Loading FXs")
-    with open('allfx.json', 'r') as fxFile:
-        dataFX=fxFile.read()
-    #rawFX=json5.loads(dataFX)
-    rawFX=json.loads(dataFX)
-
-    print("Loading Patches")
-    with open('allpatches.json', 'r') as patchesFile:
-        dataPatches=patchesFile.read()
-    #rawPatches=json5.loads(dataPatches)
-    rawPatches=json.loads(dataPatches)
-        # add device label at top of the screen
-
-    # render the model etc
-    # {'model': 'G5n', 'numPatches': 200, 'bankSize': 4, 'ptcSize': 760, 'version': '3.00', 'gce3version': '1.20'}
-    modelLabel = tk.Label(win, text="{} ver {} GCE Model {} ver. {} patches, {} per bank"
-            .format(model['model'], model['version'], model['gce3version'], model['numPatches'], model['bankSize']))
-
+    for name in ("allfx.json", "allpatches.json", "model.dat"):
+        if os.path.exists(name):
+            os.remove(name)
+    startupMark("imports")
+
+    # show the window first, the patch and FX lists are filled in by
+    # loaderResult as loadPedal gets them
+    win = Tk()
+    win.geometry("1800x900")
+    bigfont = font.Font(family="LucidaConsole", size = 20)
+    win.option_add("*Font", bigfont)
+
+    # add device label at top of the screen
+    modelLabel = tk.Label(win, text="Syncing pedal...")
     modelLabel.pack(side=TOP)
 
     patchLabel = tk.Label(win, text="Patch: {}\nDescription: {}".format("UNSET", ""))
@@ -479,18 +843,22 @@ if __name__ == "__main__":
     textPatchLabelFrame = tk.LabelFrame(patchAndFX, text = "Patches", bg="red", height = 400, width=350, highlightcolor="blue")
 
 
-    lbSelPatch = tk.StringVar()
-    patchListBox = tk.Listbox(textPatchLabelFrame, listvariable=lbSelPatch)
-    for item in populatePatches():
-        patchListBox.insert('end', item)
+    # only the visible rows are handed to tk, see zoomlistview.py
+    patchListBox = VirtualList(textPatchLabelFrame)
     patchListBox.pack(side = RIGHT, fill=BOTH)
-    scrollbarPatchFrame = tk.Scrollbar(textPatchLabelFrame, orient="vertical")
-    scrollbarPatchFrame.pack(side = RIGHT, fill=BOTH)
-
-    patchListBox.config(yscrollcommand = scrollbarPatchFrame.set)
-    scrollbarPatchFrame.config(command = patchListBox.yview)
     patchListBox.bind("<<ListboxSelect>>", userSelectedPatch)
 
+    # show patches whose name contains this
+    patchFilter = tk.StringVar()
+    patchFilter.trace_add("write", lambda *args: patchListBox.filter_text(patchFilter.get()))
+    patchFilterEntry = tk.Entry(textPatchLabelFrame, textvariable = patchFilter, width = 12)
+    patchFilterEntry.pack(side = TOP, anchor = "w")
+
+    # audition: move the edit buffer to the selected patch with FXM messages
+    audition = tk.BooleanVar(value = False)
+    auditionCheck = tk.Checkbutton(textPatchLabelFrame, text = "Audition", variable = audition)
+    auditionCheck.pack(side = TOP, anchor = "w")
+
     textPatchLabelFrame.pack(side=LEFT, fill=BOTH)
 
     mainParamLabelFrame = tk.LabelFrame(patchAndFX, text="Parameters", bg="green", height=400, width=900)
@@ -500,53 +868,48 @@ if __name__ == "__main__":
     fxLabelFrame = tk.LabelFrame(patchAndFX, text = "FX Group", height=400, width=350, highlightcolor="blue", bg="yellow")
     fxLabelFrame.pack(side=LEFT, fill=BOTH)
 
-    fxPop, fxNameIndex, fxGrp = populateFX()
-
     selectedFXGrp = tk.StringVar()
-    avail_FXGrp = ttk.Combobox(fxLabelFrame, width="20", values=fxGrp,
+    avail_FXGrp = ttk.Combobox(fxLabelFrame, width="20", values=[],
             textvariable=selectedFXGrp, state='readonly', exportselection=False)
     avail_FXGrp.pack(side = TOP, fill=BOTH)
     avail_FXGrp.bind("<<ComboboxSelected>>", avail_FXGrp_clicked)
 
-    selectedFX = tk.StringVar()
     fxLBFrame=tk.Frame(fxLabelFrame, height=350, width=350, highlightcolor="blue", bg="blue")
     fxLBFrame.pack(side=RIGHT, fill = BOTH)
-    FXListBox = tk.Listbox(fxLBFrame, listvariable=selectedFX, exportselection=False)
-    for item in fxPop:
-        if item['groupname'].lower() == (fxGrp[1]).lower():
-            FXListBox.insert('end', item['name'])
+    FXListBox = VirtualList(fxLBFrame)
     FXListBox.pack(side = RIGHT, fill = BOTH)
-    scrollbarFXFrame = tk.Scrollbar(fxLBFrame, orient="vertical")
-    scrollbarFXFrame.pack(side = RIGHT, fill = BOTH)
-
-    FXListBox.config(yscrollcommand = scrollbarFXFrame.set)
-    scrollbarFXFrame.config(command = FXListBox.yview)
     # add in command to take name and find fx values
     FXListBox.bind("<<ListboxSelect>>", userSelectedFX)
 
     avail_FX = FXListBox
+    win.update()
+    startupMark("first paint")
+
+    loader = threading.Thread(target = loadPedal, args = (loaderResults,), daemon = True)
+    loader.start()
 
     #pedalFX = [{'groupname': None, 'Filename' : None, 'FXID': None, 'GID': None, 'version': None}]
 
     buildCurrFXGUI(win, avail_FX, currFX)
 
-    # add in 9 Parameters for the N FX.
-    paramVal = [tk.IntVar() for x in range(9)]
-    params = []
-    for i in range(9):
-        # dont forget to bias the parameter by 1
-        pLF = tk.LabelFrame(mainParamLabelFrame, text="P{}".format(i+1), bg="green")
-        pLF.grid(row = int( i / 3), column = i % 3, sticky="w")
-        sl = ttk.Label(pLF, text="Param{}".format(i))
-        sl.grid(column= 0, row=0, sticky="w")
-        s = ttk.Scale(pLF, from_ = 0, to = 100, orient='horizontal',
-            variable=paramVal[i], 
-            command=lambda  arg1 = paramVal[i], arg2=i, arg3=ioport: param_slider_changed(arg1, arg2, arg3))
-        s.grid(row=0, column=1, sticky = "w")
-        scvl = ttk.Label(pLF, text="Value: ")
-        scvl.grid(row=1, column=0, sticky = "w")
-        scvlv = ttk.Label(pLF, text="10")
-        scvlv.grid(row=1, column=1, sticky="w")
-        params.append( [pLF, sl, s, scvlv] )
+    # the 9 Parameters for the N FX are made as they are shown, see
+    # paramFrame
+    # LFO on the last parameter moved, see zoomauto.py
+    lfoFrame = tk.Frame(mainParamLabelFrame, bg="green")
+    lfoFrame.grid(row = 3, column = 0, columnspan = 3, sticky="w")
+    lfoOn = tk.BooleanVar(value = False)
+    tk.Checkbutton(lfoFrame, text = "LFO", variable = lfoOn, command = toggleLfo).pack(side = LEFT)
+    lfoRate = tk.StringVar(value = "0.5")
+    tk.Spinbox(lfoFrame, from_ = 0.1, to = 10, increment = 0.1, width = 5, textvariable = lfoRate).pack(side = LEFT)
+    tk.Label(lfoFrame, text = "Hz", bg="green").pack(side = LEFT)
+    startupMark("widgets")
+    win.after(50, pollLoader)
     # main()
     win.mainloop()
+    if automation is not None:
+        automation.stop()
+    if ioport is not None:
+        print("MIDI out {}".format(ioport.stats()))
+        print("Transport {}".format(ioport.transport.stats()))
+        ioport.close()
+    sys.exit(exitStatus)
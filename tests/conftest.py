@@ -0,0 +1,60 @@
+# the modules live at the top of the repo, next to the scripts
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+
+CORPUS = os.path.join(ROOT, "B1XFour", "DerivedData")
+
+
+@pytest.fixture
+def emulator():
+    # an emulated B1X Four with the bundled effects and patches
+    from zoomemu import ZoomEmulator
+    def make(**kwargs):
+        return ZoomEmulator.from_corpus(os.path.join(CORPUS, "2.00"), os.path.join(CORPUS, "Patches"), **kwargs)
+    return make
+
+
+@pytest.fixture
+def small_emulator():
+    # an emulated B1X Four with a few of the bundled effects, all listed,
+    # and a few patches, for tests which transfer everything
+    from zoomemu import ZoomEmulator
+    from zoomzt2_shooking import zoomzt2, ZT2, ZD2
+    def make(effects = 3, patches = 5, **kwargs):
+        codec = zoomzt2()
+        files = {}
+        flst = ZT2.build([dict(name = "FLST_SEQ"), []])
+        for name in sorted(glob.glob(os.path.join(CORPUS, "2.00", "*.ZD2")))[:effects]:
+            with open(name, "rb") as binfile:
+                data = binfile.read()
+            binconfig = ZD2.parse(data)
+            files[os.path.basename(name)] = data
+            flst = codec.add_effect(flst, os.path.basename(name), binconfig['version'], binconfig['id'])
+        files["FLST_SEQ.ZT2"] = bytes(flst)
+        kwargs.setdefault('numPatches', patches)
+        return ZoomEmulator(files, dict((location, bytes([location + 1]) * 760)
+            for location in range(patches)), **kwargs)
+    return make
+
+
+@pytest.fixture
+def pedal(tmp_path):
+    # a zoomzt2 connected to emulator, writing its files to tmp_path
+    from zoomzt2_shooking import zoomzt2
+    pedals = []
+    def connect(emulator):
+        pedal = zoomzt2(outdir = str(tmp_path))
+        pedal.backend = emulator
+        assert pedal.connect()
+        pedals.append(pedal)
+        return pedal
+    yield connect
+    for pedal in pedals:
+        if pedal.outport is not None:
+            pedal.disconnect()
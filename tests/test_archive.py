@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from zoomarchive import ZoomArchive, write_archive, pack, unpack, update, ZLIB
+
+MEMBERS = [("a.ZD2", b"\x00\x01" * 1000), ("a.ZD2.json", b'{"a": 1}'), ("empty", b"")]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_pack_unpack(tmp_path, compress):
+    source = tmp_path / "source"
+    source.mkdir()
+    for name, data in MEMBERS:
+        (source / name).write_bytes(data)
+    name = str(tmp_path / "test.zarc")
+    assert pack(str(source), name, compress = compress) == len(MEMBERS)
+    with ZoomArchive(name) as archive:
+        assert archive.names() == sorted(member for member, data in MEMBERS)
+        assert archive.verify() == []
+        assert bool(archive.info("a.ZD2")[2] & ZLIB) == compress
+    assert unpack(name, str(tmp_path / "out")) == len(MEMBERS)
+    for member, data in MEMBERS:
+        assert (tmp_path / "out" / member).read_bytes() == data
+
+
+def test_update_keeps_compression(tmp_path):
+    name = str(tmp_path / "test.zarc")
+    write_archive(name, MEMBERS, compress = True)
+    update(name, add = {"b.ZD2": b"new", "empty": b"now not"}, remove = ["a.ZD2.json"])
+    with ZoomArchive(name) as archive:
+        assert archive.names() == ["a.ZD2", "b.ZD2", "empty"]
+        assert archive.read("a.ZD2") == MEMBERS[0][1]
+        assert archive.read("empty") == b"now not"
+        # members which do not get smaller are stored as they are
+        assert archive.info("a.ZD2")[2] & ZLIB
+
+
+@pytest.mark.parametrize("member", ["../escape", "sub/file", "/tmp/abs", "..", ""])
+def test_unpack_rejects_paths(tmp_path, member):
+    name = str(tmp_path / "bad.zarc")
+    write_archive(name, [("ok", b"fine"), (member, b"escaped")])
+    out = tmp_path / "out" / "deeper"
+    with pytest.raises(ValueError):
+        unpack(name, str(out))
+    assert not (tmp_path / "out" / "escape").exists()
+    assert os.listdir(str(out)) == []
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_verify_finds_corrupt_member(tmp_path, compress):
+    name = str(tmp_path / "test.zarc")
+    write_archive(name, MEMBERS, compress = compress)
+    with ZoomArchive(name) as archive:
+        offset, length, flags, crc = archive.info("a.ZD2")
+    with open(name, "r+b") as outfile:
+        outfile.seek(offset + length // 2)
+        outfile.write(b"\xff\xff")
+    with ZoomArchive(name) as archive:
+        assert archive.verify() == ["a.ZD2"]
+
+
+def test_failed_write_leaves_no_temporary(tmp_path, monkeypatch):
+    name = str(tmp_path / "test.zarc")
+    write_archive(name, MEMBERS)
+    def replace(source, target):
+        raise KeyboardInterrupt()
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(KeyboardInterrupt):
+        write_archive(name, MEMBERS[:1])
+    monkeypatch.undo()
+    assert os.listdir(str(tmp_path)) == ["test.zarc"]
+    with ZoomArchive(name) as archive:
+        assert archive.read("a.ZD2") == MEMBERS[0][1]
@@ -0,0 +1,141 @@
+import threading
+
+import mido
+import pytest
+
+import zoomauto
+from zoomauto import Automation, Lane, Lfo, Ramp, Steps, LockedPort
+from zoompatch import CachedPort, fxm_decode
+
+
+class Clock(object):
+    # stands in for perf_counter and sleep. Each reading moves time on a
+    # little, as spinning would, and sleeps overshoot by oversleep.
+    def __init__(self, oversleep = 0.0):
+        self.now = 100.0
+        self.oversleep = oversleep
+        self.late = {}
+
+    def perf_counter(self):
+        self.now = self.now + 0.00001
+        return self.now
+
+    def sleep(self, seconds):
+        self.now = self.now + seconds + self.oversleep + self.late.pop(0, 0.0)
+
+
+class Port(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(fxm_decode(msg))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(zoomauto, "perf_counter", clock.perf_counter)
+    monkeypatch.setattr(zoomauto, "sleep", clock.sleep)
+    return clock
+
+
+@pytest.mark.parametrize("shape, table", [
+    ("sine", [0, 50, 100, 50]),
+    ("triangle", [0, 50, 100, 50]),
+    ("square", [100, 100, 0, 0]),
+    ("saw", [0, 25, 50, 75]),
+])
+def test_lfo_table(shape, table):
+    lane = Lane(1, 1, Lfo(shape, 1.0), 0, 100)
+    lane.prepare(0.25)
+    assert lane.table == table
+    assert lane.at(5) == table[1]
+    assert set(lane.messages) == set(table)
+
+
+def test_lfo_unknown_shape():
+    with pytest.raises(ValueError):
+        Lfo("noise")
+
+
+def test_ramp_table_holds_the_end():
+    lane = Lane(1, 1, Ramp(0.0, 1.0, 1.0), 0, 100)
+    lane.prepare(0.25)
+    assert lane.table == [0, 25, 50, 75, 100]
+    assert not lane.loop
+    assert lane.at(100) == 100
+
+
+def test_steps_table():
+    # two steps a beat at 120bpm, a quarter of a second each
+    lane = Lane(2, 3, Steps([10, 20, 30], 120.0, 2), 0, 1)
+    lane.prepare(0.25)
+    assert lane.table == [10, 20, 30]
+    assert fxm_decode(lane.messages[20]) == (1, 4, (20, 0, 0, 0, 0))
+
+
+def test_budget_limits_sends(clock):
+    # a value change every tick, at 100 ticks a second, 10 messages a second allowed
+    port = Port()
+    auto = Automation(port, tick = 0.01, budget = 10.0)
+    auto.add(Lane(1, 1, Lfo("saw", 1.0), 0, 100))
+    auto.run(2.0)
+    stats = auto.stats()
+    assert stats['ticks'] == 201
+    assert stats['sent'] == len(port.sent)
+    # the burst allowance, then the budget
+    assert 18 <= stats['sent'] <= 2.0 * 10 + 2
+    assert stats['deferred'] > 0
+    assert stats['missed'] == 0
+
+
+def test_unchanged_values_are_not_sent(clock):
+    port = Port()
+    auto = Automation(port, tick = 0.01, budget = 1000.0)
+    auto.add(Lane(1, 1, Lfo("square", 1.0), 0, 100))
+    auto.run(2.0)
+    # the tick at 2.0s is played too
+    assert [value[0] for slot, kind, value in port.sent] == [100, 0, 100, 0, 100]
+
+
+def test_jitter_stats(clock):
+    # every sleep wakes 2ms late, the last 1ms of each wait is spun
+    clock.oversleep = 0.002
+    auto = Automation(Port(), tick = 0.01, spin = 0.001)
+    auto.add(Lane(1, 1, Lfo("sine", 1.0), 0, 100))
+    auto.run(1.0)
+    stats = auto.stats()
+    assert stats['jitter_p50_ms'] == pytest.approx(1.0, abs = 0.1)
+    assert stats['jitter_max_ms'] < 1.5
+    assert stats['missed'] == 0
+
+
+def test_late_ticks_are_missed(clock):
+    # one sleep 55ms late, the curve skips to where it should be
+    clock.late[0] = 0.055
+    auto = Automation(Port(), tick = 0.01, spin = 0.001)
+    auto.add(Lane(1, 1, Lfo("sine", 1.0), 0, 100))
+    auto.run(1.0)
+    assert auto.stats()['missed'] == 5
+
+
+def test_locked_port_locks_the_cache():
+    # the GUI seeds the cache while the automation thread sends, both
+    # must hold the lock
+    lock = threading.RLock()
+    cache = CachedPort(Port())
+    port = LockedPort(cache, lock)
+    owned = []
+    class Probe(object):
+        def send(self, msg):
+            owned.append(("send", lock._is_owned()))
+    def seed(patch):
+        owned.append(("seed", lock._is_owned()))
+    cache.port = Probe()
+    cache.seed = seed
+    port.seed({})
+    port.send(mido.Message('program_change'))
+    assert owned == [("seed", True), ("send", True)]
+    assert not lock._is_owned()
+    assert port.stats()['sent'] == 1
@@ -0,0 +1,47 @@
+import os
+import shutil
+from optparse import OptionParser
+
+import pytest
+
+from conftest import CORPUS
+from zoomsnapshot import listed_effects
+from zoomzt2_shooking import Batch
+
+SOURCE = os.path.join(CORPUS, "2.00")
+
+
+def installed(emu):
+    # the effects FLST_SEQ lists, and the effect files on the pedal
+    return sorted(listed_effects(emu.files["FLST_SEQ.ZT2"])), \
+        sorted(name for name in emu.files if name.endswith(".ZD2"))
+
+
+def test_batch_sends_flst_when_a_line_fails(emulator, pedal, tmp_path):
+    emu = emulator()
+    zoom = pedal(emu)
+    new = str(tmp_path / "TESTFX.ZD2")
+    shutil.copy(os.path.join(SOURCE, "160_COMP.ZD2"), new)
+    batch = Batch(zoom)
+    with pytest.raises(IOError):
+        batch.run(["uninstall 160_COMP.ZD2", "install {}".format(new), "getfile NOSUCH.ZD2",
+            "uninstall AC370_1U.ZD2"])
+    listed, files = installed(emu)
+    assert listed == files
+    assert "TESTFX.ZD2" in listed and "160_COMP.ZD2" not in listed
+    assert "AC370_1U.ZD2" in listed
+
+
+def test_batch_bad_options_line(emulator, pedal):
+    emu = emulator()
+    zoom = pedal(emu)
+    parser = OptionParser()
+    parser.add_option("-A", "--add", dest="add")
+    parser.add_option("-v", "--ver", dest="ver")
+    parser.add_option("-i", "--id", dest="id")
+    parser.add_option("-D", "--delete", dest="delete")
+    batch = Batch(zoom, parser)
+    with pytest.raises(ValueError):
+        batch.run(["-D AC370_1U.ZD2", "-D 160_COMP.ZD2 --nosuch"])
+    # the first line's change was still sent
+    assert "AC370_1U.ZD2" not in listed_effects(emu.files["FLST_SEQ.ZT2"])
@@ -0,0 +1,76 @@
+import pytest
+
+
+def test_connect_reads_profile(emulator, pedal, tmp_path):
+    zoom = pedal(emulator())
+    assert zoom.model == "B1X Four"
+    assert zoom.bankSize == 10
+    assert (tmp_path / "model.dat").exists()
+
+
+def test_getfile_missing(emulator, pedal):
+    # an error for the caller, the session carries on
+    zoom = pedal(emulator())
+    with pytest.raises(IOError):
+        zoom.getfile("NOSUCH.ZD2")
+    assert zoom.file_check("FLST_SEQ.ZT2")
+
+
+class Recorder(object):
+    # the emulator's ports, with what is sent to it noted
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.sent = []
+
+    def ports(self):
+        inport, outport = self.emulator.ports()
+        recorder = self
+        class Output(object):
+            def send(self, msg):
+                recorder.sent.append(list(msg.data[:4]))
+                outport.send(msg)
+        return inport, Output()
+
+
+def test_connect_handshake_order(emulator, pedal):
+    # 6e 50 first, then the identity, as it always has been
+    recorder = Recorder(emulator())
+    zoom = pedal(recorder)
+    assert recorder.sent[:2] == [[0x52, 0x00, 0x6e, 0x50], [0x7e, 0x00, 0x06, 0x01]]
+    assert zoom.model == "B1X Four"
+
+
+def test_connect_cached_still_sends_6e_50(emulator, pedal, tmp_path):
+    from zoomdevice import IdentityCache
+    recorder = Recorder(emulator())
+    zoom = pedal(recorder)
+    zoom.cache = IdentityCache(str(tmp_path / "identity.json"))
+    for n in range(2):
+        zoom.disconnect()
+        del recorder.sent[:]
+        zoom.connect()
+    assert zoom.metrics.counters["identity_cached"] == 1
+    assert recorder.sent[:2] == [[0x52, 0x00, 0x6e, 0x50], [0x7e, 0x00, 0x06, 0x01]]
+    assert [0x52, 0x00, 0x6e, 0x44] not in recorder.sent
+
+
+def test_profile_behind_gce3():
+    from zoomdevice import profile
+    assert profile(0x11)['maxFX'] == 5
+    assert profile(0x11, gce3 = True)['maxFX'] == 0
+    assert profile(0x0f, gce3 = True) == profile(0x0f)
+    assert 'fixedVersion' not in profile(0x10)
+
+
+def test_identity_behind_gce3_not_cached(tmp_path):
+    # the same GCE-3 identity whichever pedal is plugged into it
+    from zoomdevice import IdentityCache, GCE3
+    name = tmp_path / "identity.json"
+    cache = IdentityCache(str(name))
+    gce3 = [0x7e, 0x00, 0x06, 0x02, 0x52, 0x6e, 0x00, GCE3, 0x00, 0x31, 0x2e, 0x32, 0x30]
+    cache.put("port", gce3, {'model': "B1X Four"})
+    assert cache.get("port", gce3) is None
+    assert not name.exists()
+    pedal = gce3[:7] + [0x0f] + gce3[8:]
+    cache.put("port", pedal, {'model': "B1X Four"})
+    assert cache.get("port", pedal) == {'model': "B1X Four"}
@@ -0,0 +1,106 @@
+import glob
+import os
+import shutil
+
+import zoomdataset
+from conftest import CORPUS
+from zoomdataset import DatasetStore
+from zoomzt2_shooking import zoomzt2, ZT2, ZD2
+
+SOURCE = os.path.join(CORPUS, "2.00")
+EFFECTS = sorted(os.path.basename(name) for name in glob.glob(os.path.join(SOURCE, "*.ZD2")))
+
+
+def sync_dir(tmp_path, listed):
+    # a directory as -R leaves it: every effect of the corpus, FLST_SEQ
+    # listing only some, a patch and things which are not the pedal's
+    dirname = tmp_path / "mypedal"
+    dirname.mkdir()
+    codec = zoomzt2()
+    flst = ZT2.build([dict(name = "FLST_SEQ"), []])
+    for name in EFFECTS:
+        for member in glob.glob(os.path.join(SOURCE, name + "*")):
+            shutil.copy(member, str(dirname))
+        if name in listed:
+            with open(os.path.join(SOURCE, name), "rb") as infile:
+                binconfig = ZD2.parse(infile.read())
+            flst = codec.add_effect(flst, name, binconfig['version'], binconfig['id'])
+    (dirname / "FLST_SEQ.ZT2").write_bytes(bytes(flst))
+    (dirname / "patch_0").write_bytes(b"\x01" * 760)
+    (dirname / "model.dat").write_text('{"model": "B1X Four"}')
+    (dirname / "midi.log").write_text("left over")
+    (dirname / "notes.txt").write_text("not the pedal's")
+    return str(dirname)
+
+
+def members(dirname, effects):
+    return sorted(["FLST_SEQ.ZT2", "model.dat", "patch_0"] + [os.path.basename(name)
+        for effect in effects for name in glob.glob(os.path.join(dirname, effect + "*"))])
+
+
+def test_add_keeps_listed_effects(tmp_path):
+    dirname = sync_dir(tmp_path, EFFECTS[:3])
+    store = DatasetStore(str(tmp_path / "store"))
+    assert store.add("B1X Four", "2.00", dirname)[0] == len(members(dirname, EFFECTS[:3]))
+    dataset = store.open("B1X Four", "2.00")
+    assert dataset.names() == members(dirname, EFFECTS[:3])
+    assert dataset.read("patch_0") == b"\x01" * 760
+    assert dataset.manifest['state'] == {"model": "B1X Four"}
+    store.close()
+
+
+def test_add_collects_unused(tmp_path):
+    dirname = sync_dir(tmp_path, EFFECTS[:3])
+    store = DatasetStore(str(tmp_path / "store"))
+    store.add("B1X Four", "2.00", dirname)
+    before = len(store.objects())
+
+    # synced again with one effect fewer and the patch changed, as sync
+    # gives it the FLST_SEQ it downloaded
+    flst = zoomzt2().remove_effect(store.open("B1X Four", "2.00").read("FLST_SEQ.ZT2"), EFFECTS[0])
+    os.unlink(os.path.join(dirname, "FLST_SEQ.ZT2"))
+    (tmp_path / "mypedal" / "patch_0").write_bytes(b"\x02" * 760)
+    store.add("B1X Four", "2.00", dirname, flst = flst)
+    dataset = store.open("B1X Four", "2.00")
+    assert dataset.names() == members(dirname, EFFECTS[1:3])
+    assert dataset.read("FLST_SEQ.ZT2") == flst
+    assert set(store.objects().names()) == set(dataset.members.values())
+    assert len(store.objects()) < before
+    store.close()
+
+
+def test_add_keeps_only_the_patches_written(tmp_path):
+    # patch_1 left from syncing a pedal with more patches
+    dirname = sync_dir(tmp_path, EFFECTS[:1])
+    (tmp_path / "mypedal" / "patch_1").write_bytes(b"\x03" * 760)
+    store = DatasetStore(str(tmp_path / "store"))
+    store.add("B1X Four", "2.00", dirname, patches = ["patch_0"])
+    dataset = store.open("B1X Four", "2.00")
+    assert "patch_0" in dataset and "patch_1" not in dataset
+    store.close()
+
+
+def test_add_rewrites_objects_once(tmp_path, monkeypatch):
+    dirname = sync_dir(tmp_path, EFFECTS[:3])
+    store = DatasetStore(str(tmp_path / "store"))
+    store.add("B1X Four", "2.00", dirname)
+    store.add("B1X Four", "1.00", dirname)
+    updates = []
+    def counted(name, add = None, remove = ()):
+        updates.append((sorted(add or {}), sorted(remove)))
+        return update(name, add, remove)
+    update = zoomdataset.update
+    monkeypatch.setattr(zoomdataset, "update", counted)
+
+    # the old patch goes and the new one comes in together, the 1.00
+    # dataset still uses the old one
+    (tmp_path / "mypedal" / "patch_0").write_bytes(b"\x02" * 760)
+    store.add("B1X Four", "2.00", dirname)
+    assert len(updates) == 1 and updates[0][1] == []
+    store.add("B1X Four", "1.00", dirname)
+    assert len(updates) == 2 and updates[1][0] == [] and len(updates[1][1]) == 1
+    assert set(store.objects().names()) == set(store.open("B1X Four", "1.00").members.values())
+    # nothing changed, nothing written
+    store.add("B1X Four", "1.00", dirname)
+    assert len(updates) == 2
+    store.close()
@@ -0,0 +1,66 @@
+import copy
+import os
+
+import pytest
+
+from conftest import CORPUS
+from zoomdb import PatchDB
+from zoomdecode import load_catalog, find_dumps, start_worker, decode_file
+
+TABLES = ("effects", "parameters", "patches", "patch_slots", "patch_values")
+
+
+@pytest.fixture(scope = "module")
+def library():
+    # the bundled effects and patches, decoded as allfx/allpatches.json
+    total_pedal = load_catalog(os.path.join(CORPUS, "2.00"))
+    start_worker(total_pedal, 760, 10)
+    patches = []
+    for name in find_dumps([os.path.join(CORPUS, "Patches")]):
+        name, decoded, error = decode_file(name)
+        patches.extend(patch for patch in decoded if patch['location'] is not None)
+    assert patches
+    return total_pedal, patches
+
+
+def dump(db):
+    return dict((table, sorted(db.query("SELECT * FROM {}".format(table)), key = repr))
+        for table in TABLES)
+
+
+def test_export_is_idempotent(library, tmp_path):
+    total_pedal, patches = library
+    db = PatchDB(str(tmp_path / "zoom.db"))
+    try:
+        # the corpus has two dumps of some locations, the last is kept
+        locations = set(patch['location'] for patch in patches)
+        assert db.export(total_pedal, patches) == (len(locations), 0)
+        before = dump(db)
+        assert db.export(total_pedal, patches) == (0, 0)
+        assert dump(db) == before
+    finally:
+        db.close()
+
+
+def test_export_only_rewrites_changes(library, tmp_path):
+    total_pedal, patches = library
+    name = str(tmp_path / "zoom.db")
+    db = PatchDB(name)
+    db.export(total_pedal, patches)
+    db.close()
+
+    # one patch per location, less the first, with one renamed
+    latest = dict((patch['location'], patch) for patch in patches)
+    locations = sorted(latest)
+    changed = [copy.deepcopy(latest[location]) for location in locations[1:]]
+    changed[0]['patchname'] = "RENAMED"
+    db = PatchDB(name)
+    try:
+        assert db.export(total_pedal, changed) == (1, 1)
+        assert db.query("SELECT name FROM patches WHERE location = ?",
+            (changed[0]['location'],)) == [("RENAMED",)]
+        assert db.query("SELECT COUNT(*) FROM patches") == [(len(changed),)]
+        assert db.query("SELECT COUNT(*) FROM patch_slots WHERE location = ?",
+            (locations[0],)) == [(0,)]
+    finally:
+        db.close()
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from zoomflow import FlowSettings, SAFE
+
+DATA = bytes(range(256)) * 20
+
+
+def upload(pedal, name, data):
+    pedal.file_check(name)
+    pedal.file_upload(name, data)
+    pedal.file_close()
+
+
+def test_fixed_flow_ignores_status(emulator, pedal):
+    # the safe path never looked at the status, nor does it now
+    emu = emulator(maxBlock = 256)
+    zoom = pedal(emu)
+    upload(zoom, "TEST.ZD2", DATA)
+    assert emu.files["TEST.ZD2"] == DATA
+    assert zoom.flows["upload"].settings() == SAFE
+
+
+def test_adaptive_flow_uploads(emulator, pedal, tmp_path):
+    # with no latency a bigger window need not be faster, nor settle on one
+    emu = emulator(latency = 0.002)
+    zoom = pedal(emu)
+    zoom.flowSettings = FlowSettings(str(tmp_path / "flow.json"))
+    for n in range(3):
+        upload(zoom, "TEST{}.ZD2".format(n), DATA)
+        assert emu.files["TEST{}.ZD2".format(n)] == DATA
+    assert zoom.flows["upload"].window > SAFE['window']
+    assert os.path.exists(str(tmp_path / "flow.json"))
+
+
+def test_adaptive_flow_refused(emulator, pedal, tmp_path):
+    # blocks the pedal refuses are sent again at the safe size
+    settings = FlowSettings(str(tmp_path / "flow.json"))
+    settings.load()["B1X Four"] = {"upload": {"block": 1024, "window": 2}}
+    emu = emulator(maxBlock = 512)
+    zoom = pedal(emu)
+    zoom.flowSettings = settings
+    upload(zoom, "TEST.ZD2", DATA)
+    assert emu.files["TEST.ZD2"] == DATA
+    flow = zoom.flows["upload"]
+    assert flow.failed and flow.is_safe()
+    assert flow.maxBlock == 512
+    assert zoom.metrics.counters["flow_errors"] == 1
+
+
+def test_adaptive_flow_refused_safe(emulator, pedal, tmp_path):
+    # refused at the safe size too, give up rather than loop
+    emu = emulator(maxBlock = 256)
+    zoom = pedal(emu)
+    zoom.flowSettings = FlowSettings(str(tmp_path / "flow.json"))
+    with pytest.raises(IOError):
+        upload(zoom, "TEST.ZD2", DATA)
+
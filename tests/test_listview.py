@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip("tkinter")
+
+from zoomlistview import ListModel
+
+NAMES = ["Comp", "OptComp", "Slow Attack", "ZNR", "NoiseGate", "DirtyGate",
+    "GrayComp", "160 Comp", "Chorus", "Delay"]
+
+
+def model(height = 3):
+    list_model = ListModel(height)
+    list_model.set_items(NAMES)
+    return list_model
+
+
+def test_filter_text_narrows():
+    list_model = model()
+    list_model.filter_text("comp")
+    assert list(list_model.view) == [0, 1, 6, 7]
+    # adding to the text only looks at what is shown
+    list_model.filter_text("compx")
+    assert list(list_model.view) == []
+    list_model.filter_text("GATE")
+    assert list(list_model.view) == [4, 5]
+    list_model.filter_text("")
+    assert list_model.view == range(len(NAMES))
+
+
+def test_filter_text_within_group():
+    list_model = model()
+    list_model.set_filter([0, 1, 2, 3])
+    list_model.filter_text("comp")
+    assert list_model.view == [0, 1]
+    list_model.filter_text("")
+    assert list_model.view == [0, 1, 2, 3]
+
+
+def test_position():
+    list_model = model()
+    list_model.set_filter(range(3, 8))
+    assert list_model.position(3) == 0
+    assert list_model.position(7) == 4
+    assert list_model.position(8) is None
+    list_model.set_filter([1, 4, 6])
+    assert list_model.position(4) == 1
+    assert list_model.position(5) is None
+    assert list_model.position(9) is None
+    assert list_model.item(2) == 6
+
+
+def test_scroll_is_clamped():
+    list_model = model()
+    list_model.scroll_to(100)
+    assert list_model.top == len(NAMES) - 3
+    list_model.scroll_to(-5)
+    assert list_model.top == 0
+    list_model.see(5)
+    assert list_model.top == 3
+    list_model.see(4)
+    assert list_model.top == 3
+    list_model.see(1)
+    assert list_model.top == 1
+    assert [pos for pos, name in list_model.visible()] == [1, 2, 3]
+    # fewer rows than fit
+    list_model.set_filter([2, 5])
+    list_model.scroll_to(3)
+    assert list_model.top == 0
+
+
+def test_select_item_drops_the_filter():
+    list_model = model()
+    list_model.set_filter([0, 1, 2])
+    list_model.select_item(1)
+    assert list_model.view == [0, 1, 2]
+    list_model.filter_text("gate")
+    list_model.select_item(9)
+    assert list_model.view == range(len(NAMES))
+    assert list_model.group is None and list_model.text == ""
+    assert list_model.selected == 9
+    assert list_model.top == len(NAMES) - 3
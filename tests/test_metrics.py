@@ -0,0 +1,26 @@
+from zoommetrics import Metrics, LATENCY_SAMPLES
+
+
+def test_latency_sample_is_capped():
+    metrics = Metrics()
+    for n in range(3 * LATENCY_SAMPLES):
+        metrics.request([0x52, 0x00, 0x6e, 0x60, 0x24], None, n / 1000.0)
+    op = metrics.opcodes["60 24"]
+    assert len(op['latency']) == LATENCY_SAMPLES
+    report = metrics.report()['opcodes']["60 24"]
+    assert report['count'] == 3 * LATENCY_SAMPLES
+    assert report['max_ms'] == (3 * LATENCY_SAMPLES - 1)
+    assert abs(report['total_ms'] - sum(range(3 * LATENCY_SAMPLES))) < 1e-6
+
+
+def test_window_latency_is_per_request(emulator, pedal):
+    # each reply is timed from its own request, as for a single round trip
+    emu = emulator(latency = 0.002)
+    zoom = pedal(emu)
+    zoom.file_list()
+    zoom.file_upload("TEST.ZD2", bytes(range(256)) * 20)
+    zoom.file_close()
+    report = zoom.metrics.report()['opcodes']
+    for name in ("60 26", "60 23"):
+        assert report[name]['p50_ms'] >= 2
+        assert report[name]['p50_ms'] < 2 * report["60 05"]['p50_ms'] + 2
@@ -0,0 +1,87 @@
+import copy
+
+import mido
+
+from zoompatch import patch_diff, CachedPort, fxm_id_data, fxm_onoff_data, fxm_pn_data
+
+
+def fx(fxid, values, defaults = None, numSlots = 1, enabled = True):
+    defaults = defaults or [0] * len(values)
+    return {'fxid': fxid, 'gid': 1, 'numSlots': numSlots, 'enabled': enabled, 'name': "FX{}".format(fxid),
+        'Parameters': [{"param{}".format(q + 1): v, 'mdefault': d}
+            for q, (v, d) in enumerate(zip(values, defaults))]}
+
+
+def patch(*fxs):
+    return {'patchname': "test", 'FX': list(fxs)}
+
+
+class Port(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(list(msg.data))
+
+
+def apply(current, target):
+    # send the diff through a CachedPort seeded with current
+    port = Port()
+    cached = CachedPort(port)
+    cached.seed(current)
+    messages = patch_diff(current, target)
+    for data in messages:
+        cached.send(mido.Message('sysex', data = data))
+    return messages, port.sent, cached
+
+
+def test_same_patch_sends_nothing():
+    current = patch(fx(1, [1, 2]), fx(2, [3]))
+    assert patch_diff(current, copy.deepcopy(current)) == []
+
+
+def test_changed_param_and_onoff():
+    current = patch(fx(1, [1, 2]), fx(2, [3]))
+    target = patch(fx(1, [1, 5], enabled = False), fx(2, [3]))
+    assert patch_diff(current, target) == [fxm_onoff_data(1, 0), fxm_pn_data(1, 2, 5)]
+
+
+def test_new_fx_starts_from_defaults():
+    current = patch(fx(1, [1, 2]))
+    target = patch(fx(3, [4, 7], defaults = [4, 0]))
+    assert patch_diff(current, target) == [fxm_id_data(1, 3, 1), fxm_onoff_data(1, 1), fxm_pn_data(1, 2, 7)]
+
+
+def test_fx_after_new_id_sent_again():
+    # a wider FX in slot 1 may have moved slots 2 and 3
+    current = patch(fx(1, [1]), fx(2, [2]), fx(3, [3]))
+    target = patch(fx(4, [0], numSlots = 2), fx(3, [3]))
+    messages = patch_diff(current, target)
+    assert messages == [fxm_id_data(1, 4, 1), fxm_onoff_data(1, 1),
+        fxm_id_data(3, 3, 1), fxm_onoff_data(3, 1), fxm_pn_data(3, 1, 3)]
+
+
+def test_shorter_patch_clears_rest():
+    current = patch(fx(1, [1]), fx(2, [2]))
+    target = patch(fx(1, [1]))
+    assert patch_diff(current, target) == [fxm_id_data(2, 0, 0)]
+
+
+def test_cached_port_agrees_with_diff():
+    # nothing patch_diff thinks is needed is dropped, and the cache ends
+    # up believing only what the target holds
+    current = patch(fx(1, [1, 2]), fx(2, [3, 4]), fx(5, [6]))
+    for target in (patch(fx(1, [1, 9]), fx(2, [3, 4]), fx(5, [6])),
+            patch(fx(7, [1, 2]), fx(2, [3, 4]), fx(5, [6])),
+            patch(fx(1, [1, 2]), fx(8, [3, 4], numSlots = 2)),
+            patch(fx(1, [1, 2]))):
+        messages, sent, cached = apply(current, target)
+        assert sent == messages
+        expected = CachedPort(Port())
+        expected.seed(target)
+        for key, value in cached.state.items():
+            if key not in expected.state:
+                # a slot past the end of the target, cleared
+                assert key[1] == 1 and value == tuple(fxm_id_data(1, 0, 0)[8:13])
+                continue
+            assert expected.state[key] == value
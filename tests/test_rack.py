@@ -0,0 +1,52 @@
+import os
+
+from zoomarchive import ZoomArchive
+from zoomrack import DeviceManager, Device, job_snapshot, job_send, SNAPSHOT_NAME
+
+
+class Unplugged(object):
+    # a pedal which has gone away
+    def ports(self):
+        return None, None
+
+
+def device(tmp_path, name, backend):
+    return Device((name, name), str(tmp_path / name), backend)
+
+
+def test_jobs_report_per_device(small_emulator, tmp_path):
+    first = small_emulator(latency = 0.001)
+    # the pedals differ
+    second = small_emulator(effects = 2, patches = 3, latency = 0.001)
+    devices = [device(tmp_path, "first", first), device(tmp_path, "second", second),
+        device(tmp_path, "gone", Unplugged())]
+    rack = DeviceManager(str(tmp_path), devices = devices)
+    failed = rack.run(job_snapshot)
+    assert failed == [devices[2]]
+    assert isinstance(devices[2].error, IOError)
+    assert devices[2].status.startswith("failed")
+    for dev, emu in zip(devices, (first, second)):
+        assert dev.error is None and dev.status == "done"
+        assert dev.bytes > 0
+        with ZoomArchive(os.path.join(dev.outdir, SNAPSHOT_NAME)) as archive:
+            manifest = archive.json("snapshot.json")
+        assert manifest['patches'] == sorted(emu.patches)
+        assert sorted(manifest['effects']) == sorted(f for f in emu.files if f.endswith(".ZD2"))
+        assert os.path.exists(os.path.join(dev.outdir, "metrics.json"))
+
+
+def test_failing_job_only_fails_its_device(small_emulator, tmp_path):
+    # the same FLST_SEQ to each, one pedal refuses even the safe blocks
+    good = small_emulator()
+    bad = small_emulator(maxBlock = 256)
+    flst = tmp_path / "FLST_SEQ.ZT2"
+    flst.write_bytes(small_emulator(effects = 1).files["FLST_SEQ.ZT2"])
+    devices = [device(tmp_path, "good", good), device(tmp_path, "bad", bad)]
+    rack = DeviceManager(str(tmp_path), devices = devices, adaptiveFlow = True)
+    rack.flowSettings.name = str(tmp_path / "flow.json")
+    failed = rack.run(job_send, str(flst))
+    assert failed == [devices[1]]
+    assert isinstance(devices[1].error, IOError)
+    assert devices[0].error is None and devices[0].status == "done"
+    assert good.files["FLST_SEQ.ZT2"] == flst.read_bytes()
+    assert bad.files.get("FLST_SEQ.ZT2") != flst.read_bytes()
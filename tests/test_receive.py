@@ -0,0 +1,67 @@
+from zoomtransport import Transport, BULK
+
+
+class PolledInput(object):
+    # the emulator's input as a mido port, which the pedal answers only
+    # once past the last file
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.ended = False
+
+    def poll(self):
+        while self.emulator.replies:
+            msg = self.emulator.receive()
+            if list(msg.data[:5]) == [0x52, 0x00, 0x6e, 0x60, 0x01]:
+                if self.ended:
+                    continue
+                self.ended = True
+            return msg
+        return None
+
+    def iter_pending(self):
+        msg = self.poll()
+        while msg is not None:
+            yield msg
+            msg = self.poll()
+
+    def receive(self):
+        return self.emulator.receive()
+
+
+def test_file_list_with_chatter(emulator, pedal):
+    emu = emulator(chatter = 3)
+    zoom = pedal(emu)
+    assert sorted(zoom.file_list()) == sorted(emu.files)
+    assert zoom.unsolicited
+
+
+def test_file_list_stops_at_end(emulator, pedal):
+    emu = emulator()
+    zoom = pedal(emu)
+    zoom.inport = PolledInput(emu)
+    assert sorted(zoom.file_list()) == sorted(emu.files)
+    # and the next request gets its own reply
+    assert zoom.file_check("FLST_SEQ.ZT2")
+
+
+def test_receive_times_out(emulator, pedal):
+    zoom = pedal(emulator())
+    zoom.inport = PolledInput(zoom.backend)
+    assert zoom.receive(0.01) is None
+
+
+def test_file_list_over_transport(emulator, pedal):
+    emu = emulator()
+    inport, outport = emu.ports()
+    transport = Transport(PolledInput(emu), outport, grace = 0.01)
+    try:
+        zoom = pedal(emu)
+        zoom.disconnect()
+        zoom.transport = transport
+        zoom.priority = BULK
+        assert zoom.connect()
+        assert sorted(zoom.file_list()) == sorted(emu.files)
+        assert zoom.file_check("FLST_SEQ.ZT2")
+        zoom.disconnect()
+    finally:
+        transport.close()
@@ -0,0 +1,76 @@
+import os
+
+from zoomreplay import Recorder, load_session, stage_inputs
+
+
+def test_header_has_cwd(tmp_path):
+    name = str(tmp_path / "session.zrec")
+    recorder = Recorder(name, ["zoomzt2_shooking.py", "-l"])
+    recorder.close()
+    header, records = load_session(name)
+    assert header['cwd'] == os.getcwd()
+    assert records == []
+
+
+def test_stage_inputs(tmp_path):
+    cwd = tmp_path / "recorded"
+    (cwd / "fx").mkdir(parents = True)
+    (cwd / "my_pedal.zt2").write_bytes(b"flst")
+    (cwd / "fx" / "A.ZD2").write_bytes(b"zd2")
+    (tmp_path / "outside.ZD2").write_bytes(b"out")
+    workdir = tmp_path / "replay"
+    workdir.mkdir()
+    argv = stage_inputs(["-R", "-w", "my_pedal.zt2", "-I", "fx/A.ZD2", "--install=../outside.ZD2",
+        "-p", "12", "new.zt2"], str(cwd), str(workdir))
+    assert argv[:6] == ["-R", "-w", "my_pedal.zt2", "-I", "fx/A.ZD2",
+        "--install=" + str(tmp_path / "outside.ZD2")]
+    assert argv[6:] == ["-p", "12", "new.zt2"]
+    # copies, so the replay cannot write over what was recorded
+    assert (workdir / "my_pedal.zt2").read_bytes() == b"flst"
+    assert (workdir / "fx" / "A.ZD2").read_bytes() == b"zd2"
+    assert not (workdir / "new.zt2").exists()
+
+
+def session(zoom):
+    # downloads, an upload and a listing, writing to zoom.outdir
+    names = zoom.file_list()
+    zoom.getfile("160_COMP.ZD2")
+    data = zoom.patch_download(3)
+    with open(os.path.join(zoom.outdir, "patch_3"), "wb") as outfile:
+        outfile.write(data)
+    zoom.patch_upload(4, data)
+    with open(os.path.join(zoom.outdir, "ls.txt"), "w") as outfile:
+        outfile.write("\n".join(names))
+    zoom.disconnect()
+
+
+def test_replay_round_trip(emulator, tmp_path, monkeypatch):
+    from zoomtrace import trace
+    from zoomreplay import ReplaySession
+    from zoomzt2_shooking import zoomzt2
+    name = str(tmp_path / "session.zrec")
+    recorded = tmp_path / "recorded"
+    replayed = tmp_path / "replayed"
+    recorded.mkdir()
+    replayed.mkdir()
+
+    monkeypatch.setattr(trace, "recorder", Recorder(name, ["zoomzt2_shooking.py"]))
+    zoom = zoomzt2(outdir = str(recorded))
+    zoom.backend = emulator()
+    assert zoom.connect()
+    session(zoom)
+    trace.recorder.close()
+    trace.recorder = None
+
+    replay = ReplaySession.load(name, 0)
+    zoom = zoomzt2(outdir = str(replayed))
+    zoom.backend = replay
+    assert zoom.connect()
+    session(zoom)
+    report = replay.report()
+    assert report['mismatches'] == 0
+    assert report['remaining'] == 0
+    assert report['sent'] > 0 and report['received'] == report['sent']
+    assert sorted(os.listdir(str(replayed))) == sorted(os.listdir(str(recorded)))
+    for member in os.listdir(str(recorded)):
+        assert (replayed / member).read_bytes() == (recorded / member).read_bytes(), member
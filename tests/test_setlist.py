@@ -0,0 +1,30 @@
+from zoomsetlist import Setlist
+
+
+class Port(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg.bytes())
+
+
+def test_bank_select_only_when_bank_changes():
+    setlist = Setlist([12, 15, {"patch": 3, "name": "last"}], 10)
+    port = Port()
+    setlist.next(port)
+    setlist.next(port)
+    assert setlist.next(port)['name'] == "last"
+    assert port.sent == [[0xb0, 0x00, 0x00], [0xb0, 0x20, 1], [0xc0, 2],
+        [0xc0, 5],
+        [0xb0, 0x00, 0x00], [0xb0, 0x20, 0], [0xc0, 3]]
+    assert setlist.report()['skippedBanks'] == 1
+
+
+def test_invalidate_resends_bank():
+    setlist = Setlist([12, 15], 10)
+    port = Port()
+    setlist.next(port)
+    setlist.invalidate()
+    setlist.next(port)
+    assert port.sent[-3:] == [[0xb0, 0x00, 0x00], [0xb0, 0x20, 1], [0xc0, 5]]
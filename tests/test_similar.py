@@ -0,0 +1,51 @@
+import copy
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from conftest import CORPUS
+from zoomsimilar import PatchMatrix, load_dirs
+
+
+@pytest.fixture(scope = "module")
+def corpus():
+    return load_dirs([os.path.join(CORPUS, "2.00")])
+
+
+def test_copy_is_nearest(corpus):
+    patches, total_pedal, labels = corpus
+    # a copy of patch 3 on the end
+    patches = patches + [copy.deepcopy(patches[3])]
+    matrix = PatchMatrix(patches, total_pedal)
+    copied = len(patches) - 1
+    assert matrix.nearest(3, 1) == [(copied, 0.0)]
+    assert matrix.nearest(copied, 1) == [(3, 0.0)]
+    found = matrix.nearest(3, 5)
+    assert len(found) == 5
+    assert [dist for j, dist in found] == sorted(dist for j, dist in found)
+    assert 3 not in [j for j, dist in found]
+
+
+def test_duplicates(corpus):
+    patches, total_pedal, labels = corpus
+    matrix = PatchMatrix(patches, total_pedal, labels)
+    pairs = matrix.duplicates(0.05)
+    assert pairs
+    for i, j, dist in pairs:
+        assert i < j
+        assert dist <= 0.05
+        assert matrix.distances([i])[0, j] == pytest.approx(dist, abs = 1e-6)
+    # the same whatever the block size
+    assert sorted(matrix.duplicates(0.05, block = 7)) == sorted(pairs)
+    assert matrix.duplicates(-1.0) == []
+
+
+def test_nothing_to_compare(corpus):
+    patches, total_pedal, labels = corpus
+    matrix = PatchMatrix(patches, total_pedal)
+    assert matrix.nearest(0, k = 0) == []
+    single = PatchMatrix(patches[:1], total_pedal)
+    assert single.nearest(0) == []
+    assert single.duplicates() == []
@@ -0,0 +1,94 @@
+import pytest
+
+from zoomarchive import ZoomArchive
+from zoomsnapshot import snapshot, restore, FLST
+
+UPLOADS = ([0x52, 0x00, 0x6e, 0x60, 0x23], [0x52, 0x00, 0x6e, 0x60, 0x24], [0x52, 0x00, 0x6e, 0x08])
+
+
+class Watched(object):
+    # the emulator's ports, noting anything sent which changes the pedal
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.writes = 0
+
+    def ports(self):
+        inport, outport = self.emulator.ports()
+        watched = self
+        class Output(object):
+            def send(self, msg):
+                if any(list(msg.data[:len(op)]) == op for op in UPLOADS):
+                    watched.writes = watched.writes + 1
+                outport.send(msg)
+        return inport, Output()
+
+
+@pytest.fixture
+def saved(small_emulator, pedal, tmp_path):
+    # a snapshot of the emulated pedal, and the pedal
+    emu = small_emulator()
+    zoom = pedal(emu)
+    name = str(tmp_path / "pedal.zarc")
+    counts = snapshot(zoom, name)
+    assert counts['patches'] == len(emu.patches)
+    assert counts['effects'] == len([f for f in emu.files if f.endswith(".ZD2")])
+    return name, emu, zoom
+
+
+def test_snapshot_restore_round_trip(saved):
+    name, emu, zoom = saved
+    files = dict(emu.files)
+    patches = dict(emu.patches)
+    effect = sorted(f for f in files if f.endswith(".ZD2"))[0]
+    del emu.files[effect]
+    location = sorted(patches)[0]
+    emu.patches[location] = bytes(len(patches[location]))
+    zoom.listing = None
+
+    changes = restore(zoom, name)
+    assert changes['effects'] == [effect]
+    assert changes['patches'] == [location]
+    assert not changes['flst']
+    assert emu.files == files
+    assert emu.patches == patches
+
+
+def test_restore_dry_run_sends_nothing(saved, pedal):
+    name, emu, zoom = saved
+    del emu.files[sorted(f for f in emu.files if f.endswith(".ZD2"))[0]]
+    before = dict(emu.files)
+    watched = Watched(emu)
+    zoom.disconnect()
+    zoom = pedal(watched)
+    changes = restore(zoom, name, dry = True)
+    assert len(changes['effects']) == 1
+    assert watched.writes == 0
+    assert emu.files == before
+
+
+def test_restore_prune_deletes_only_unlisted(saved):
+    name, emu, zoom = saved
+    files = dict(emu.files)
+    emu.files["EXTRA.ZD2"] = files[sorted(f for f in files if f.endswith(".ZD2"))[0]]
+    emu.files["notes.txt"] = b"not an effect"
+    zoom.listing = None
+    changes = restore(zoom, name, prune = True)
+    assert changes['deleted'] == ["EXTRA.ZD2"]
+    assert changes['effects'] == []
+    assert "EXTRA.ZD2" not in emu.files
+    assert emu.files["notes.txt"] == b"not an effect"
+    del emu.files["notes.txt"]
+    assert emu.files == files
+
+
+def test_restore_verifies_the_archive(saved):
+    name, emu, zoom = saved
+    with ZoomArchive(name) as archive:
+        offset, length, flags, crc = archive.info(FLST)
+    with open(name, "r+b") as outfile:
+        outfile.seek(offset + length // 2)
+        outfile.write(b"\xff\xff")
+    files = dict(emu.files)
+    with pytest.raises(ValueError):
+        restore(zoom, name)
+    assert emu.files == files
@@ -0,0 +1,42 @@
+import pytest
+
+from zoomdecode import split_syx
+from zoomsyx import build_syx, read_patches, import_syx, describe, PC_MODE_ON, PC_MODE_OFF
+
+
+def test_syx_round_trip(emulator, pedal, tmp_path):
+    emu = emulator()
+    zoom = pedal(emu)
+    patches = sorted(emu.patches.items())
+    data = build_syx([(location, patch) for location, patch in patches], zoom.bankSize)
+    messages = split_syx(data)
+    assert messages[0] == PC_MODE_ON and messages[-1] == PC_MODE_OFF
+    assert len(messages) == len(patches) + 2
+
+    # to other locations, then back in as patch dumps
+    moved = [(location + 1, patch) for location, patch in patches if location + 1 < zoom.numPatches]
+    name = str(tmp_path / "bank.syx")
+    with open(name, "wb") as outfile:
+        outfile.write(build_syx(moved, zoom.bankSize))
+    assert import_syx(zoom, name) == len(moved)
+    for location, patch in moved:
+        assert emu.patches[location] == patch
+
+
+def test_syx_read_patch_files(tmp_path):
+    for location in (3, 12):
+        with open(str(tmp_path / "patch_{}".format(location)), "wb") as outfile:
+            outfile.write(bytes([location]) * 760)
+    patches, bankSize = read_patches([str(tmp_path / "patch_12"), str(tmp_path / "patch_3")])
+    assert sorted(location for location, data in patches) == [3, 12]
+    message = split_syx(build_syx(patches, bankSize, pcMode = False))[0]
+    assert describe(message, bankSize) == "patch 12, 760 bytes"
+
+
+def test_syx_import_checks_location(emulator, pedal, tmp_path):
+    zoom = pedal(emulator())
+    name = str(tmp_path / "far.syx")
+    with open(name, "wb") as outfile:
+        outfile.write(build_syx([(zoom.numPatches, b"\x00" * 760)], zoom.bankSize))
+    with pytest.raises(ValueError):
+        import_syx(zoom, name)
@@ -0,0 +1,65 @@
+import logging
+
+import pytest
+
+import zoomtrace
+from zoomtrace import Trace, SysexRing, records, setup_logging, MAGIC, RECORD, DIR_OUT, DIR_IN, \
+    TRACE_OFF, TRACE_INFO, TRACE_HEX
+from zoomzt2_shooking import sniffMidiOut
+
+
+@pytest.fixture
+def root():
+    # put the root logger back as it was
+    logger = logging.getLogger()
+    handlers = logger.handlers[:]
+    level = logger.level
+    yield logger
+    for handler in logger.handlers[:]:
+        if handler not in handlers:
+            logger.removeHandler(handler)
+            handler.close()
+    for handler in handlers:
+        if handler not in logger.handlers:
+            logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def test_ring_keeps_the_newest(tmp_path):
+    # room for three of the ten records
+    ring = SysexRing(3 * (RECORD.size + 10) + 5)
+    for n in range(10):
+        ring.add(DIR_OUT if n % 2 else DIR_IN, bytes([n]) * 10)
+    name = str(tmp_path / "midi_trace.bin")
+    ring.dump(name)
+    with open(name, "rb") as infile:
+        data = infile.read()
+    assert data[:len(MAGIC)] == MAGIC
+    assert list(records(data[len(MAGIC):])) == [(DIR_OUT if n % 2 else DIR_IN, bytes([n]) * 10)
+        for n in (7, 8, 9)]
+    # too big to ever fit is dropped, the rest kept
+    ring.add(DIR_OUT, bytes(ring.size))
+    assert len(list(records(ring.raw()))) == 3
+
+
+def test_log_file_only_when_tracing(tmp_path, monkeypatch, root):
+    monkeypatch.setattr(zoomtrace, "trace", Trace(TRACE_OFF))
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    name = tmp_path / "midi.log"
+    setup_logging(str(name))
+    logging.warning("on stderr")
+    assert not name.exists()
+    zoomtrace.trace.set_level(TRACE_INFO)
+    logging.info("in the log")
+    zoomtrace.trace.handler.flush()
+    assert "in the log" in name.read_text()
+    assert zoomtrace.trace.console is None
+
+
+def test_hex_dumped_once(monkeypatch, caplog):
+    monkeypatch.setattr(zoomtrace.trace, "level", TRACE_HEX)
+    caplog.set_level(logging.DEBUG)
+    sniffMidiOut('sysex', [0x52, 0x00, 0x6e, 0x44], printme = True)
+    dumps = [record for record in caplog.records if "0x6e" in record.getMessage()]
+    assert len(dumps) == 1
@@ -0,0 +1,152 @@
+import queue
+import threading
+
+import mido
+import pytest
+
+from zoomtransport import Transport, TransportPort, is_reply, INTERACTIVE, NORMAL, BULK
+
+
+def sysex(*data):
+    return mido.Message('sysex', data = list(data))
+
+
+EDIT = sysex(0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, 0x00, 0x02, 0x05, 0x00, 0x00, 0x00, 0x00)
+ACK = sysex(0x52, 0x00, 0x6e, 0x00, 0x00)
+END = sysex(0x52, 0x00, 0x6e, 0x60, 0x01)
+
+
+class Pedal(object):
+    # a fake pair of ports: every sysex sent is answered by answer(msg),
+    # a list of messages, readable with poll(). Clearing gate holds up
+    # sending, to see what queues behind it.
+    def __init__(self, answer = None):
+        self.answer = answer or (lambda msg: [ACK])
+        self.incoming = queue.Queue()
+        self.sent = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.sending = threading.Event()
+
+    def send(self, msg):
+        self.sending.set()
+        self.gate.wait()
+        self.sent.append(msg)
+        if msg.type == 'sysex':
+            for reply in self.answer(msg):
+                self.incoming.put(reply)
+
+    def poll(self):
+        try:
+            return self.incoming.get_nowait()
+        except queue.Empty:
+            return None
+
+
+@pytest.fixture
+def transport():
+    transports = []
+    def make(pedal, **kwargs):
+        transport = Transport(pedal, pedal, **kwargs)
+        transports.append(transport)
+        return transport
+    yield make
+    for transport in transports:
+        transport.close()
+
+
+def test_is_reply():
+    assert is_reply(ACK)
+    assert is_reply(sysex(0x7e, 0x00, 0x06, 0x02, 0x52, 0x6e))
+    # edits made on the pedal, anything else not sysex
+    assert not is_reply(EDIT)
+    assert not is_reply(mido.Message('program_change', program = 3))
+    assert not is_reply(sysex(0x52, 0x00))
+
+
+def test_edits_are_kept_aside(transport):
+    # a knob turned while we wait for the reply
+    pedal = Pedal(lambda msg: [EDIT, mido.Message('program_change', program = 2), ACK])
+    link = transport(pedal)
+    reply = link.request([0x52, 0x00, 0x6e, 0x44])
+    assert reply == ACK
+    pending = link.pending()
+    assert pending[0] == EDIT and pending[1].type == 'program_change'
+    assert link.pending() == []
+    assert list(TransportPort(link).iter_pending()) == []
+    assert link.stats()['unsolicited'] == 2
+
+
+def test_interactive_goes_ahead_of_bulk(transport):
+    pedal = Pedal()
+    link = transport(pedal)
+    # hold the worker on a first request while the rest queue
+    pedal.gate.clear()
+    first = link.submit(sysex(0x52, 0x00, 0x6e, 0x01), BULK)
+    assert pedal.sending.wait(5)
+    bulk = [link.submit(sysex(0x52, 0x00, 0x6e, 0x02, n), BULK) for n in range(3)]
+    normal = link.submit(sysex(0x52, 0x00, 0x6e, 0x03), NORMAL)
+    edit = link.submit(sysex(0x52, 0x00, 0x6e, 0x04), INTERACTIVE)
+    pedal.gate.set()
+    for request in [first, normal, edit] + bulk:
+        request.wait(5)
+    ops = [msg.data[3] for msg in pedal.sent]
+    assert ops == [0x01, 0x04, 0x03, 0x02, 0x02, 0x02]
+    # same priority, in the order queued
+    assert [msg.data[4] for msg in pedal.sent[3:]] == [0, 1, 2]
+
+
+def test_window_is_not_split(transport):
+    # a window of requests goes out together, an edit waits for it
+    pedal = Pedal()
+    link = transport(pedal)
+    pedal.gate.clear()
+    window = link.submit_many([sysex(0x52, 0x00, 0x6e, 0x02, n) for n in range(4)], BULK)
+    assert pedal.sending.wait(5)
+    edit = link.submit(sysex(0x52, 0x00, 0x6e, 0x04), INTERACTIVE)
+    pedal.gate.set()
+    assert len(window.wait(5)) == 4
+    edit.wait(5)
+    assert [msg.data[3] for msg in pedal.sent] == [0x02] * 4 + [0x04]
+    assert len(window.latencies) == 4
+
+
+def test_end_stops_waiting(transport):
+    # the pedal answers the first two, then says that is all once
+    answers = iter([[ACK], [END], [], []])
+    pedal = Pedal(lambda msg: next(answers))
+    link = transport(pedal, timeout = 5.0, grace = 0.01)
+    request = link.submit_many([sysex(0x52, 0x00, 0x6e, 0x60, 0x26)] * 4, BULK,
+        end = lambda msg: list(msg.data[:5]) == [0x52, 0x00, 0x6e, 0x60, 0x01])
+    replies = request.wait(5)
+    assert replies == [ACK, END]
+    # not the full timeout for the two which never came
+    assert request.seconds < 1.0
+
+
+def test_late_replies_after_end_are_dropped(transport):
+    answers = iter([[END], [ACK], [ACK]])
+    pedal = Pedal(lambda msg: next(answers))
+    link = transport(pedal, grace = 0.05)
+    request = link.submit_many([sysex(0x52, 0x00, 0x6e, 0x60, 0x26)] * 3, BULK,
+        end = lambda msg: msg == END)
+    assert request.wait(5) == [END]
+    assert link.pending() == []
+
+
+def test_missing_reply_times_out(transport):
+    pedal = Pedal(lambda msg: [])
+    link = transport(pedal, timeout = 0.05)
+    with pytest.raises(IOError):
+        link.request([0x52, 0x00, 0x6e, 0x44])
+    assert link.stats()['errors'] == 1
+    # the worker carries on
+    pedal.answer = lambda msg: [ACK]
+    assert link.request([0x52, 0x00, 0x6e, 0x44]) == ACK
+
+
+def test_closed_transport_refuses(transport):
+    link = transport(Pedal())
+    link.close()
+    with pytest.raises(IOError):
+        link.submit(ACK)
@@ -0,0 +1,264 @@
+#!/usr/bin/python
+#
+# Single file archive for a pedal's derived data (ZD2s, their icons and
+# json, allfx.json, ...) instead of hundreds of small files.
+#
+#   python3 zoomarchive.py pack B1XFour/DerivedData/2.00 B1XFour-2.00.zarc
+#   python3 zoomarchive.py list B1XFour-2.00.zarc
+#   python3 zoomarchive.py unpack B1XFour-2.00.zarc somedir
+#   python3 zoomarchive.py add B1XFour-2.00.zarc NEWFX.ZD2 NEWFX.ZD2.json
+#   python3 zoomarchive.py remove B1XFour-2.00.zarc OLDFX.ZD2
+#
+# Layout:
+#   header   ZARC, version, flags, member count, TOC offset and length
+#   members  the file contents, one after another
+#   TOC      json list of [name, offset, length, flags, crc32]
+#
+# Members are stored as they are, or zlib compressed (flag ZLIB, length
+# is then the compressed length and crc32 that of the original data),
+# see write_archive. Opening maps the file and reads the TOC, after that
+# every stored member is a slice of the map. Archives are never changed
+# in place, a new file is written next to the old one and renamed over
+# it. Member names are plain file names, unpack refuses anything else.
+#
+import binascii
+import fnmatch
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+MAGIC = b"ZARC"
+# 2 added ZLIB members
+VERSION = 2
+HEADER = struct.Struct('<4sHHIQQ')
+
+# member flags
+STORED = 0
+ZLIB = 1
+
+
+class ZoomArchive(object):
+    def __init__(self, name):
+        self.name = name
+        self.file = open(name, "rb")
+        self.map = None
+        self.toc = {}
+        self.order = []
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            self.file.close()
+            raise ValueError("{} is not an archive".format(name))
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version, flags, count, tocOffset, tocLength = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version > VERSION:
+            self.close()
+            raise ValueError("{} is not an archive".format(name))
+        for entry in json.loads(self.map[tocOffset:tocOffset + tocLength].decode()):
+            self.toc[entry[0]] = entry
+            self.order.append(entry[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, tb):
+        self.close()
+        return False
+
+    def __contains__(self, name):
+        return name in self.toc
+
+    def __len__(self):
+        return len(self.order)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def names(self, pattern = None):
+        if pattern is None:
+            return list(self.order)
+        return [name for name in self.order if fnmatch.fnmatch(name, pattern)]
+
+    def info(self, name):
+        # (offset, length, flags, crc32)
+        return tuple(self.toc[name][1:])
+
+    def view(self, name):
+        # zero copy for stored members, release the view before closing
+        # the archive
+        entry = self.toc[name]
+        if entry[3] & ZLIB:
+            return memoryview(self.read(name))
+        return memoryview(self.map)[entry[1]:entry[1] + entry[2]]
+
+    def read(self, name):
+        entry = self.toc[name]
+        data = self.map[entry[1]:entry[1] + entry[2]]
+        if entry[3] & ZLIB:
+            return zlib.decompress(data)
+        return data
+
+    def json(self, name):
+        return json.loads(self.read(name).decode())
+
+    def verify(self):
+        # names of members whose crc does not match, or which do not
+        # decompress
+        bad = []
+        for name in self.order:
+            try:
+                if binascii.crc32(self.read(name)) != self.toc[name][4]:
+                    bad.append(name)
+            except zlib.error:
+                bad.append(name)
+        return bad
+
+
+def compress_member(data):
+    # (flags, stored data), left as it is if it does not get smaller
+    packed = zlib.compress(data, 6)
+    if len(packed) < len(data):
+        return ZLIB, packed
+    return STORED, data
+
+
+def write_archive(name, members, compress = False, workers = None):
+    # members is a list of (name, data), replaces any existing archive.
+    # compress zlib compresses the members, several at a time (zlib
+    # lets go of the GIL).
+    crcs = [binascii.crc32(data) for member, data in members]
+    if compress:
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            stored = list(pool.map(compress_member, [data for member, data in members]))
+    else:
+        stored = [(STORED, data) for member, data in members]
+    dirname = os.path.dirname(os.path.abspath(name))
+    fd, tmpname = tempfile.mkstemp(dir = dirname, prefix = ".", suffix = ".tmp")
+    done = False
+    try:
+        with os.fdopen(fd, "wb") as outfile:
+            outfile.write(b"\x00" * HEADER.size)
+            offset = HEADER.size
+            toc = []
+            for (member, original), (flags, data), crc in zip(members, stored, crcs):
+                toc.append([member, offset, len(data), flags, crc])
+                outfile.write(data)
+                offset = offset + len(data)
+            tocData = json.dumps(toc).encode()
+            outfile.write(tocData)
+            outfile.seek(0)
+            outfile.write(HEADER.pack(MAGIC, VERSION, 0, len(toc), offset, len(tocData)))
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        # mkstemp files are private, keep the old archive's mode
+        if os.path.exists(name):
+            os.chmod(tmpname, os.stat(name).st_mode & 0o777)
+        else:
+            os.chmod(tmpname, 0o644)
+        os.replace(tmpname, name)
+        done = True
+    finally:
+        if not done:
+            os.unlink(tmpname)
+    return len(members)
+
+
+def pack(dirname, name, pattern = "*", compress = False):
+    members = []
+    for member in sorted(os.listdir(dirname)):
+        path = os.path.join(dirname, member)
+        if not os.path.isfile(path) or not fnmatch.fnmatch(member, pattern):
+            continue
+        with open(path, "rb") as infile:
+            members.append((member, infile.read()))
+    return write_archive(name, members, compress)
+
+
+def unpack(name, dirname, pattern = None):
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with ZoomArchive(name) as archive:
+        names = archive.names(pattern)
+        # nothing is written outside dirname
+        for member in names:
+            if os.path.basename(member) != member or member in ("", ".", ".."):
+                raise ValueError("{}: bad member name {!r}".format(name, member))
+        for member in names:
+            with open(os.path.join(dirname, member), "wb") as outfile:
+                outfile.write(archive.read(member))
+    return len(names)
+
+
+def update(name, add = None, remove = ()):
+    # add is {name: data}, replacing members of the same name. Stays
+    # compressed if it was.
+    add = add or {}
+    members = []
+    compress = False
+    if os.path.exists(name):
+        with ZoomArchive(name) as archive:
+            for member in archive.names():
+                compress = compress or bool(archive.info(member)[2] & ZLIB)
+                if member not in add and member not in remove:
+                    members.append((member, archive.read(member)))
+    for member in sorted(add):
+        members.append((member, add[member]))
+    return write_archive(name, members, compress)
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] pack DIR ARCHIVE | unpack ARCHIVE DIR | list ARCHIVE\n" \
+        "       | add ARCHIVE FILE... | remove ARCHIVE NAME... | verify ARCHIVE"
+    parser = OptionParser(usage)
+    parser.add_option("-m", "--match",
+        help="only pack/unpack/list members matching pattern, eg. '*.ZD2'", dest="match")
+    parser.add_option("-z", "--compress",
+        help="zlib compress the members when packing", action="store_true", dest="compress")
+    (options, args) = parser.parse_args()
+    if len(args) < 2:
+        parser.error("command and ARCHIVE required")
+
+    command = args[0]
+    if command == "pack" and len(args) == 3:
+        n = pack(args[1], args[2], options.match or "*", options.compress)
+        print("{} members".format(n))
+    elif command == "unpack" and len(args) == 3:
+        n = unpack(args[1], args[2], options.match)
+        print("{} members".format(n))
+    elif command == "list":
+        with ZoomArchive(args[1]) as archive:
+            for member in archive.names(options.match):
+                offset, length, flags, crc = archive.info(member)
+                print("{:10} {:08x} {}{}".format(length, crc, member, " (zlib)" if flags & ZLIB else ""))
+    elif command == "add" and len(args) > 2:
+        add = {}
+        for path in args[2:]:
+            with open(path, "rb") as infile:
+                add[os.path.basename(path)] = infile.read()
+        update(args[1], add = add)
+    elif command == "remove" and len(args) > 2:
+        update(args[1], remove = args[2:])
+    elif command == "verify":
+        with ZoomArchive(args[1]) as archive:
+            bad = archive.verify()
+        for member in bad:
+            print("bad crc: {}".format(member))
+        if bad:
+            sys.exit(1)
+        print("OK")
+    else:
+        parser.error("unknown command")
+
+
+if __name__ == "__main__":
+    main()
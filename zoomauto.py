@@ -0,0 +1,353 @@
+#!/usr/bin/python
+#
+# Parameter automation: LFO sweeps, ramps and tempo synced steps played
+# to the pedal as FXM_PN messages from a timing thread of their own.
+#
+#   python3 zoomauto.py -s 1 -p 2 --lfo sine:0.5 --range 0:100 -d 10
+#   python3 zoomauto.py -s 2 -p 1 --steps 0,50,100,50 --bpm 120 -d 8
+#   python3 zoomauto.py -s 1 -p 3 --ramp 0:100:4 -n      print, do not send
+#
+# Every lane's curve is worked out ahead of time as a table of values,
+# one per tick, and the sysex for each value is built once, so a tick
+# is a table lookup and (if the value changed) a send. Sends are limited
+# to a message rate budget, a lane over budget sends its latest value
+# on a later tick instead. The thread sleeps until just before each
+# tick and spins for the rest, lateness (jitter) and missed ticks are
+# counted, see stats().
+#
+import logging
+import math
+import threading
+from collections import deque
+from time import perf_counter, sleep
+
+import mido
+
+from zoommetrics import percentile
+from zoompatch import fxm_pn_data
+
+
+#--------------------------------------------------
+# curves, value(t) for t in seconds from the start, 0.0 .. 1.0
+
+class Lfo(object):
+    SHAPES = ("sine", "triangle", "square", "saw")
+
+    def __init__(self, shape = "sine", rate = 1.0, phase = 0.0):
+        if shape not in self.SHAPES:
+            raise ValueError("unknown LFO shape {}".format(shape))
+        self.shape = shape
+        self.rate = rate
+        self.phase = phase
+
+    def period(self):
+        return 1.0 / self.rate
+
+    def value(self, t):
+        x = (t * self.rate + self.phase) % 1.0
+        if self.shape == "sine":
+            return 0.5 - 0.5 * math.cos(2 * math.pi * x)
+        if self.shape == "triangle":
+            return 1.0 - abs(2 * x - 1.0)
+        if self.shape == "square":
+            return 1.0 if x < 0.5 else 0.0
+        return x
+
+
+class Ramp(object):
+    # start to end over seconds, then holds end
+    def __init__(self, start = 0.0, end = 1.0, seconds = 1.0):
+        self.start = start
+        self.end = end
+        self.seconds = seconds
+
+    def period(self):
+        return None
+
+    def value(self, t):
+        if t >= self.seconds:
+            return self.end
+        return self.start + (self.end - self.start) * t / self.seconds
+
+
+class Steps(object):
+    # one value per beat division, eg. 16ths are division 4
+    def __init__(self, values, bpm = 120.0, division = 1):
+        self.values = list(values)
+        self.step = 60.0 / bpm / division
+
+    def period(self):
+        return self.step * len(self.values)
+
+    def value(self, t):
+        return self.values[int(t / self.step + 1e-9) % len(self.values)]
+
+
+#--------------------------------------------------
+class Lane(object):
+    # one parameter of one slot (1 based, as FXM_PN) following a curve
+    # scaled to lo..hi
+    def __init__(self, slot, param, curve, lo = 0, hi = 100):
+        self.slot = slot
+        self.param = param
+        self.curve = curve
+        self.lo = lo
+        self.hi = hi
+        self.table = []
+        self.loop = True
+        self.messages = {}
+        self.last = None
+        self.pending = None
+
+    def prepare(self, tick):
+        # the value at every tick of a period (or of the ramp) and the
+        # message for every value
+        period = self.curve.period()
+        self.loop = period is not None
+        length = period if self.loop else self.curve.seconds
+        n = max(1, int(round(length / tick)))
+        span = self.hi - self.lo
+        self.table = [int(round(self.lo + span * self.curve.value(k * tick))) for k in range(n + (0 if self.loop else 1))]
+        self.messages = {}
+        for v in set(self.table):
+            self.messages[v] = mido.Message('sysex', data = fxm_pn_data(self.slot, self.param, v))
+        self.last = None
+        self.pending = None
+
+    def at(self, k):
+        if self.loop:
+            return self.table[k % len(self.table)]
+        return self.table[min(k, len(self.table) - 1)]
+
+
+class Automation(object):
+    def __init__(self, port, tick = 0.02, budget = 50.0, spin = 0.001, lock = None):
+        # port is anything with send(), lock (if given) is held while
+        # sending so the editor can share the port. budget is the most
+        # messages per second sent to the pedal.
+        self.port = port
+        self.tick = tick
+        self.budget = budget
+        self.spin = spin
+        self.lock = lock
+        self.lanes = []
+        self.thread = None
+        self.running = False
+        self.jitter = deque(maxlen = 10000)
+        self.counters = {'ticks': 0, 'sent': 0, 'deferred': 0, 'missed': 0}
+
+    def add(self, lane):
+        lane.prepare(self.tick)
+        self.lanes.append(lane)
+        return lane
+
+    def clear(self):
+        self.stop()
+        self.lanes = []
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self.run, name = "automation", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def wait_until(self, deadline):
+        # sleep most of the way, spin the rest
+        while True:
+            left = deadline - perf_counter()
+            if left <= 0:
+                return
+            if left > self.spin:
+                sleep(left - self.spin)
+
+    def send(self, msg):
+        if self.lock is not None:
+            with self.lock:
+                self.port.send(msg)
+        else:
+            self.port.send(msg)
+
+    def run(self, seconds = None):
+        # play until stop(), or for seconds
+        for lane in self.lanes:
+            lane.last = None
+            lane.pending = None
+        start = perf_counter()
+        tokens = 1.0
+        burst = max(1.0, self.budget * self.tick * 2)
+        lastTick = start
+        k = 0
+        first = 0
+        try:
+            while self.running or seconds is not None:
+                deadline = start + k * self.tick
+                if seconds is not None and k * self.tick > seconds:
+                    break
+                self.wait_until(deadline)
+                now = perf_counter()
+                late = now - deadline
+                if late > self.tick:
+                    # too late for these ticks, keep the curves in time
+                    skip = int(late / self.tick)
+                    self.counters['missed'] = self.counters['missed'] + skip
+                    k = k + skip
+                    deadline = start + k * self.tick
+                    late = now - deadline
+                self.jitter.append(late)
+                self.counters['ticks'] = self.counters['ticks'] + 1
+                tokens = min(burst, tokens + (now - lastTick) * self.budget)
+                lastTick = now
+
+                # take turns at the front, so no lane starves the others
+                n = len(self.lanes)
+                for i in range(n):
+                    lane = self.lanes[(first + i) % n]
+                    v = lane.at(k)
+                    if v == lane.last:
+                        lane.pending = None
+                        continue
+                    if tokens < 1.0:
+                        if lane.pending is None:
+                            self.counters['deferred'] = self.counters['deferred'] + 1
+                        lane.pending = v
+                        continue
+                    tokens = tokens - 1.0
+                    self.send(lane.messages[v])
+                    lane.last = v
+                    lane.pending = None
+                    self.counters['sent'] = self.counters['sent'] + 1
+                if n:
+                    first = (first + 1) % n
+                k = k + 1
+        except Exception:
+            logging.exception("automation stopped")
+        finally:
+            self.running = False
+
+    def stats(self):
+        late = sorted(self.jitter)
+        stats = dict(self.counters)
+        stats.update({
+            'rate': self.counters['sent'] / (self.counters['ticks'] * self.tick) if self.counters['ticks'] else 0,
+            'jitter_mean_ms': sum(late) / len(late) * 1000 if late else 0,
+            'jitter_p50_ms': percentile(late, 50) * 1000,
+            'jitter_p95_ms': percentile(late, 95) * 1000,
+            'jitter_p99_ms': percentile(late, 99) * 1000,
+            'jitter_max_ms': late[-1] * 1000 if late else 0,
+        })
+        return stats
+
+
+class LockedPort(object):
+    # a port shared between threads, eg. the editor and an Automation.
+    # Everything which reads or changes a CachedPort's state is done
+    # holding the lock, anything else is passed through.
+    LOCKED = ("send", "seed", "invalidate", "update", "note_incoming", "poll", "stats")
+
+    def __init__(self, port, lock = None):
+        self.port = port
+        self.lock = lock or threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.port, name)
+        if name not in self.LOCKED:
+            return attr
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    def send(self, msg):
+        with self.lock:
+            return self.port.send(msg)
+
+    def iter_pending(self):
+        # read under the lock, the caller gets them after
+        with self.lock:
+            msgs = list(self.port.iter_pending())
+        return iter(msgs)
+
+
+class PrintPort(object):
+    def __init__(self):
+        self.start = perf_counter()
+
+    def send(self, msg):
+        print("{:8.3f} {}".format(perf_counter() - self.start,
+            " ".join("{:02x}".format(b) for b in msg.data)))
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+    import json
+
+    usage = "usage: %prog [options] (--lfo SHAPE:RATE | --ramp FROM:TO:SECONDS | --steps V,V,...)"
+    parser = OptionParser(usage)
+    parser.add_option("-s", "--slot",
+        help="FX slot, 1 based (default 1)", dest="slot", default="1")
+    parser.add_option("-p", "--param",
+        help="parameter, 1 based (default 1)", dest="param", default="1")
+    parser.add_option("--lfo",
+        help="LFO shape (sine, triangle, square, saw) and rate in Hz, eg. sine:0.5", dest="lfo")
+    parser.add_option("--ramp",
+        help="ramp from:to:seconds, as fractions of the range", dest="ramp")
+    parser.add_option("--steps",
+        help="comma separated parameter values, one per beat division (--range is not used)",
+        dest="steps")
+    parser.add_option("--bpm",
+        help="tempo for --steps (default 120)", dest="bpm", default="120")
+    parser.add_option("--division",
+        help="steps per beat (default 1)", dest="division", default="1")
+    parser.add_option("--range",
+        help="lo:hi parameter values the curve spans (default 0:100)", dest="range", default="0:100")
+    parser.add_option("-d", "--duration",
+        help="seconds to play (default 10)", dest="duration", default="10")
+    parser.add_option("-t", "--tick",
+        help="seconds between updates (default 0.02)", dest="tick", default="0.02")
+    parser.add_option("-r", "--rate",
+        help="most messages per second to send (default 50)", dest="rate", default="50")
+    parser.add_option("-n", "--dry-run",
+        help="print the messages instead of sending them", action="store_true", dest="dry")
+    (options, args) = parser.parse_args()
+
+    lo, hi = [int(x) for x in options.range.split(":")]
+    if options.lfo:
+        shape, rate = options.lfo.split(":")
+        curve = Lfo(shape, float(rate))
+    elif options.ramp:
+        start, end, seconds = [float(x) for x in options.ramp.split(":")]
+        curve = Ramp(start, end, seconds)
+    elif options.steps:
+        # step values are parameter values, not fractions
+        curve = Steps([int(x) for x in options.steps.split(",")], float(options.bpm), int(options.division))
+        lo, hi = 0, 1
+    else:
+        parser.error("one of --lfo, --ramp or --steps required")
+
+    port = None
+    if options.dry:
+        port = PrintPort()
+    else:
+        from zoomdevice import find_ports
+        for inName, outName in find_ports():
+            port = mido.open_output(outName)
+            break
+        if port is None:
+            parser.error("Unable to find Pedal")
+
+    auto = Automation(port, float(options.tick), float(options.rate))
+    auto.add(Lane(int(options.slot), int(options.param), curve, lo, hi))
+    auto.run(float(options.duration))
+    print(json.dumps(auto.stats(), indent = 4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/python
+#
+# Offline benchmarks for the codec and transport hot paths, run against
+# the ZD2 files and patch dumps in B1XFour/DerivedData (no pedal needed).
+#
+#   python3 zoombench.py -o baseline.json
+#   ... make changes ...
+#   python3 zoombench.py -o new.json -c baseline.json
+#
+# Each benchmark is timed 'repeat' times and the best time per call is
+# kept, as that is the least noisy. With --compare anything more than
+# --threshold slower than the baseline is flagged and we exit with 1.
+#
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from time import perf_counter
+
+import construct
+from zoomzt2_shooking import zoomzt2, ZT2, ZD2, ZPTC, BYPASS, zd2_describe, decode_patch
+from zoomemu import ZoomEmulator
+from zoomarchive import ZoomArchive, pack
+from zoomflow import FlowSettings
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = []
+
+
+def bench(name, number = 1):
+    # register fn(corpus) as benchmark 'name', called 'number' times per run
+    def wrap(fn):
+        BENCHMARKS.append((name, number, fn))
+        return fn
+    return wrap
+
+
+class Corpus(object):
+    def __init__(self, zd2dir, patchdir):
+        self.zd2dir = zd2dir
+        self.patchdir = patchdir
+        emulator = ZoomEmulator.from_corpus(zd2dir, patchdir)
+        self.pedal = zoomzt2()
+        self.files = dict((k, v) for k, v in emulator.files.items() if k.endswith(".ZD2"))
+        self.flst = emulator.files["FLST_SEQ.ZT2"]
+        self.flstConfig = ZT2.parse(self.flst)
+        self.patches = [emulator.patches[k] for k in sorted(emulator.patches)]
+
+        # one patch sized block and one file sized block, as sent over MIDI
+        self.patch = self.patches[0]
+        self.packedPatch = self.pedal.pack(self.patch)
+        self.block = self.files[sorted(self.files)[0]][:512]
+        self.packet = bytes(self.pedal.pack(self.block) + self.pedal.crc(self.block))
+
+        # the same dataset as one archive
+        self.workdir = tempfile.mkdtemp(prefix = "zoombench")
+        self.archive = os.path.join(self.workdir, "dataset.zarc")
+        pack(zd2dir, self.archive)
+
+        # catalog as built by a sync (zoomzt2_shooking.py -R)
+        self.total_pedal = [BYPASS]
+        self.fxLookup = {(0, 0): 0}
+        for name in sorted(self.files):
+            binconfig, xAdd = zd2_describe(self.files[name], name)
+            if xAdd is not None:
+                self.fxLookup[xAdd['FX']['fxid'], xAdd['FX']['gid']] = len(self.total_pedal)
+                self.total_pedal.append(xAdd)
+
+
+#--------------------------------------------------
+# 7bit packing and framing
+
+@bench("pack patch", 200)
+def bench_pack(corpus):
+    corpus.pedal.pack(corpus.patch)
+
+@bench("unpack patch", 200)
+def bench_unpack(corpus):
+    corpus.pedal.unpack(corpus.packedPatch)
+
+@bench("crc frame block", 2000)
+def bench_crc(corpus):
+    corpus.pedal.crc(corpus.block)
+
+@bench("crc check block", 2000)
+def bench_crc_ok(corpus):
+    corpus.pedal.crc_ok(corpus.packet, corpus.block)
+
+#--------------------------------------------------
+# file formats
+
+@bench("ZT2 parse", 10)
+def bench_zt2_parse(corpus):
+    ZT2.parse(corpus.flst)
+
+@bench("ZT2 build", 10)
+def bench_zt2_build(corpus):
+    ZT2.build(corpus.flstConfig)
+
+@bench("ZD2 parse all")
+def bench_zd2_parse(corpus):
+    for data in corpus.files.values():
+        ZD2.parse(data)
+
+@bench("getfile describe all")
+def bench_zd2_describe(corpus):
+    # ZD2 parse, PRME json5 and parameter extraction
+    for name, data in corpus.files.items():
+        zd2_describe(data, name)
+
+@bench("ZPTC parse all")
+def bench_zptc_parse(corpus):
+    for data in corpus.patches:
+        ZPTC.parse(data)
+
+@bench("allpatches decode all")
+def bench_decode(corpus):
+    for data in corpus.patches:
+        decode_patch(data, 760, corpus.total_pedal, corpus.fxLookup)
+
+@bench("dataset load dir")
+def bench_load_dir(corpus):
+    # every ZD2, icon and json of the dataset
+    for name in os.listdir(corpus.zd2dir):
+        with open(os.path.join(corpus.zd2dir, name), "rb") as infile:
+            infile.read()
+
+@bench("dataset load archive")
+def bench_load_archive(corpus):
+    with ZoomArchive(corpus.archive) as archive:
+        for name in archive.names():
+            archive.read(name)
+
+#--------------------------------------------------
+# transport, against the emulator
+
+@bench("emulated sync")
+def bench_sync(corpus):
+    # a complete 'zoomzt2_shooking.py -R', in its own process and directory
+    workdir = tempfile.mkdtemp(prefix = "zoombench")
+    try:
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call([sys.executable, os.path.join(here, "zoomemu.py"),
+                "-c", corpus.zd2dir, "-p", corpus.patchdir, "--",
+                "-R", "-w", "my_pedal.zt2"], cwd = workdir, stdout = devnull)
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+
+def upload(corpus, flowSettings):
+    # the 4 biggest effects to a pedal 1ms away
+    emulator = ZoomEmulator({}, {}, latency = 0.001)
+    pedal = zoomzt2()
+    pedal.inport, pedal.outport = emulator.ports()
+    pedal.model = "bench"
+    pedal.flowSettings = flowSettings
+    for name in sorted(corpus.files, key = lambda name: -len(corpus.files[name]))[:4]:
+        pedal.file_upload(name, corpus.files[name])
+        pedal.file_close()
+
+
+@bench("emulated upload fixed")
+def bench_upload_fixed(corpus):
+    upload(corpus, None)
+
+
+@bench("emulated upload adaptive")
+def bench_upload_adaptive(corpus):
+    # what was learnt is kept between runs, as it would be
+    upload(corpus, FlowSettings(os.path.join(corpus.workdir, "flow.json")))
+
+
+#--------------------------------------------------
+def run(corpus, names = None, repeat = 5, sync = True):
+    results = {}
+    for name, number, fn in BENCHMARKS:
+        if names and not any(n in name for n in names):
+            continue
+        if fn is bench_sync:
+            if not sync:
+                continue
+            # slow, do not repeat as often
+            runs = max(1, min(repeat, 3))
+        else:
+            runs = repeat
+        times = timeit.Timer(lambda: fn(corpus)).repeat(repeat = runs, number = number)
+        times = sorted(t / number for t in times)
+        results[name] = {
+            'number': number,
+            'repeat': runs,
+            'best_ms': times[0] * 1000,
+            'median_ms': times[len(times) // 2] * 1000,
+        }
+        print("{:24} {:10.3f} ms  (median {:.3f})".format(name,
+            results[name]['best_ms'], results[name]['median_ms']))
+    return results
+
+
+def compare(results, baseline, threshold):
+    # returns the names of the benchmarks which got slower
+    regressions = []
+    print("{:24} {:>10} {:>10} {:>8}".format("", "baseline", "now", "ratio"))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]['best_ms']
+        after = results[name]['best_ms']
+        ratio = after / before if before else 0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print("{:24} {:10.3f} {:10.3f} {:8.2f}{}".format(name, before, after, ratio, flag))
+    return regressions
+
+
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options]"
+    parser = OptionParser(usage)
+    parser.add_option("-d", "--data",
+        help="corpus directory (default B1XFour/DerivedData)", dest="data",
+        default=os.path.join(here, "B1XFour", "DerivedData"))
+    parser.add_option("-o", "--output",
+        help="write results to file (default bench.json)", dest="output", default="bench.json")
+    parser.add_option("-c", "--compare",
+        help="compare with baseline results file", dest="compare")
+    parser.add_option("-t", "--threshold",
+        help="allowed slow down before flagging a regression (default 0.10)",
+        dest="threshold", default="0.10")
+    parser.add_option("-r", "--repeat",
+        help="number of timed runs per benchmark (default 5)", dest="repeat", default="5")
+    parser.add_option("-k", "--only", action="append", dest="only",
+        help="only run benchmarks whose name contains this (repeatable)")
+    parser.add_option("-n", "--no-sync", action="store_false", dest="sync", default=True,
+        help="skip the emulated sync")
+    (options, args) = parser.parse_args()
+
+    start = perf_counter()
+    corpus = Corpus(os.path.abspath(os.path.join(options.data, "2.00")),
+        os.path.abspath(os.path.join(options.data, "Patches")))
+    print("Corpus: {} ZD2 files, {} patches ({:.1f}s to load)".format(len(corpus.files),
+        len(corpus.patches), perf_counter() - start))
+
+    try:
+        results = run(corpus, options.only, int(options.repeat), options.sync)
+    finally:
+        shutil.rmtree(corpus.workdir, ignore_errors = True)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'construct': construct.version_string,
+        'results': results,
+    }
+    with open(options.output, "w") as out_file:
+        json.dump(report, out_file, indent = 4)
+
+    if options.compare:
+        with open(options.compare, "r") as in_file:
+            baseline = json.load(in_file)['results']
+        regressions = compare(results, baseline, float(options.threshold))
+        if regressions:
+            print("{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
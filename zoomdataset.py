@@ -0,0 +1,262 @@
+#!/usr/bin/python
+#
+# Store of derived data (ZD2s, icons, json, patches) for every pedal
+# model and firmware version we have synced, so switching pedals does
+# not mean downloading every effect again.
+#
+#   python3 zoomdataset.py list
+#   python3 zoomdataset.py import "B1X Four" 2.00 B1XFour/DerivedData/2.00
+#   python3 zoomdataset.py export "B1X Four" 2.00 somedir
+#   python3 zoomdataset.py stats
+#
+# Each dataset is a manifest (json) mapping file names to the sha1 of
+# their contents, the contents are kept once in a shared zoomarchive
+# (objects.zarc) however many models/versions use them. A dataset holds
+# the effects FLST_SEQ lists (ZD2, icon and json), the patches and what
+# sync derives from them, contents no dataset uses any more are dropped.
+#
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+
+from zoomarchive import ZoomArchive, update
+
+# the pedal's files other than its effects and patches
+KEEP = ("FLST_SEQ.ZT2", "allfx.json", "allpatches.json", "model.dat")
+PATCH = re.compile(r'patch_\d+$')
+
+STORE_NAME = os.environ.get("ZOOM_DATASETS",
+    os.path.join(os.path.expanduser("~"), ".zoom_datasets"))
+
+
+def dataset_key(model, version):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', "{}-{}".format(model, version))
+
+
+def write_json(name, data):
+    # write then rename, readers never see half a file
+    dirname = os.path.dirname(os.path.abspath(name))
+    fd, tmpname = tempfile.mkstemp(dir = dirname, prefix = ".", suffix = ".tmp")
+    with os.fdopen(fd, "w") as out_file:
+        json.dump(data, out_file, indent = 4)
+    os.chmod(tmpname, 0o644)
+    os.replace(tmpname, name)
+
+
+def listed_effects(flst):
+    # names of the effects FLST_SEQ data lists
+    from zoomzt2_shooking import ZT2
+    config = ZT2.parse(flst)
+    return set(effect['effect'] for group in config[1] for effect in group['effects'])
+
+
+def wanted(name, effects):
+    # is file name part of a dataset, effects is the ZD2s to keep (None
+    # for any)
+    if name in KEEP or PATCH.match(name):
+        return True
+    for suffix in ("", ".BMP", ".json"):
+        if suffix and not name.endswith(suffix):
+            continue
+        effect = name[:len(name) - len(suffix)]
+        if effect.upper().endswith(".ZD2"):
+            return effects is None or effect in effects
+    return False
+
+
+class Dataset(object):
+    def __init__(self, store, manifest):
+        self.store = store
+        self.manifest = manifest
+        self.model = manifest['model']
+        self.version = manifest['version']
+        self.members = manifest['members']
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def names(self):
+        return sorted(self.members)
+
+    def read(self, name):
+        return self.store.objects().read(self.members[name])
+
+    def json(self, name):
+        return json.loads(self.read(name).decode())
+
+    def extract(self, dirname, names = None):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        for name in names or self.names():
+            with open(os.path.join(dirname, name), "wb") as outfile:
+                outfile.write(self.read(name))
+
+
+class DatasetStore(object):
+    def __init__(self, root = STORE_NAME):
+        self.root = root
+        self.archive = None
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def objects(self):
+        if self.archive is None:
+            self.archive = ZoomArchive(self.path("objects.zarc"))
+        return self.archive
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def datasets(self):
+        # [(model, version)]
+        found = []
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                if name.endswith(".json"):
+                    with open(self.path(name), "r") as in_file:
+                        manifest = json.load(in_file)
+                    found.append((manifest['model'], manifest['version']))
+        return found
+
+    def has(self, model, version):
+        return os.path.exists(self.path(dataset_key(model, version) + ".json"))
+
+    def open(self, model, version):
+        # the Dataset for this model/version, None if we have not got one
+        name = self.path(dataset_key(model, version) + ".json")
+        if not os.path.exists(name):
+            return None
+        with open(name, "r") as in_file:
+            return Dataset(self, json.load(in_file))
+
+    def add(self, model, version, dirname, state = None, flst = None, patches = None):
+        # add (or replace) the dataset from the files in dirname,
+        # only contents we have not already got are added to objects.zarc.
+        # The effects are those flst (FLST_SEQ data, default dirname's
+        # FLST_SEQ.ZT2) lists, or every ZD2 if there is none. patches is
+        # the patch_N names to keep, default every one in dirname (a
+        # pedal with fewer patches leaves the earlier sync's behind).
+        # state defaults to dirname's model.dat
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        if flst is None and os.path.exists(os.path.join(dirname, "FLST_SEQ.ZT2")):
+            with open(os.path.join(dirname, "FLST_SEQ.ZT2"), "rb") as infile:
+                flst = infile.read()
+        effects = listed_effects(flst) if flst is not None else None
+        objectsName = self.path("objects.zarc")
+        have = set()
+        if os.path.exists(objectsName):
+            have = set(self.objects().names())
+        members = {}
+        new = {}
+        for name in sorted(os.listdir(dirname)):
+            path = os.path.join(dirname, name)
+            if not os.path.isfile(path) or not wanted(name, effects):
+                continue
+            if patches is not None and PATCH.match(name) and name not in patches:
+                continue
+            with open(path, "rb") as infile:
+                data = infile.read()
+            digest = hashlib.sha1(data).hexdigest()
+            members[name] = digest
+            if digest not in have:
+                new[digest] = data
+        if flst is not None and "FLST_SEQ.ZT2" not in members:
+            # as sync downloaded it
+            digest = hashlib.sha1(flst).hexdigest()
+            members["FLST_SEQ.ZT2"] = digest
+            if digest not in have:
+                new[digest] = bytes(flst)
+        # what the dataset we replace used and nothing else does, dropped
+        # in the same rewrite of objects.zarc as the new contents go in
+        used = set(members.values())
+        for other in self.datasets():
+            if dataset_key(*other) != dataset_key(model, version):
+                used.update(self.open(*other).members.values())
+        unused = [digest for digest in have if digest not in used]
+        if new or unused:
+            self.close()
+            update(objectsName, add = new, remove = unused)
+        if state is None and "model.dat" in members:
+            state = json.loads(self.objects().read(members["model.dat"]).decode())
+        manifest = {'model': model, 'version': version, 'state': state, 'members': members}
+        write_json(self.path(dataset_key(model, version) + ".json"), manifest)
+        return len(members), len(new)
+
+    def remove(self, model, version):
+        # drop the manifest, and any contents nothing else uses
+        name = self.path(dataset_key(model, version) + ".json")
+        os.unlink(name)
+        self.collect()
+
+    def collect(self):
+        # drop contents no dataset uses, returns how many
+        if not os.path.exists(self.path("objects.zarc")):
+            return 0
+        used = set()
+        for other in self.datasets():
+            used.update(self.open(*other).members.values())
+        unused = [digest for digest in self.objects().names() if digest not in used]
+        if unused:
+            self.close()
+            update(self.path("objects.zarc"), remove = unused)
+        return len(unused)
+
+    def stats(self):
+        files = 0
+        total = 0
+        for model, version in self.datasets():
+            dataset = self.open(model, version)
+            for name in dataset.members:
+                files = files + 1
+                total = total + self.objects().info(dataset.members[name])[1]
+        stored = 0
+        if os.path.exists(self.path("objects.zarc")):
+            stored = os.path.getsize(self.path("objects.zarc"))
+        return {'datasets': len(self.datasets()), 'files': files, 'bytes': total, 'stored_bytes': stored}
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] list | stats | import MODEL VERSION DIR\n" \
+        "       | export MODEL VERSION DIR | remove MODEL VERSION"
+    parser = OptionParser(usage)
+    parser.add_option("-s", "--store",
+        help="dataset store (default $ZOOM_DATASETS or ~/.zoom_datasets)",
+        dest="store", default=STORE_NAME)
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("command required")
+
+    store = DatasetStore(options.store)
+    command = args[0]
+    if command == "list":
+        for model, version in store.datasets():
+            print("{} {} ({} files)".format(model, version, len(store.open(model, version).members)))
+    elif command == "stats":
+        print(json.dumps(store.stats(), indent = 4))
+    elif command == "import" and len(args) == 4:
+        files, new = store.add(args[1], args[2], args[3])
+        print("{} files, {} new".format(files, new))
+    elif command == "export" and len(args) == 4:
+        dataset = store.open(args[1], args[2])
+        if dataset is None:
+            sys.exit("No dataset for {} {}".format(args[1], args[2]))
+        dataset.extract(args[3])
+    elif command == "remove" and len(args) == 3:
+        store.remove(args[1], args[2])
+    else:
+        parser.error("unknown command")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
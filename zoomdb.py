@@ -0,0 +1,238 @@
+#!/usr/bin/python
+#
+# SQLite database of a pedal's effects and patches, for questions like
+# "which patches use EBH360 with Bass > 30".
+#
+#   python3 zoomdb.py export allfx.json allpatches.json
+#   python3 zoomdb.py uses EBH360 Bass '>' 30
+#   python3 zoomdb.py popular
+#   python3 zoomdb.py sql "SELECT name, numSlots FROM effects WHERE numSlots > 1"
+#
+# Tables (see SCHEMA): effects and their parameters from allfx.json,
+# patches, the effects in each patch (patch_slots) and their parameter
+# values (patch_values) from allpatches.json. Exporting again only
+# rewrites the patches which changed.
+#
+import hashlib
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS effects (
+    id INTEGER PRIMARY KEY,
+    fxid INTEGER NOT NULL,
+    gid INTEGER NOT NULL,
+    name TEXT COLLATE NOCASE,
+    description TEXT,
+    version TEXT,
+    groupname TEXT,
+    numParams INTEGER,
+    numSlots INTEGER,
+    filename TEXT,
+    UNIQUE (fxid, gid)
+);
+CREATE INDEX IF NOT EXISTS effects_name ON effects (name);
+
+CREATE TABLE IF NOT EXISTS parameters (
+    effect_id INTEGER NOT NULL REFERENCES effects (id),
+    pnum INTEGER NOT NULL,
+    name TEXT COLLATE NOCASE,
+    explanation TEXT,
+    mmax INTEGER,
+    mdefault INTEGER,
+    pedal INTEGER,
+    blackback INTEGER,
+    PRIMARY KEY (effect_id, pnum)
+);
+CREATE INDEX IF NOT EXISTS parameters_name ON parameters (name, effect_id);
+
+CREATE TABLE IF NOT EXISTS patches (
+    location INTEGER PRIMARY KEY,
+    name TEXT COLLATE NOCASE,
+    description TEXT,
+    numFX INTEGER,
+    hash TEXT
+);
+
+CREATE TABLE IF NOT EXISTS patch_slots (
+    location INTEGER NOT NULL REFERENCES patches (location),
+    position INTEGER NOT NULL,
+    effect_id INTEGER REFERENCES effects (id),
+    fxid INTEGER,
+    gid INTEGER,
+    enabled INTEGER,
+    PRIMARY KEY (location, position)
+);
+CREATE INDEX IF NOT EXISTS patch_slots_effect ON patch_slots (effect_id);
+
+CREATE TABLE IF NOT EXISTS patch_values (
+    location INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    effect_id INTEGER,
+    pnum INTEGER NOT NULL,
+    value INTEGER,
+    PRIMARY KEY (location, position, pnum)
+);
+CREATE INDEX IF NOT EXISTS patch_values_effect ON patch_values (effect_id, pnum, value);
+"""
+
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+
+
+def patch_hash(patch):
+    return hashlib.sha1(json.dumps(patch, sort_keys = True).encode()).hexdigest()
+
+
+class PatchDB(object):
+    def __init__(self, name = "zoom.db"):
+        self.db = sqlite3.connect(name)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def export_effects(self, total_pedal):
+        with self.db:
+            for entry in total_pedal:
+                fx = entry['FX']
+                self.db.execute("""INSERT INTO effects
+                    (fxid, gid, name, description, version, groupname, numParams, numSlots, filename)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (fxid, gid) DO UPDATE SET name = excluded.name,
+                    description = excluded.description, version = excluded.version,
+                    groupname = excluded.groupname, numParams = excluded.numParams,
+                    numSlots = excluded.numSlots, filename = excluded.filename""",
+                    (fx['fxid'], fx['gid'], fx['name'], fx['description'], fx['version'],
+                    fx.get('groupname'), fx['numParams'], fx['numSlots'], fx['filename']))
+                effect_id = self.effect_id(fx['fxid'], fx['gid'])
+                self.db.execute("DELETE FROM parameters WHERE effect_id = ?", (effect_id,))
+                for q, p in enumerate(entry.get('Parameters', [])):
+                    self.db.execute("""INSERT INTO parameters
+                        (effect_id, pnum, name, explanation, mmax, mdefault, pedal, blackback)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (effect_id, q + 1, p.get('name'), p.get('explanation'), p.get('mmax'),
+                        p.get('mdefault'), p.get('pedal'), p.get('blackback')))
+        return len(total_pedal)
+
+    def effect_id(self, fxid, gid):
+        row = self.db.execute("SELECT id FROM effects WHERE fxid = ? AND gid = ?",
+            (fxid, gid)).fetchone()
+        return row[0] if row else None
+
+    def export_patches(self, patches):
+        # upsert, returns (changed, removed). Of patches with the same
+        # location (eg. decoded from two dumps of it) the last is kept.
+        changed = 0
+        latest = {}
+        for index, patch in enumerate(patches):
+            latest[patch.get('location', index)] = patch
+        seen = list(latest)
+        with self.db:
+            for location, patch in latest.items():
+                digest = patch_hash(patch)
+                row = self.db.execute("SELECT hash FROM patches WHERE location = ?",
+                    (location,)).fetchone()
+                if row is not None and row[0] == digest:
+                    continue
+                changed = changed + 1
+                self.delete_patch(location)
+                self.db.execute("""INSERT INTO patches (location, name, description, numFX, hash)
+                    VALUES (?, ?, ?, ?, ?)""", (location, patch['patchname'].strip(),
+                    patch.get('description'), patch.get('numFX'), digest))
+                for position, fx in enumerate(patch.get('FX', [])):
+                    effect_id = self.effect_id(fx['fxid'], fx['gid'])
+                    self.db.execute("""INSERT INTO patch_slots
+                        (location, position, effect_id, fxid, gid, enabled)
+                        VALUES (?, ?, ?, ?, ?, ?)""", (location, position, effect_id,
+                        fx['fxid'], fx['gid'], 1 if fx['enabled'] else 0))
+                    for q, p in enumerate(fx.get('Parameters', [])):
+                        self.db.execute("""INSERT INTO patch_values
+                            (location, position, effect_id, pnum, value) VALUES (?, ?, ?, ?, ?)""",
+                            (location, position, effect_id, q + 1, p.get("param{}".format(q + 1))))
+            gone = [row[0] for row in self.db.execute("SELECT location FROM patches")
+                if row[0] not in seen]
+            for location in gone:
+                self.delete_patch(location)
+        return changed, len(gone)
+
+    def delete_patch(self, location):
+        for table in ("patch_values", "patch_slots", "patches"):
+            self.db.execute("DELETE FROM {} WHERE location = ?".format(table), (location,))
+
+    def export(self, total_pedal, patches):
+        self.export_effects(total_pedal)
+        return self.export_patches(patches)
+
+    def patches_using(self, effect, conditions = ()):
+        # patches with effect (by name) where each (param name, operator,
+        # value) holds, as [(location, patch name, position)]
+        sql = """SELECT DISTINCT p.location, p.name, s.position FROM patch_slots s
+            JOIN effects e ON e.id = s.effect_id
+            JOIN patches p ON p.location = s.location"""
+        args = []
+        for n, (param, op, value) in enumerate(conditions):
+            if op not in OPERATORS:
+                raise ValueError("unknown operator {}".format(op))
+            sql = sql + """
+            JOIN parameters q{0} ON q{0}.effect_id = e.id AND q{0}.name = ?
+            JOIN patch_values v{0} ON v{0}.location = s.location AND v{0}.position = s.position
+                AND v{0}.pnum = q{0}.pnum AND v{0}.value {1} ?""".format(n, op)
+            args.extend([param, value])
+        sql = sql + " WHERE e.name = ? ORDER BY p.location, s.position"
+        args.append(effect)
+        return self.db.execute(sql, args).fetchall()
+
+    def popular(self, limit = 20):
+        # effects by the number of patches using them
+        return self.db.execute("""SELECT e.name, COUNT(DISTINCT s.location) AS n FROM patch_slots s
+            JOIN effects e ON e.id = s.effect_id WHERE e.fxid != 0
+            GROUP BY e.id ORDER BY n DESC, e.name LIMIT ?""", (limit,)).fetchall()
+
+    def query(self, sql, args = ()):
+        return self.db.execute(sql, args).fetchall()
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] export ALLFX.JSON ALLPATCHES.JSON\n" \
+        "       | uses EFFECT [PARAM OP VALUE]... | popular | sql QUERY"
+    parser = OptionParser(usage)
+    parser.add_option("-d", "--db",
+        help="database file (default zoom.db)", dest="db", default="zoom.db")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("command required")
+
+    db = PatchDB(options.db)
+    command = args[0]
+    if command == "export" and len(args) == 3:
+        with open(args[1], "r") as fxFile:
+            total_pedal = json.load(fxFile)
+        with open(args[2], "r") as patchesFile:
+            patches = json.load(patchesFile)
+        changed, removed = db.export(total_pedal, patches)
+        print("{} effects, {} patches ({} changed, {} removed)".format(len(total_pedal),
+            len(patches), changed, removed))
+    elif command == "uses" and len(args) >= 2 and (len(args) - 2) % 3 == 0:
+        conditions = []
+        for n in range(2, len(args), 3):
+            if args[n + 1] not in OPERATORS:
+                parser.error("operator should be one of {}".format(" ".join(OPERATORS)))
+            conditions.append((args[n], args[n + 1], int(args[n + 2])))
+        for location, name, position in db.patches_using(args[1], conditions):
+            print("{:4} {:12} FX{}".format(location, name, position + 1))
+    elif command == "popular":
+        for name, n in db.popular():
+            print("{:4} {}".format(n, name))
+    elif command == "sql" and len(args) == 2:
+        for row in db.query(args[1]):
+            print("\t".join("{}".format(v) for v in row))
+    else:
+        parser.error("unknown command")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
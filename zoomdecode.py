@@ -0,0 +1,218 @@
+#!/usr/bin/python
+#
+# Decode patch dumps without a pedal.
+#
+#   python3 zoomdecode.py B1XFour/DerivedData/Patches
+#   python3 zoomdecode.py -c mypedal/allfx.json -o library.json DIR...
+#   python3 zoomdecode.py -c B1XFour/DerivedData/2.00 DIR
+#
+# Reads sysex patch dumps (.bin, as in B1XFour/DerivedData/Patches, and
+# .syx banks, see zoomsyx.py) and patch_N files (unpacked, as written by
+# allpatches) and writes them decoded in the allpatches.json form, with
+# the file each came from. Dumps are recognised by their command:
+#
+#   08  patch upload/download, '08 00 bank program len len data... crc'
+#       (the bundled dumps have '08 bank 00 program')
+#   45  edit buffer, '45 00 00 00 00 00 00 len len data... crc'
+#
+# Effects are looked up in a catalog if given: an allfx.json, a
+# directory holding one, or a directory or zoomarchive of ZD2 .json
+# files (such as B1XFour/DerivedData/2.00). Files are decoded in a
+# pool of processes.
+#
+import glob
+import json
+import math
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from zoomzt2_shooking import zoomzt2, decode_patch, BYPASS
+from zoomarchive import ZoomArchive
+
+# command -> where the length is, the data follows it
+DUMPS = {0x08: 7, 0x45: 10}
+PATTERNS = ("*.bin", "*.syx", "patch_*")
+
+# set in each worker by start_worker
+_catalog = None
+
+
+def split_syx(data):
+    # the messages (without F0/F7) in data, a bytes like .syx file
+    messages = []
+    start = data.find(b"\xf0")
+    while start != -1:
+        end = data.find(b"\xf7", start + 1)
+        if end == -1:
+            raise ValueError("message at {} is not ended".format(start))
+        messages.append(data[start + 1:end])
+        start = data.find(b"\xf0", end + 1)
+    return messages
+
+
+def read_dump(raw, bankSize = 10):
+    # (location or None, unpacked patch) of a dump file's contents
+    if raw[:1] != b"\xf0":
+        # already unpacked, eg. allpatches' patch_N
+        return None, bytes(raw)
+    return read_message(raw[1:-1] if raw[-1:] == b"\xf7" else raw[1:], bankSize)
+
+
+def read_message(d, bankSize = 10):
+    # (location or None, unpacked patch) of a patch message, no F0/F7
+    if d[:3] != b"\x52\x00\x6e" or len(d) < 4 or d[3] not in DUMPS:
+        raise ValueError("not a patch dump")
+    at = DUMPS[d[3]]
+    length = d[at + 1] * 128 + d[at]
+    packed = d[at + 2:at + 2 + length + int(math.ceil(length / 7.0))]
+    codec = zoomzt2()
+    data = codec.unpack(packed)[:length]
+    if len(data) != length:
+        raise ValueError("dump is short")
+    if not codec.crc_ok(d, data):
+        raise ValueError("checksum error")
+    location = None
+    if d[3] == 0x08:
+        # the bank is in one of d[4] and d[5], the other is 0
+        location = (d[4] + d[5]) * bankSize + d[6]
+    return location, bytes(data)
+
+
+def name_location(name):
+    # patch_12.bin -> 12, patch_01_02.bin is bank and program so not
+    m = re.match(r'patch_(\d+)(\.[^.]*)?$', os.path.basename(name))
+    if m:
+        return int(m.group(1))
+    return None
+
+
+def load_catalog(path):
+    # total_pedal (allfx.json) from an allfx.json, a directory holding
+    # one, or a directory or archive of ZD2 .json files
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, "allfx.json")):
+        path = os.path.join(path, "allfx.json")
+    if os.path.isfile(path) and path.endswith(".json"):
+        with open(path, "r") as infile:
+            return json.load(infile)
+    total_pedal = [BYPASS]
+    if os.path.isdir(path):
+        for name in sorted(glob.glob(os.path.join(path, "*.ZD2.json"))):
+            with open(name, "r") as infile:
+                total_pedal.append(json.load(infile))
+    else:
+        with ZoomArchive(path) as archive:
+            for name in archive.names("*.ZD2.json"):
+                total_pedal.append(archive.json(name))
+    return total_pedal
+
+
+def fx_lookup(total_pedal):
+    # (fxid, gid) -> index into total_pedal, as sync builds it
+    fxLookup = {}
+    for j, entry in enumerate(total_pedal):
+        fxLookup.setdefault((entry['FX']['fxid'], entry['FX']['gid']), j)
+    return fxLookup
+
+
+def start_worker(total_pedal, ptcSize, bankSize):
+    global _catalog
+    _catalog = (total_pedal, fx_lookup(total_pedal) if total_pedal else None, ptcSize, bankSize)
+
+
+def decode_file(name):
+    # (name, decoded patches, error). A .syx may hold a bank of patches,
+    # anything else in it (eg. PC mode on/off) is skipped.
+    total_pedal, fxLookup, ptcSize, bankSize = _catalog
+    patches = []
+    try:
+        with open(name, "rb") as infile:
+            raw = infile.read()
+        if raw[:1] == b"\xf0":
+            dumps = [read_message(d, bankSize) for d in split_syx(raw) if len(d) > 3 and d[3] in DUMPS]
+        else:
+            dumps = [read_dump(raw, bankSize)]
+        for location, data in dumps:
+            if not data:
+                continue
+            patch = decode_patch(data, ptcSize, total_pedal, fxLookup)
+            if location is None:
+                location = name_location(name)
+            patch['location'] = location
+            patch['file'] = os.path.basename(name)
+            patches.append(patch)
+    except Exception as e:
+        return name, [], str(e)
+    if not patches:
+        return name, [], "empty"
+    return name, patches, None
+
+
+def find_dumps(paths):
+    names = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = set()
+            for pattern in PATTERNS:
+                found.update(glob.glob(os.path.join(path, pattern)))
+            names.extend(sorted(found))
+        else:
+            names.append(path)
+    return names
+
+
+def decode_files(names, total_pedal = None, ptcSize = 760, bankSize = 10, workers = None):
+    # decoded patches and {name: error} for those which would not
+    patches = []
+    errors = {}
+    with ProcessPoolExecutor(max_workers = workers, initializer = start_worker,
+            initargs = (total_pedal, ptcSize, bankSize)) as pool:
+        chunk = max(1, len(names) // (4 * (workers or os.cpu_count() or 1)))
+        for name, decoded, error in pool.map(decode_file, names, chunksize = chunk):
+            if error is not None:
+                errors[name] = error
+            patches.extend(decoded)
+    return patches, errors
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+    from time import perf_counter
+
+    usage = "usage: %prog [options] DIR|FILE..."
+    parser = OptionParser(usage)
+    parser.add_option("-c", "--catalog",
+        help="allfx.json, or a directory or archive of ZD2 .json files", dest="catalog")
+    parser.add_option("-o", "--output",
+        help="write the patches to FILE (default stdout)", dest="output")
+    parser.add_option("-s", "--size",
+        help="patch size (default 760)", dest="size", default="760")
+    parser.add_option("-b", "--bank",
+        help="patches per bank, for 08 dumps (default 10)", dest="bank", default="10")
+    parser.add_option("-j", "--jobs",
+        help="processes to decode with (default one per CPU)", dest="jobs")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("DIR or FILE not specified")
+
+    total_pedal = load_catalog(options.catalog) if options.catalog else None
+    names = find_dumps(args)
+    start = perf_counter()
+    patches, errors = decode_files(names, total_pedal, int(options.size), int(options.bank),
+        int(options.jobs) if options.jobs else None)
+    for name in sorted(errors):
+        sys.stderr.write("{}: {}\n".format(name, errors[name]))
+    if options.output:
+        with open(options.output, "w") as out_file:
+            json.dump(patches, out_file, indent = 4)
+    else:
+        json.dump(patches, sys.stdout, indent = 4)
+        print("")
+    sys.stderr.write("{} patches decoded, {} skipped ({:.1f}ms)\n".format(len(patches), len(errors),
+        (perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+#
+# Zoom pedal models and a cache of the pedals we have talked to.
+#
+# The model ID is d[7] of the identity reply (7e 06 02), or of the 6e 59
+# reply when the pedal is attached through a GCE-3. 'version' is only
+# used in the GCE-3 case, where the identity reply carries the GCE-3's
+# firmware rather than the pedal's. 'gce3' holds what differs when the
+# model is behind a GCE-3.
+#
+# The cache remembers what connect() learnt from a pedal (model, patch
+# count/size, bank size...) keyed on the MIDI port and the identity
+# reply, so the next connect only has to ask for the identity again to
+# check it is still the same pedal and firmware. Behind a GCE-3 the
+# identity is the GCE-3's whatever pedal is plugged into it, so those
+# are not cached.
+#
+import json
+import logging
+import os
+import mido
+
+MIDINAME = "ZOOM G"
+
+MODELS = {
+    0x00: {'model': "G5n", 'maxFX': 9, 'version': "3.00"},
+    0x02: {'model': "G3n", 'maxFX': 7, 'version': "2.20"},
+    0x03: {'model': "G3Xn", 'maxFX': 7, 'version': "2.20"},
+    0x04: {'model': "B3n", 'maxFX': 7, 'version': "2.20"},
+    0x0c: {'model': "G1 Four", 'maxFX': 5, 'version': "2.00"},
+    0x0d: {'model': "G1X Four", 'maxFX': 5, 'version': "2.00"},
+    0x0e: {'model': "B1 FOUR", 'maxFX': 5, 'version': "2.00"},
+    0x0f: {'model': "B1X Four", 'maxFX': 5, 'version': "2.00"},
+    # a guess, only ever seen through the GCE-3 branch
+    0x10: {'model': "GCE-3", 'maxFX': 5, 'version': "1.20"},
+    # maxFX has never been set for it behind a GCE-3
+    0x11: {'model': "A1 Four", 'maxFX': 5, 'version': "1.01", 'gce3': {'maxFX': 0}},
+    0x12: {'model': "A1X Four", 'maxFX': 5, 'version': "1.01"},
+    0x13: {'model': "??", 'maxFX': 5, 'version': "1.50"},
+    0x17: {'model': "??", 'maxFX': 5, 'version': "1.30"},
+    0x19: {'model': "??", 'maxFX': 5, 'version': "1.30"},
+}
+
+GCE3 = 0x10
+
+UNKNOWN = {'model': None, 'maxFX': 0, 'version': 0}
+
+
+def profile(modelId, gce3 = False):
+    model = MODELS.get(modelId, UNKNOWN)
+    if gce3 and 'gce3' in model:
+        model = dict(model, **model['gce3'])
+    return model
+
+
+def model_id(name):
+    # reverse lookup, None if we do not know the model
+    for modelId in sorted(MODELS):
+        if MODELS[modelId]['model'] == name:
+            return modelId
+    return None
+
+
+def firmware(d):
+    # firmware string from an identity reply (without 0xf0/0xf7)
+    return "".join(chr(c) for c in d[9:13])
+
+
+def find_ports(midiname = MIDINAME):
+    # (input, output) port names for every attached pedal
+    inputs = [port for port in mido.get_input_names() if port[:len(midiname)]==midiname]
+    outputs = [port for port in mido.get_output_names() if port[:len(midiname)]==midiname]
+    pairs = []
+    for port in list(inputs):
+        # ALSA and CoreMIDI use the same name both ways
+        if port in outputs:
+            pairs.append((port, port))
+            inputs.remove(port)
+            outputs.remove(port)
+    # Windows numbers inputs and outputs separately, pair them in order
+    pairs.extend(zip(inputs, outputs))
+    for port in inputs[len(outputs):] + outputs[len(inputs):]:
+        logging.warning("No matching port for %s", port)
+    return pairs
+
+
+#--------------------------------------------------
+CACHE_NAME = os.path.join(os.path.expanduser("~"), ".zoom_identity.json")
+
+
+class IdentityCache(object):
+    def __init__(self, name = CACHE_NAME):
+        self.name = name
+        self.entries = None
+
+    def load(self):
+        if self.entries is None:
+            self.entries = {}
+            try:
+                with open(self.name, "r") as in_file:
+                    self.entries = json.load(in_file)
+            except (IOError, OSError, ValueError):
+                pass
+        return self.entries
+
+    def key(self, port, d):
+        return "{}|{:02x}|{}".format(port, d[7], firmware(d))
+
+    def cacheable(self, d):
+        # the identity does not say which pedal is behind a GCE-3
+        return d[7] != GCE3
+
+    def get(self, port, d):
+        # the pedal state cached for this port and identity reply, or None
+        if not self.cacheable(d):
+            return None
+        entry = self.load().get(self.key(port, d))
+        if entry is None or entry.get('identity') != list(d):
+            return None
+        return entry['state']
+
+    def put(self, port, d, state):
+        if not self.cacheable(d):
+            return
+        entries = self.load()
+        key = self.key(port, d)
+        entry = {'identity': list(d), 'state': state}
+        if entries.get(key) == entry:
+            return
+        entries[key] = entry
+        try:
+            with open(self.name, "w") as out_file:
+                json.dump(entries, out_file, indent = 4)
+        except (IOError, OSError):
+            logging.warning("Unable to write identity cache %s", self.name)
+
+    def forget(self, port = None):
+        entries = self.load()
+        for key in list(entries):
+            if port is None or key.startswith(port + "|"):
+                del entries[key]
+        with open(self.name, "w") as out_file:
+            json.dump(entries, out_file, indent = 4)
+
+
+def write_if_changed(name, state):
+    # only rewrite (eg. model.dat) if the contents would change
+    try:
+        with open(name, "r") as in_file:
+            if json.load(in_file) == state:
+                return False
+    except (IOError, OSError, ValueError):
+        pass
+    with open(name, "w") as out_file:
+        json.dump(state, out_file, indent = 6)
+    return True
@@ -0,0 +1,267 @@
+#!/usr/bin/python
+#
+# A pretend pedal for running zoomzt2 without hardware.
+#
+# Serves ZD2 files (and an FLST_SEQ.ZT2 built from them) and patches
+# from a directory such as B1XFour/DerivedData, answering the same
+# sysex requests zoomzt2_shooking.py sends to a real pedal. Used by the
+# benchmarks and for trying things out offline:
+#
+#   python3 zoomemu.py -- -R -w my_pedal.zt2
+#
+import collections
+import glob
+import math
+import os
+import sys
+from time import sleep, perf_counter
+import mido
+
+from zoomzt2_shooking import zoomzt2, ZT2, ZD2
+from zoomarchive import ZoomArchive
+from zoomdecode import read_dump
+from zoomdevice import profile
+from zoompatch import fxm_pn_data
+
+ACK = [0x52, 0x00, 0x6e, 0x00]
+
+
+def _name(data, start):
+    name = bytearray()
+    for b in data[start:]:
+        if b == 0:
+            break
+        name.append(b)
+    return name.decode("ascii", "replace")
+
+
+class ZoomEmulator(object):
+    def __init__(self, files, patches, model = 0x0f, version = None,
+            numPatches = 50, bankSize = 10, ptcSize = 760, blockSize = 512, latency = 0.0,
+            maxBlock = None, chatter = 0):
+        # files is {name: bytes}, patches is {location: unpacked bytes}
+        self.files = dict(files)
+        self.patches = dict(patches)
+        self.model = model
+        self.version = version or profile(model)['version']
+        self.numPatches = numPatches
+        self.bankSize = bankSize
+        self.ptcSize = ptcSize
+        self.blockSize = blockSize
+        # each reply arrives latency seconds after its request, requests
+        # sent before reading replies overlap
+        self.latency = latency
+        # upload blocks larger than this are refused
+        self.maxBlock = maxBlock
+        # every chatter'th reply is preceded by an edit made on the pedal,
+        # as if someone were turning a knob
+        self.chatter = chatter
+        self.refused = False
+        self.codec = zoomzt2()
+        self.replies = collections.deque()
+        self.checking = None
+        self.reading = None
+        self.offset = 0
+        self.pending = None
+        self.writing = None
+        self.listing = []
+        self.requests = 0
+
+    @classmethod
+    def from_corpus(cls, zd2dir, patchdir = None, **kwargs):
+        # zd2dir is a directory of ZD2 files or a zoomarchive of them
+        codec = zoomzt2()
+        files = {}
+        if os.path.isfile(zd2dir):
+            with ZoomArchive(zd2dir) as archive:
+                for name in archive.names("*.ZD2"):
+                    files[name] = archive.read(name)
+        else:
+            for name in sorted(glob.glob(os.path.join(zd2dir, "*.ZD2"))):
+                with open(name, "rb") as binfile:
+                    files[os.path.basename(name)] = binfile.read()
+        flst = ZT2.build([dict(name = "FLST_SEQ"), []])
+        for name in sorted(files):
+            binconfig = ZD2.parse(files[name])
+            flst = codec.add_effect(flst, name, binconfig['version'], binconfig['id'])
+        files["FLST_SEQ.ZT2"] = bytes(flst)
+
+        patches = {}
+        bankSize = kwargs.get('bankSize', 10)
+        if patchdir is not None:
+            # only the 0x08 (patch_xx_yy.bin) dumps carry their location
+            for name in sorted(glob.glob(os.path.join(patchdir, "patch_??_??.bin"))):
+                with open(name, "rb") as binfile:
+                    location, data = read_dump(binfile.read(), bankSize)
+                if location is not None:
+                    patches[location] = data
+        if patches and 'numPatches' not in kwargs:
+            kwargs['numPatches'] = max(patches) + 1
+        return cls(files, patches, **kwargs)
+
+    def ports(self):
+        return EmulatorInput(self), EmulatorOutput(self)
+
+    def receive(self):
+        if not self.replies:
+            raise IOError("emulator: nothing to receive")
+        ready, data = self.replies.popleft()
+        wait = ready - perf_counter()
+        if wait > 0:
+            sleep(wait)
+        return mido.Message("sysex", data = data)
+
+    def reply(self, data):
+        if self.chatter and self.requests % self.chatter == 0:
+            self.replies.append((perf_counter() + self.latency, fxm_pn_data(1, 1, self.requests % 100)))
+        self.replies.append((perf_counter() + self.latency, data))
+
+    def block(self, header, data):
+        # header, length, packed data and CRC as the pedal sends them
+        length = len(data)
+        return header + [length & 0x7f, (length >> 7) & 0x7f] \
+            + list(self.codec.pack(data)) + list(self.codec.crc(data))
+
+    def send(self, msg):
+        if msg.type != "sysex":
+            return
+        self.requests = self.requests + 1
+        d = list(msg.data)
+        if d[:4] == [0x7e, 0x00, 0x06, 0x01]:
+            self.reply([0x7e, 0x00, 0x06, 0x02, 0x52, 0x6e, 0x00, self.model, 0x00]
+                + [ord(c) for c in self.version])
+            return
+        if d[:3] != [0x52, 0x00, 0x6e] or len(d) < 4:
+            return
+        op = d[3]
+        if op == 0x64:
+            # edit buffer (FXM_*) changes are not answered
+            return
+        if op == 0x58:
+            self.reply([0x52, 0x00, 0x6e, 0x59, 0x00, 0x6e, 0x00, self.model])
+        elif op == 0x44:
+            self.reply([0x52, 0x00, 0x6e, 0x43,
+                self.numPatches & 0x7f, self.numPatches >> 7,
+                self.ptcSize & 0x7f, self.ptcSize >> 7, 0x00, 0x00,
+                self.bankSize & 0x7f, self.bankSize >> 7])
+        elif op == 0x09:
+            location = d[5] * self.bankSize + d[6]
+            data = self.patches.get(location, b"")
+            self.reply(self.block([0x52, 0x00, 0x6e, 0x08, 0x00, d[5], d[6]], data))
+        elif op == 0x08:
+            length = d[8] * 128 + d[7]
+            data = self.codec.unpack(d[9:9 + length + int(math.ceil(length/7.0))])[:length]
+            self.patches[d[5] * self.bankSize + d[6]] = bytes(data)
+            self.reply(ACK)
+        elif op == 0x60 and len(d) > 4:
+            self.file_op(d[4], d)
+        else:
+            self.reply(ACK)
+
+    def file_op(self, sub, d):
+        if sub in (0x25, 0x26):
+            name = _name(d, 7)
+            if name == "*":
+                if sub == 0x25:
+                    self.listing = sorted(self.files)
+                if self.listing:
+                    entry = [ord(c) for c in self.listing.pop(0)]
+                    self.reply([0x52, 0x00, 0x6e, 0x60, 0x04] + [0x00] * 9 + entry + [0x00] * (14 - len(entry)))
+                else:
+                    self.reply([0x52, 0x00, 0x6e, 0x60, 0x01])
+                return
+            self.checking = name
+        elif sub == 0x24:
+            self.files.pop(_name(d, 5), None)
+        elif sub == 0x20:
+            name = _name(d, 15)
+            if d[5] == 0x02:
+                self.reading = self.files.get(name, b"")
+                self.offset = 0
+            else:
+                self.writing = (name, bytearray())
+        elif sub == 0x22:
+            chunk = self.reading[self.offset:self.offset + self.blockSize] if self.reading else b""
+            self.offset = self.offset + len(chunk)
+            self.pending = self.block([0x52, 0x00, 0x6e, 0x60, 0x04, 0x00, 0x00, 0x00], chunk)
+        elif sub == 0x23 and self.writing is not None:
+            length = d[11] * 128 + d[10]
+            if self.maxBlock is not None and length > self.maxBlock:
+                self.refused = True
+            self.writing[1].extend(self.codec.unpack(d[15:15 + length + int(math.ceil(length/7.0))])[:length])
+        elif sub == 0x21:
+            if self.writing is not None:
+                self.files[self.writing[0]] = bytes(self.writing[1])
+            self.writing = None
+            self.reading = None
+        elif sub == 0x05:
+            if self.pending is not None:
+                self.reply(self.pending)
+                self.pending = None
+                return
+            if self.refused:
+                self.refused = False
+                self.reply([0x52, 0x00, 0x6e, 0x60, 0x06, 0x00, 0x7f, 0x7f])
+                return
+            if self.checking is not None:
+                exists = self.checking in self.files
+                self.checking = None
+                flag = 0x00 if exists else 0x7f
+                self.reply([0x52, 0x00, 0x6e, 0x60, 0x06, 0x00, flag, flag])
+                return
+            self.reply([0x52, 0x00, 0x6e, 0x60, 0x06, 0x00, 0x00, 0x00])
+            return
+        self.reply(ACK)
+
+
+class EmulatorInput(object):
+    def __init__(self, emulator):
+        self.emulator = emulator
+
+    def receive(self):
+        return self.emulator.receive()
+
+    def close(self):
+        pass
+
+
+class EmulatorOutput(object):
+    def __init__(self, emulator):
+        self.emulator = emulator
+
+    def send(self, msg):
+        self.emulator.send(msg)
+
+    def close(self):
+        pass
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+    import zoomzt2_shooking
+
+    usage = "usage: %prog [options] -- ZOOMZT2 ARGS"
+    parser = OptionParser(usage)
+    parser.add_option("-c", "--corpus",
+        help="directory or archive of ZD2 files (default B1XFour/DerivedData/2.00)",
+        dest="corpus", default=os.path.join("B1XFour", "DerivedData", "2.00"))
+    parser.add_option("-p", "--patches",
+        help="directory of patch dumps (default B1XFour/DerivedData/Patches)",
+        dest="patches", default=os.path.join("B1XFour", "DerivedData", "Patches"))
+    parser.add_option("-l", "--latency",
+        help="seconds the pretend pedal takes to answer", dest="latency", default="0")
+    parser.add_option("--chatter",
+        help="send an edit before every Nth reply", dest="chatter", default="0")
+    (options, args) = parser.parse_args()
+
+    emulator = ZoomEmulator.from_corpus(os.path.abspath(options.corpus),
+        os.path.abspath(options.patches), latency = float(options.latency),
+        chatter = int(options.chatter))
+    zoomzt2_shooking.zoomzt2.backend = emulator
+    sys.argv = ["zoomzt2_shooking.py"] + args
+    zoomzt2_shooking.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+#
+# Flow control for uploads to the pedal.
+#
+# file_upload used to send 512 byte blocks and poll the status (60 05)
+# after every one, patch uploads waited for each reply before sending
+# the next patch. FlowControl picks the block size and how many blocks
+# (or patches) are sent before waiting for their replies, 'window'. It
+# starts from what worked last time for the model (or the safe 512/1),
+# then doubles the window and then the block size for as long as the
+# measured throughput goes up by more than GAIN, and stays on the best.
+# Any error goes back to the safe settings for the rest of the session
+# and lowers the most that is tried for that model from then on.
+#
+#   python3 zoomflow.py                  show learnt settings
+#   python3 zoomflow.py -f "B1X Four"    forget a model's settings
+#
+import json
+import logging
+import os
+import threading
+
+# what the pedal has always been sent
+SAFE = {'block': 512, 'window': 1}
+# never beyond these. The length of a block is sent as 2 7bit bytes.
+LIMITS = {'block': (256, 2048), 'window': (1, 8)}
+# windows measured for each setting tried
+TRIAL = 3
+# improvement needed to keep growing
+GAIN = 1.05
+
+FLOW_NAME = os.path.join(os.path.expanduser("~"), ".zoom_flow.json")
+
+
+class FlowControl(object):
+    def __init__(self, block = SAFE['block'], window = SAFE['window'], tuneBlock = True, settled = False,
+            maxBlock = LIMITS['block'][1], maxWindow = LIMITS['window'][1]):
+        self.maxBlock = max(SAFE['block'], min(LIMITS['block'][1], maxBlock))
+        self.maxWindow = max(SAFE['window'], min(LIMITS['window'][1], maxWindow))
+        self.block = max(LIMITS['block'][0], min(self.maxBlock, block))
+        self.window = max(LIMITS['window'][0], min(self.maxWindow, window))
+        self.tuneBlock = tuneBlock
+        # fixed settings are not tuned
+        self.settled = settled
+        self.failed = False
+        # (bytes per second, block, window)
+        self.best = None
+        self.trial = []
+        # seconds from sending a window to its acks, for the report
+        self.latency = []
+
+    def settings(self):
+        return {'block': self.block, 'window': self.window}
+
+    def is_safe(self):
+        return self.settings() == SAFE
+
+    def measure(self, nbytes, seconds):
+        # a window of nbytes was acknowledged in seconds
+        self.latency.append(seconds)
+        if self.settled or seconds <= 0:
+            return
+        self.trial.append(nbytes / seconds)
+        if len(self.trial) < TRIAL:
+            return
+        rate = sorted(self.trial)[len(self.trial) // 2]
+        self.trial = []
+        if self.best is None or rate > self.best[0] * GAIN:
+            self.best = (rate, self.block, self.window)
+            if not self.grow():
+                self.settled = True
+            logging.info("Flow %s at %.0f bytes/s", self.settings(), rate)
+        else:
+            # no better, back to the best and stay there
+            rate, self.block, self.window = self.best
+            self.settled = True
+            logging.info("Flow settled on %s", self.settings())
+
+    def grow(self):
+        if self.window * 2 <= self.maxWindow:
+            self.window = self.window * 2
+            return True
+        if self.tuneBlock and self.block * 2 <= self.maxBlock:
+            self.block = self.block * 2
+            return True
+        return False
+
+    def fail(self):
+        logging.warning("Flow error at %s, back to %s", self.settings(), SAFE)
+        # do not go this far again
+        if self.block > SAFE['block']:
+            self.maxBlock = max(SAFE['block'], self.block // 2)
+        elif self.window > SAFE['window']:
+            self.maxWindow = max(SAFE['window'], self.window // 2)
+        self.block = SAFE['block']
+        self.window = SAFE['window']
+        self.settled = True
+        self.failed = True
+        self.trial = []
+
+
+class FlowSettings(object):
+    # learnt FlowControl settings per model and kind ("upload", "patch")
+    def __init__(self, name = FLOW_NAME):
+        self.name = name
+        self.entries = None
+        # shared by the pedals of a zoomrack
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.entries is None:
+            self.entries = {}
+            try:
+                with open(self.name, "r") as in_file:
+                    self.entries = json.load(in_file)
+            except (IOError, OSError, ValueError):
+                pass
+        return self.entries
+
+    def flow(self, model, kind):
+        # a FlowControl starting from what we learnt last time
+        entry = self.load().get(model, {}).get(kind)
+        if entry is None:
+            return FlowControl(tuneBlock = (kind == "upload"))
+        # keep trying to improve on it, the link may be quicker now
+        return FlowControl(entry['block'], entry['window'], tuneBlock = (kind == "upload"),
+            maxBlock = entry.get('maxBlock', LIMITS['block'][1]),
+            maxWindow = entry.get('maxWindow', LIMITS['window'][1]))
+
+    def put(self, model, kind, flow):
+        with self.lock:
+            entries = self.load()
+            settings = dict(flow.settings(), maxBlock = flow.maxBlock, maxWindow = flow.maxWindow)
+            if entries.get(model, {}).get(kind) == settings:
+                return
+            entries.setdefault(model, {})[kind] = settings
+            self.write()
+
+    def forget(self, model = None):
+        entries = self.load()
+        for key in list(entries):
+            if model is None or key == model:
+                del entries[key]
+        self.write()
+
+    def write(self):
+        try:
+            with open(self.name, "w") as out_file:
+                json.dump(self.entries, out_file, indent = 4)
+        except (IOError, OSError):
+            logging.warning("Unable to write flow settings %s", self.name)
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options]"
+    parser = OptionParser(usage)
+    parser.add_option("-f", "--forget",
+        help="forget the settings learnt for MODEL", dest="forget")
+    parser.add_option("-s", "--settings",
+        help="settings file (default ~/.zoom_flow.json)", dest="settings", default=FLOW_NAME)
+    (options, args) = parser.parse_args()
+
+    settings = FlowSettings(options.settings)
+    if options.forget:
+        settings.forget(options.forget)
+    for model, kinds in sorted(settings.load().items()):
+        for kind, entry in sorted(kinds.items()):
+            print("{:12} {:7} block {:5} window {} (at most {}, {})".format(model, kind, entry['block'],
+                entry['window'], entry.get('maxBlock', LIMITS['block'][1]), entry.get('maxWindow', LIMITS['window'][1])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/python
+#
+# Virtual list for the editor's patch and FX lists.
+#
+# A tk Listbox holds (and redraws) every row it is given, so filling or
+# filtering it costs the length of the list. VirtualList keeps the rows
+# in python and only hands the Listbox the few that are on screen.
+#
+# ListModel does the bookkeeping (no tkinter) and VirtualList is the
+# widget, with enough of the Listbox methods (curselection, get,
+# selection_set, see, insert, delete) for the editor's callbacks. Indexes
+# given to and returned by those are positions in the filtered view,
+# item() turns one into an index into the full list.
+#
+import bisect
+
+import tkinter as tk
+from tkinter import font
+
+
+class ListModel(object):
+    def __init__(self, height = 10):
+        self.height = height
+        # display strings, computed once by the caller
+        self.items = []
+        self.lower = []
+        # indexes into items shown, ascending. A range when unfiltered.
+        self.view = range(0)
+        # the view set_filter gave, which text filters within. None for
+        # every item.
+        self.group = None
+        self.text = ""
+        self.top = 0
+        # selected item (index into items), None if nothing is
+        self.selected = None
+
+    def __len__(self):
+        return len(self.view)
+
+    def set_items(self, items):
+        self.items = list(items)
+        self.lower = [item.lower() for item in self.items]
+        self.clear_filter()
+        self.selected = None
+
+    def extend(self, items):
+        unfiltered = isinstance(self.view, range) and len(self.view) == len(self.items)
+        self.items.extend(items)
+        self.lower.extend(item.lower() for item in items)
+        if unfiltered:
+            self.view = range(len(self.items))
+
+    def set_filter(self, indexes):
+        # show only these items, eg. a precomputed group. indexes must be
+        # ascending, it is kept rather than copied. Text filters then
+        # search within these.
+        self.view = indexes
+        self.group = indexes
+        self.text = ""
+        self.top = 0
+
+    def filter_text(self, text):
+        # items (of the group, if set_filter gave one) containing text.
+        # Adding to the text only searches the items already shown.
+        text = text.lower()
+        every = self.group if self.group is not None else range(len(self.items))
+        if text.startswith(self.text) and self.text:
+            candidates = self.view
+        else:
+            candidates = every
+        if text:
+            self.view = [i for i in candidates if text in self.lower[i]]
+        else:
+            self.view = every
+        self.text = text
+        self.top = 0
+
+    def position(self, item):
+        # where item is in the view, None if filtered out
+        if isinstance(self.view, range):
+            if item in self.view:
+                return item - self.view.start
+            return None
+        pos = bisect.bisect_left(self.view, item)
+        if pos < len(self.view) and self.view[pos] == item:
+            return pos
+        return None
+
+    def item(self, pos):
+        return self.view[pos]
+
+    def select_item(self, item):
+        # select by index into the full list, dropping the filter if
+        # it hides the item
+        if self.position(item) is None:
+            self.clear_filter()
+        self.selected = item
+        self.see(self.position(item))
+
+    def clear_filter(self):
+        # every item, no group or text filter
+        self.view = range(len(self.items))
+        self.group = None
+        self.text = ""
+        self.top = 0
+
+    def visible(self):
+        # (view position, display string) of the rows on screen
+        end = min(len(self.view), self.top + self.height)
+        return [(pos, self.items[self.view[pos]]) for pos in range(self.top, end)]
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, len(self.view) - self.height))
+
+    def see(self, pos):
+        if pos < self.top:
+            self.scroll_to(pos)
+        elif pos >= self.top + self.height:
+            self.scroll_to(pos - self.height + 1)
+
+    def fraction(self):
+        # (first, last) shown, for the scrollbar
+        if not self.view:
+            return 0.0, 1.0
+        n = float(len(self.view))
+        return self.top / n, min(1.0, (self.top + self.height) / n)
+
+
+class VirtualList(tk.Frame):
+    def __init__(self, master, height = 10, **kwargs):
+        tk.Frame.__init__(self, master)
+        self.model = ListModel(height)
+        self.rows = tk.StringVar()
+        self.listbox = tk.Listbox(self, listvariable = self.rows, height = height,
+            exportselection = False, **kwargs)
+        self.scrollbar = tk.Scrollbar(self, orient = "vertical", command = self.yview)
+        self.listbox.pack(side = tk.LEFT, fill = tk.BOTH, expand = True)
+        self.scrollbar.pack(side = tk.RIGHT, fill = tk.Y)
+        self.listbox.bind("<<ListboxSelect>>", self._selected)
+        self.listbox.bind("<Configure>", self._resized)
+        # the listbox only holds the visible rows, so scroll ourselves
+        self.listbox.bind("<MouseWheel>", lambda event: self._wheel(-1 if event.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda event: self._wheel(-1))
+        self.listbox.bind("<Button-5>", lambda event: self._wheel(1))
+        self.listbox.bind("<Up>", lambda event: self._step(-1))
+        self.listbox.bind("<Down>", lambda event: self._step(1))
+        # not "break", the editor steps through the setlist with these
+        self.listbox.bind("<Prior>", lambda event: self._wheel(-self.model.height) and None)
+        self.listbox.bind("<Next>", lambda event: self._wheel(self.model.height) and None)
+
+    def render(self):
+        rows = self.model.visible()
+        self.rows.set(tuple(text for pos, text in rows))
+        self.listbox.selection_clear(0, 'end')
+        if self.model.selected is not None:
+            pos = self.model.position(self.model.selected)
+            if pos is not None and self.model.top <= pos < self.model.top + len(rows):
+                self.listbox.selection_set(pos - self.model.top)
+        self.scrollbar.set(*self.model.fraction())
+
+    def _resized(self, event):
+        lineHeight = max(1, font.Font(font = self.listbox.cget("font")).metrics("linespace") + 1)
+        height = max(1, event.height // lineHeight)
+        if height != self.model.height:
+            self.model.height = height
+            self.model.scroll_to(self.model.top)
+            self.render()
+
+    def _wheel(self, rows):
+        self.model.scroll_to(self.model.top + rows)
+        self.render()
+        return "break"
+
+    def _step(self, direction):
+        # arrow keys move the selection, as they would in a Listbox
+        pos = self.model.position(self.model.selected) if self.model.selected is not None else None
+        pos = 0 if pos is None else max(0, min(len(self.model) - 1, pos + direction))
+        if len(self.model):
+            self.selection_set(pos)
+            self.see(pos)
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def _selected(self, event):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        self.model.selected = self.model.item(self.model.top + selection[0])
+        self.event_generate("<<ListboxSelect>>")
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.model.scroll_to(int(float(args[1]) * len(self.model)))
+        elif args[0] == "scroll":
+            rows = int(args[1])
+            if args[2] == "pages":
+                rows = rows * self.model.height
+            self.model.scroll_to(self.model.top + rows)
+        self.render()
+
+    # Listbox-like methods, indexes are view positions
+    def set_items(self, items):
+        self.model.set_items(items)
+        self.render()
+
+    def set_filter(self, indexes):
+        self.model.set_filter(indexes)
+        self.render()
+
+    def filter_text(self, text):
+        self.model.filter_text(text)
+        self.render()
+
+    def insert(self, index, *items):
+        # only appending is supported
+        self.model.extend(items)
+        self.render()
+
+    def delete(self, first, last = None):
+        # only clearing is supported
+        self.model.set_items([])
+        self.render()
+
+    def size(self):
+        return len(self.model)
+
+    def curselection(self):
+        if self.model.selected is None:
+            return ()
+        pos = self.model.position(self.model.selected)
+        if pos is None:
+            return ()
+        return (pos,)
+
+    def get(self, pos):
+        if isinstance(pos, tuple):
+            pos = pos[0]
+        return self.model.items[self.model.item(pos)]
+
+    def item(self, pos):
+        # index into the full list of the row at pos
+        return self.model.item(pos)
+
+    def selection_clear(self, first = 0, last = None):
+        self.model.selected = None
+        self.render()
+
+    def selection_set(self, pos):
+        self.model.selected = self.model.item(pos)
+        self.render()
+
+    def select_item(self, item):
+        self.model.select_item(item)
+        self.render()
+
+    def see(self, pos):
+        self.model.see(pos)
+        self.render()
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+#
+# Transport metrics for zoomzt2: per sysex opcode request counts and
+# round trip latency (p50/p95/p99), time spent in each phase (connect,
+# file_check, file_download, ...), bytes and blocks per file and error /
+# retry counters. zoomzt2_shooking.py writes the report as json at the
+# end of every command that talked to the pedal. Percentiles are of a
+# random sample of at most LATENCY_SAMPLES latencies per opcode, so a
+# long sync does not keep every one.
+#
+import json
+import random
+from time import perf_counter
+
+LATENCY_SAMPLES = 1000
+
+
+def opcode_name(data):
+    # 52 00 6e XX - Zoom command XX, file commands are 60 YY
+    # 7e 00 06 01 - universal identity request
+    data = list(data)
+    if data[:3] == [0x52, 0x00, 0x6e] and len(data) > 3:
+        if data[3] == 0x60 and len(data) > 4:
+            return "{:02x} {:02x}".format(data[3], data[4])
+        return "{:02x}".format(data[3])
+    if data[:1] == [0x7e] and len(data) > 3:
+        return "7e {:02x} {:02x}".format(data[2], data[3])
+    return " ".join("{:02x}".format(b) for b in data[:2])
+
+
+def percentile(values, p):
+    # values must be sorted
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+class Phase(object):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, etype, value, tb):
+        phase = self.metrics.phases.setdefault(self.name, {'count': 0, 'seconds': 0.0})
+        phase['count'] = phase['count'] + 1
+        phase['seconds'] = phase['seconds'] + perf_counter() - self.start
+        return False
+
+
+class Metrics(object):
+    def __init__(self):
+        self.started = perf_counter()
+        self.opcodes = {}
+        self.phases = {}
+        self.files = {}
+        self.counters = {}
+
+    def request(self, data, reply, seconds):
+        name = opcode_name(data)
+        op = self.opcodes.get(name)
+        if op is None:
+            op = {'count': 0, 'bytes_out': 0, 'bytes_in': 0, 'seconds': 0.0, 'max': 0.0, 'latency': []}
+            self.opcodes[name] = op
+        op['count'] = op['count'] + 1
+        op['bytes_out'] = op['bytes_out'] + len(data) + 2
+        if reply is not None:
+            op['bytes_in'] = op['bytes_in'] + len(reply.bytes())
+        op['seconds'] = op['seconds'] + seconds
+        op['max'] = max(op['max'], seconds)
+        # reservoir sample, each latency is kept with the same chance
+        latency = op['latency']
+        if len(latency) < LATENCY_SAMPLES:
+            latency.append(seconds)
+        else:
+            n = random.randrange(op['count'])
+            if n < LATENCY_SAMPLES:
+                latency[n] = seconds
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def file(self, name, direction):
+        # per file transfer totals, updated by the caller
+        key = "{} {}".format(direction, name)
+        stats = self.files.get(key)
+        if stats is None:
+            stats = {'bytes': 0, 'blocks': 0, 'seconds': 0.0, 'transfers': 0}
+            self.files[key] = stats
+        stats['transfers'] = stats['transfers'] + 1
+        return stats
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def requests(self):
+        return sum(op['count'] for op in self.opcodes.values())
+
+    def report(self):
+        opcodes = {}
+        for name in sorted(self.opcodes):
+            op = self.opcodes[name]
+            latency = sorted(op['latency'])
+            opcodes[name] = {
+                'count': op['count'],
+                'bytes_out': op['bytes_out'],
+                'bytes_in': op['bytes_in'],
+                'total_ms': op['seconds'] * 1000,
+                'p50_ms': percentile(latency, 50) * 1000,
+                'p95_ms': percentile(latency, 95) * 1000,
+                'p99_ms': percentile(latency, 99) * 1000,
+                'max_ms': op['max'] * 1000,
+            }
+        files = {}
+        for key in sorted(self.files):
+            stats = dict(self.files[key])
+            if stats['seconds'] > 0:
+                stats['bytes_per_second'] = stats['bytes'] / stats['seconds']
+            files[key] = stats
+        return {
+            'seconds': perf_counter() - self.started,
+            'requests': self.requests(),
+            'opcodes': opcodes,
+            'phases': self.phases,
+            'files': files,
+            'counters': self.counters,
+        }
+
+    def dump(self, name):
+        with open(name, "w") as out_file:
+            json.dump(self.report(), out_file, indent = 4)
+
+
+def timed(name):
+    # method decorator, time the call as phase 'name' of self.metrics
+    def wrap(fn):
+        def inner(self, *args, **kwargs):
+            with self.metrics.phase(name):
+                return fn(self, *args, **kwargs)
+        inner.__name__ = fn.__name__
+        return inner
+    return wrap
@@ -0,0 +1,313 @@
+#!/usr/bin/python
+#
+# Patch model helpers shared by the editor and the command line tools.
+# Builds the FXM_* edit buffer messages, diffs two decoded patches
+# (as written to allpatches.json by zoomzt2_shooking.py) into the
+# fewest FXM_ID / FXM_OnOff / FXM_PN messages and caches what the
+# pedal already holds so no-op messages are never sent.
+#
+import copy
+import logging
+import mido
+
+
+# sysex payloads (without 0xf0/0xf7) for the edit buffer.
+# slot is 1 based, the pedal wants it 0 based.
+def fxm_id_data(slot, fxid, gid):
+    return [0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, slot - 1, 1, fxid & 0x7f, (fxid>>7) & 0x7f, 0, gid & 0x7f, (gid >> 7) & 0x7f]
+
+
+def fxm_pn_data(slot, pn, v):
+    return [0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, slot - 1, pn + 1, v & 0x7f, (v>>7) & 0x7f, 0, 0, 0]
+
+
+def fxm_onoff_data(slot, OnOff):
+    return [0x52, 0x00, 0x6e, 0x64, 0x03, 0x00, slot - 1, 0x00, OnOff, 0x00, 0x00, 0x00, 0x00]
+
+
+def FXM_ID(ioport, slot, fxid, gid):
+    ioport.send(mido.Message('sysex', data = fxm_id_data(slot, fxid, gid)))
+
+
+def FXM_PN(ioport, slot, pn, v):
+    ioport.send(mido.Message('sysex', data = fxm_pn_data(slot, pn, v)))
+
+
+def FXM_OnOff(ioport, slot, OnOff):
+    ioport.send(mido.Message('sysex', data = fxm_onoff_data(slot, OnOff)))
+
+
+def LoadPatch(ioport, theIndex, bankSize):
+
+    cc = mido.Message('control_change')
+    cc.channel = 0
+    cc.control = 0
+    cc.value = 0
+    ioport.send( cc )
+
+    cc.control = 0x20
+    cc.value = int(theIndex / bankSize)
+    ioport.send( cc )
+
+    pc = mido.Message('program_change')
+    pc.channel = 0
+    pc.program = theIndex % bankSize
+    ioport.send( pc )
+
+
+#--------------------------------------------------
+# Patch layout and diff
+
+def fx_key(fx):
+    return (fx['fxid'], fx['gid'])
+
+
+def is_bypass(fx):
+    return fx_key(fx) == (0, 0)
+
+
+def patch_layout(patch):
+    # walk the logical FX of a patch and place them in physical slots.
+    # heads maps the first slot of an FX to the FX,
+    # owner maps every slot an FX covers to its first slot.
+    heads = {}
+    owner = {}
+    slot = 1
+    for fx in patch.get('FX', []):
+        numSlots = max(1, fx.get('numSlots', 1))
+        heads[slot] = fx
+        for s in range(slot, slot + numSlots):
+            owner[s] = slot
+        slot = slot + numSlots
+    return heads, owner
+
+
+def param_values(fx):
+    # decoded patches keep params as [{"param1": v, ...}, {"param2": v, ...}]
+    values = []
+    for q in range(len(fx.get('Parameters', []))):
+        values.append(fx['Parameters'][q].get("param{}".format(q + 1)))
+    return values
+
+
+def default_values(fx):
+    # what the pedal loads into a slot when we change its FX ID.
+    # None where the catalog did not tell us (unresolved FX).
+    return [p.get('mdefault') for p in fx.get('Parameters', [])]
+
+
+def fxm_id_unsettles(slot, other):
+    # what an FXM_ID in slot does to the edit buffer, the one model
+    # patch_diff and CachedPort share: the new FX loads its defaults and,
+    # as it may be wider or narrower than the FX it replaces, may move
+    # every FX after it. So nothing in slot or after it is known any
+    # more. Slots are 1 based.
+    return other >= slot
+
+
+def patch_diff(current, target):
+    # Returns the list of sysex payloads which turn the edit buffer
+    # holding 'current' into 'target'.
+    #
+    # Once an FXM_ID has been sent the slots after it are not known (see
+    # fxm_id_unsettles), so their FX are sent again in full.
+    curHeads, curOwner = patch_layout(current)
+    tgtHeads, tgtOwner = patch_layout(target)
+    span = max(list(curOwner) + list(tgtOwner) + [0])
+
+    messages = []
+    # first slot an FXM_ID was sent to
+    unsettled = None
+    for slot in range(1, span + 1):
+        tfx = tgtHeads.get(slot)
+        cfx = curHeads.get(slot)
+        known = unsettled is None or not fxm_id_unsettles(unsettled, slot)
+        if tfx is None:
+            if slot in tgtOwner:
+                # covered by a multi slot FX we have already placed
+                continue
+            # target patch is shorter, clear what is left over
+            if not known or (cfx is not None and not is_bypass(cfx)):
+                messages.append(fxm_id_data(slot, 0, 0))
+                if unsettled is None:
+                    unsettled = slot
+            continue
+
+        if not known or cfx is None or fx_key(cfx) != fx_key(tfx):
+            messages.append(fxm_id_data(slot, tfx['fxid'], tfx['gid']))
+            if unsettled is None:
+                unsettled = slot
+            if is_bypass(tfx):
+                continue
+            messages.append(fxm_onoff_data(slot, 1 if tfx['enabled'] else 0))
+            base = default_values(tfx)
+        else:
+            if bool(cfx['enabled']) != bool(tfx['enabled']):
+                messages.append(fxm_onoff_data(slot, 1 if tfx['enabled'] else 0))
+            base = param_values(cfx)
+
+        values = param_values(tfx)
+        for q in range(len(values)):
+            if values[q] is None:
+                continue
+            if q >= len(base) or base[q] != values[q]:
+                messages.append(fxm_pn_data(slot, q + 1, values[q]))
+
+    logging.info("patch_diff %s -> %s: %d messages", current.get('patchname'),
+        target.get('patchname'), len(messages))
+    return messages
+
+
+def apply_patch_diff(ioport, current, target):
+    # send the diff and return what the edit buffer now holds
+    messages = patch_diff(current, target)
+    for data in messages:
+        ioport.send(mido.Message('sysex', data = data))
+    return copy.deepcopy(target), len(messages)
+
+
+#--------------------------------------------------
+# Output state cache
+
+FXM_HEADER = (0x52, 0x00, 0x6e, 0x64, 0x03, 0x00)
+FXM_KINDS = {0: 'onoff', 1: 'id'}
+
+
+def fxm_decode(msg):
+    # (slot, kind, value) for an FXM_* sysex, None for anything else.
+    # kind 0 is on/off, 1 is FX ID, 2 onwards are parameters 1..n
+    if msg.type != 'sysex' or len(msg.data) != 13 or tuple(msg.data[:6]) != FXM_HEADER:
+        return None
+    return msg.data[6], msg.data[7], tuple(msg.data[8:13])
+
+
+class CachedPort(object):
+    # Sits between the application and a mido port, remembers the last
+    # value sent (or reported by the pedal) per bank select CC and per
+    # (slot, onoff/id/param) and drops messages that would not change
+    # anything. Everything else is passed through to the port.
+
+    def __init__(self, port):
+        self.port = port
+        self.bank = {}
+        self.state = {}
+        self.counters = {'sent': 0, 'dropped': 0, 'dropped_bank': 0, 'dropped_onoff': 0,
+            'dropped_id': 0, 'dropped_param': 0, 'invalidated': 0, 'incoming': 0}
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def invalidate(self, bank = False):
+        # forget the edit buffer, eg. on patch change
+        self.state = {}
+        if bank:
+            self.bank = {}
+        self.counters['invalidated'] = self.counters['invalidated'] + 1
+
+    def seed(self, patch):
+        # we just loaded this (decoded) patch, so we know what the pedal holds
+        self.state = {}
+        heads, owner = patch_layout(patch)
+        for slot in heads:
+            fx = heads[slot]
+            self.state[slot - 1, 1] = tuple(fxm_id_data(slot, fx['fxid'], fx['gid'])[8:13])
+            self.state[slot - 1, 0] = tuple(fxm_onoff_data(slot, 1 if fx['enabled'] else 0)[8:13])
+            values = param_values(fx)
+            for q in range(len(values)):
+                if values[q] is not None:
+                    self.state[slot - 1, q + 2] = tuple(fxm_pn_data(slot, q + 1, values[q])[8:13])
+
+    def note_incoming(self, msg):
+        # keep track of edits made on the pedal itself
+        self.counters['incoming'] = self.counters['incoming'] + 1
+        if msg.type == 'program_change':
+            # patch changed with the footswitches, bank may have changed too
+            self.invalidate(bank = True)
+        elif msg.type == 'control_change' and msg.control in (0x00, 0x20):
+            self.bank[msg.channel, msg.control] = msg.value
+        else:
+            fxm = fxm_decode(msg)
+            if fxm is not None:
+                self.update(*fxm)
+
+    def poll(self):
+        if hasattr(self.port, 'iter_pending'):
+            for msg in self.port.iter_pending():
+                self.note_incoming(msg)
+
+    def iter_pending(self):
+        for msg in self.port.iter_pending():
+            self.note_incoming(msg)
+            yield msg
+
+    def update(self, slot, kind, value):
+        if kind == 1:
+            # new FX loads its defaults and may move the FX after it,
+            # see fxm_id_unsettles (state slots are 0 based)
+            self.state = dict((key, v) for key, v in self.state.items()
+                if not fxm_id_unsettles(slot + 1, key[0] + 1))
+        self.state[slot, kind] = value
+
+    def drop(self, what):
+        self.counters['dropped'] = self.counters['dropped'] + 1
+        self.counters['dropped_' + what] = self.counters['dropped_' + what] + 1
+        return False
+
+    def send(self, msg):
+        self.poll()
+        if msg.type == 'control_change' and msg.control in (0x00, 0x20):
+            if self.bank.get((msg.channel, msg.control)) == msg.value:
+                return self.drop('bank')
+            self.bank[msg.channel, msg.control] = msg.value
+        elif msg.type == 'program_change':
+            self.invalidate()
+        else:
+            fxm = fxm_decode(msg)
+            if fxm is not None:
+                slot, kind, value = fxm
+                if self.state.get((slot, kind)) == value:
+                    return self.drop(FXM_KINDS.get(kind, 'param'))
+                self.update(slot, kind, value)
+        self.port.send(msg)
+        self.counters['sent'] = self.counters['sent'] + 1
+        return True
+
+    def stats(self):
+        return dict(self.counters)
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+    import json
+
+    usage = "usage: %prog [options] ALLPATCHES.JSON FROM TO"
+    parser = OptionParser(usage)
+    parser.add_option("-s", "--send",
+        help="send the diff to the attached device",
+        action="store_true", dest="send")
+    (options, args) = parser.parse_args()
+    if len(args) != 3:
+        parser.error("ALLPATCHES.JSON, FROM and TO patch numbers required")
+
+    with open(args[0], 'r') as patchesFile:
+        rawPatches = json.load(patchesFile)
+    current = rawPatches[int(args[1])]
+    target = rawPatches[int(args[2])]
+
+    messages = patch_diff(current, target)
+    for data in messages:
+        print(" ".join("{0:#0{1}x}".format(m, 4) for m in data))
+    print("{} messages".format(len(messages)))
+
+    if options.send:
+        from zoomdevice import find_ports
+        for inName, outName in find_ports():
+            with mido.open_output(outName) as outport:
+                for data in messages:
+                    outport.send(mido.Message('sysex', data = data))
+            break
+
+
+if __name__ == "__main__":
+    main()
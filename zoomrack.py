@@ -0,0 +1,255 @@
+#!/usr/bin/python
+#
+# Work with every attached Zoom pedal at once.
+#
+#   python3 zoomrack.py -l                       list pedals
+#   python3 zoomrack.py sync                     back up every pedal (like -R)
+#   python3 zoomrack.py patches DIR              upload patch_N files from DIR
+#   python3 zoomrack.py install FILE.ZD2 ...     install effects on every pedal
+#   python3 zoomrack.py send FLST_SEQ.ZT2        send the same effect list
+#   python3 zoomrack.py snapshot                 snapshot every pedal
+#   python3 zoomrack.py restore [ARCHIVE]        restore (their own) snapshot
+#
+# Each pedal gets its own zoomzt2 session and output directory (under
+# rack/ by default), the jobs run in parallel in a pool of threads.
+#
+import logging
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from zoomzt2_shooking import zoomzt2, midiname
+from zoomdevice import find_ports
+from zoomflow import FlowSettings
+from zoomsnapshot import snapshot, restore, describe
+
+# each pedal's snapshot, in its directory
+SNAPSHOT_NAME = "snapshot.zarc"
+
+
+def safe_name(port):
+    # port name to a directory name
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', port).strip('_')
+
+
+class Device(object):
+    def __init__(self, portNames, outdir, backend = None):
+        self.portNames = portNames
+        self.name = portNames[0]
+        self.outdir = outdir
+        # talk to this instead of the ports (see zoomzt2.backend)
+        self.backend = backend
+        self.pedal = None
+        self.status = "idle"
+        self.done = 0
+        self.total = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.error = None
+
+    def throughput(self):
+        if self.seconds > 0:
+            return self.bytes / self.seconds
+        return 0
+
+
+#--------------------------------------------------
+# jobs, called with a connected zoomzt2
+
+def job_sync(pedal):
+    pedal.sync()
+
+
+def job_patches(pedal, patchdir):
+    names = []
+    for i in range(pedal.numPatches):
+        name = os.path.join(patchdir, "patch_{}".format(i))
+        if os.path.exists(name):
+            names.append((i, name))
+    patches = []
+    for i, name in names:
+        with open(name, "rb") as infile:
+            patches.append((i, infile.read()))
+    pedal.step("patches", 0, len(patches))
+    pedal.patch_upload_many(patches)
+
+
+def job_install(pedal, names):
+    # upload the ZD2s and add them to the pedal's FLST_SEQ
+    pedal.file_check("FLST_SEQ.ZT2")
+    flst = pedal.file_download("FLST_SEQ.ZT2")
+    pedal.file_close()
+    for n, name in enumerate(names):
+        pedal.step("install", n, len(names))
+        with open(name, "rb") as infile:
+            data = infile.read()
+        pedal.file_check(name)
+        pedal.file_upload(name, data)
+        pedal.file_close()
+        flst = pedal.add_effect_from_filename(flst, name)
+    pedal.file_check("FLST_SEQ.ZT2")
+    pedal.file_upload("FLST_SEQ.ZT2", flst)
+    pedal.file_close()
+    pedal.step("install", len(names), len(names))
+
+
+def job_send(pedal, name):
+    with open(name, "rb") as infile:
+        data = infile.read()
+    pedal.step("send", 0, 1)
+    pedal.file_check("FLST_SEQ.ZT2")
+    pedal.file_upload("FLST_SEQ.ZT2", data)
+    pedal.file_close()
+    pedal.step("send", 1, 1)
+
+
+def job_snapshot(pedal):
+    # only effects changed since the last snapshot are downloaded
+    counts = snapshot(pedal, pedal.path(SNAPSHOT_NAME))
+    logging.info("%s: %s", pedal.portName, counts)
+
+
+def job_restore(pedal, name, prune):
+    changes = restore(pedal, name or pedal.path(SNAPSHOT_NAME), prune)
+    for line in describe(changes):
+        logging.info("%s: %s", pedal.portName, line)
+
+
+#--------------------------------------------------
+class DeviceManager(object):
+    def __init__(self, root = "rack", midiname = midiname, workers = None, adaptiveFlow = False,
+            devices = None):
+        # devices, if given, instead of every pedal found
+        self.root = root
+        self.workers = workers
+        self.lock = threading.Lock()
+        # uploads tune themselves per model if asked, see zoomflow.py
+        self.flowSettings = FlowSettings() if adaptiveFlow else None
+        if devices is not None:
+            self.devices = list(devices)
+            return
+        self.devices = []
+        for portNames in find_ports(midiname):
+            self.devices.append(Device(portNames,
+                os.path.join(root, safe_name(portNames[0]))))
+
+    def show(self, device):
+        # one line per update, devices run in parallel so lines interleave
+        with self.lock:
+            if device.total:
+                print("{}: {} {}/{}".format(device.name, device.status, device.done, device.total))
+            else:
+                print("{}: {}".format(device.name, device.status))
+            sys.stdout.flush()
+
+    def _progress(self, device):
+        def progress(pedal, what, done, total):
+            device.status = what
+            device.done = done
+            device.total = total
+            self.show(device)
+        return progress
+
+    def _run(self, device, job, args):
+        if not os.path.exists(device.outdir):
+            os.makedirs(device.outdir)
+        pedal = zoomzt2(device.portNames, device.outdir)
+        if device.backend is not None:
+            pedal.backend = device.backend
+        pedal.progress = self._progress(device)
+        pedal.flowSettings = self.flowSettings
+        device.pedal = pedal
+        device.done = 0
+        device.total = 0
+        device.error = None
+        start = perf_counter()
+        try:
+            device.status = "connecting"
+            self.show(device)
+            if not pedal.connect():
+                raise IOError("unable to open {}".format(device.name))
+            try:
+                job(pedal, *args)
+            finally:
+                pedal.disconnect()
+            device.status = "done"
+        except Exception as e:
+            logging.exception("%s failed", device.name)
+            device.error = e
+            device.status = "failed ({})".format(e)
+        device.seconds = perf_counter() - start
+        device.bytes = sum(stats['bytes'] for stats in pedal.metrics.files.values())
+        pedal.metrics.dump(os.path.join(device.outdir, "metrics.json"))
+        self.show(device)
+        return device
+
+    def run(self, job, *args):
+        # run job(pedal, *args) on every device, returns the devices which failed
+        workers = self.workers or max(1, len(self.devices))
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            list(pool.map(lambda device: self._run(device, job, args), self.devices))
+        return [device for device in self.devices if device.error is not None]
+
+    def report(self):
+        for device in self.devices:
+            print("{:40} {:>10} bytes {:8.1f}s {:10.0f} bytes/s  {}".format(device.name,
+                device.bytes, device.seconds, device.throughput(), device.status))
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] sync | patches DIR | install FILE.ZD2 ... | send FLST_SEQ.ZT2\n" \
+        "       | snapshot | restore [ARCHIVE]"
+    parser = OptionParser(usage)
+    parser.add_option("-l", "--list",
+        help="list attached pedals", action="store_true", dest="list")
+    parser.add_option("-o", "--output",
+        help="directory for each pedal's files (default rack)", dest="output", default="rack")
+    parser.add_option("-j", "--jobs",
+        help="number of pedals to work on at once (default all)", dest="jobs")
+    parser.add_option("--prune",
+        help="restore deletes effects the snapshot does not list", action="store_true", dest="prune")
+    parser.add_option("--adaptive-flow",
+        help="tune upload block size and window to the pedal (see zoomflow.py)",
+        action="store_true", dest="adaptiveflow")
+    (options, args) = parser.parse_args()
+
+    manager = DeviceManager(options.output, workers = int(options.jobs) if options.jobs else None,
+        adaptiveFlow = options.adaptiveflow)
+    if options.list or not args:
+        for device in manager.devices:
+            print("{} -> {}".format(" / ".join(device.portNames), device.outdir))
+        if not args:
+            return
+
+    if not manager.devices:
+        sys.exit("Unable to find Pedal")
+
+    command = args[0]
+    if command == "sync":
+        failed = manager.run(job_sync)
+    elif command == "patches" and len(args) == 2:
+        failed = manager.run(job_patches, os.path.abspath(args[1]))
+    elif command == "install" and len(args) > 1:
+        failed = manager.run(job_install, [os.path.abspath(name) for name in args[1:]])
+    elif command == "send" and len(args) == 2:
+        failed = manager.run(job_send, os.path.abspath(args[1]))
+    elif command == "snapshot" and len(args) == 1:
+        failed = manager.run(job_snapshot)
+    elif command == "restore" and len(args) <= 2:
+        failed = manager.run(job_restore, os.path.abspath(args[1]) if len(args) == 2 else None, options.prune)
+    else:
+        parser.error("unknown command")
+
+    manager.report()
+    if failed:
+        sys.exit("{} of {} pedals failed".format(len(failed), len(manager.devices)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+#
+# Record and replay MIDI sessions with the pedal.
+#
+# Record with:
+#   python3 zoomzt2_shooking.py --record sync.zrec -R -w my_pedal.zt2
+# Every message through sniffMidiOut/sniffMidiIn is written with its
+# (monotonic) time since the start of the session, along with the
+# command line used.
+#
+# Replay with:
+#   python3 zoomreplay.py sync.zrec [--speed 0]
+# which re-runs the same command against the recorded replies, at the
+# original speed (1), faster (>1) or as fast as possible (0), and
+# reports how long it took. The replay runs in a directory of its own,
+# files the command line names which were in the directory it was
+# recorded in are copied there first (see stage_inputs).
+#
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from time import perf_counter, sleep
+import mido
+
+MAGIC = b"ZREC"
+RECORD = struct.Struct('<BdI')
+
+DIR_OUT = 0
+DIR_IN = 1
+
+
+class Recorder(object):
+    def __init__(self, name, argv = None):
+        self.outfile = open(name, "wb")
+        header = json.dumps({'argv': argv or [], 'cwd': os.getcwd(), 'version': 1}).encode()
+        self.outfile.write(MAGIC)
+        self.outfile.write(struct.pack('<I', len(header)))
+        self.outfile.write(header)
+        self.start = perf_counter()
+
+    def add(self, direction, mtype, data):
+        if mtype == "sysex":
+            raw = b"\xf0" + bytes(data) + b"\xf7"
+        else:
+            raw = bytes(data)
+        self.outfile.write(RECORD.pack(direction, perf_counter() - self.start, len(raw)))
+        self.outfile.write(raw)
+
+    def close(self):
+        if self.outfile is not None:
+            self.outfile.close()
+            self.outfile = None
+
+
+def load_session(name):
+    # returns header dict and list of (direction, time, bytes)
+    with open(name, "rb") as infile:
+        data = infile.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("{} is not a session recording".format(name))
+    pos = len(MAGIC)
+    (length,) = struct.unpack_from('<I', data, pos)
+    pos = pos + 4
+    header = json.loads(data[pos:pos + length].decode())
+    pos = pos + length
+    records = []
+    while pos + RECORD.size <= len(data):
+        direction, stamp, length = RECORD.unpack_from(data, pos)
+        pos = pos + RECORD.size
+        records.append((direction, stamp, data[pos:pos + length]))
+        pos = pos + length
+    return header, records
+
+
+def stage_inputs(argv, cwd, workdir):
+    # argv with the files it names relative to cwd (where it was
+    # recorded) made available in workdir: copied if they are under cwd,
+    # so anything written to them stays in workdir, otherwise made
+    # absolute. Returns the new argv.
+    staged = []
+    for arg in argv:
+        prefix, value = "", arg
+        if arg.startswith("--") and "=" in arg:
+            prefix, value = arg.split("=", 1)
+            prefix = prefix + "="
+        elif arg.startswith("-"):
+            staged.append(arg)
+            continue
+        source = os.path.join(cwd, value)
+        if value and not os.path.isabs(value) and os.path.isfile(source):
+            relative = os.path.normpath(value)
+            if relative.startswith(os.pardir):
+                value = os.path.abspath(source)
+            else:
+                target = os.path.join(workdir, relative)
+                if not os.path.exists(target):
+                    if os.path.dirname(relative):
+                        os.makedirs(os.path.dirname(target), exist_ok = True)
+                    shutil.copy2(source, target)
+        staged.append(prefix + value)
+    return staged
+
+
+class ReplaySession(object):
+    # Plays back the recorded replies in order. Messages we send are
+    # compared with what was recorded, mismatches are counted but the
+    # replay carries on so timing runs still complete.
+    def __init__(self, records, speed = 1.0):
+        self.records = records
+        self.speed = float(speed)
+        self.pos = 0
+        self.mismatches = 0
+        self.sent = 0
+        self.received = 0
+        self.lastClock = perf_counter()
+        self.lastStamp = 0.0
+
+    @classmethod
+    def load(cls, name, speed = 1.0):
+        header, records = load_session(name)
+        return cls(records, speed)
+
+    def ports(self):
+        return ReplayInput(self), ReplayOutput(self)
+
+    def _next(self, direction):
+        # skip over anything recorded in the other direction
+        while self.pos < len(self.records):
+            record = self.records[self.pos]
+            self.pos = self.pos + 1
+            if record[0] == direction:
+                return record
+            # a message we did not send, or a reply we did not read
+            self.mismatches = self.mismatches + 1
+        return None
+
+    def send(self, msg):
+        self.sent = self.sent + 1
+        record = self._next(DIR_OUT)
+        if record is None or bytes(msg.bytes()) != record[2]:
+            self.mismatches = self.mismatches + 1
+            logging.warning("replay: sent message differs from recording at %d", self.pos)
+        if record is not None:
+            self.lastStamp = record[1]
+        self.lastClock = perf_counter()
+
+    def receive(self):
+        record = self._next(DIR_IN)
+        if record is None:
+            raise IOError("replay: recording exhausted")
+        if self.speed > 0:
+            wait = self.lastClock + (record[1] - self.lastStamp) / self.speed - perf_counter()
+            if wait > 0:
+                sleep(wait)
+        self.lastStamp = record[1]
+        self.lastClock = perf_counter()
+        self.received = self.received + 1
+        return mido.Message.from_bytes(record[2])
+
+    def report(self):
+        return {'sent': self.sent, 'received': self.received,
+            'mismatches': self.mismatches, 'remaining': len(self.records) - self.pos}
+
+
+class ReplayInput(object):
+    def __init__(self, session):
+        self.session = session
+
+    def receive(self):
+        return self.session.receive()
+
+    def close(self):
+        pass
+
+
+class ReplayOutput(object):
+    def __init__(self, session):
+        self.session = session
+
+    def send(self, msg):
+        self.session.send(msg)
+
+    def close(self):
+        pass
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+    import zoomzt2_shooking
+
+    usage = "usage: %prog [options] SESSION.ZREC"
+    parser = OptionParser(usage)
+    parser.add_option("-s", "--speed",
+        help="replay speed, 1 original, 10 ten times faster, 0 as fast as possible",
+        dest="speed", default="1")
+    parser.add_option("-d", "--dir",
+        help="directory to run in (default a new temporary directory)", dest="dir")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("SESSION not specified")
+
+    header, records = load_session(args[0])
+    session = ReplaySession(records, float(options.speed))
+
+    workdir = os.path.abspath(options.dir or tempfile.mkdtemp(prefix = "zoomreplay"))
+    argv = header['argv'][1:]
+    if 'cwd' in header:
+        argv = stage_inputs(argv, header['cwd'], workdir)
+    os.chdir(workdir)
+
+    zoomzt2_shooking.zoomzt2.backend = session
+    sys.argv = ["zoomzt2_shooking.py"] + argv
+    print("Replaying {} in {}".format(" ".join(sys.argv), workdir))
+    start = perf_counter()
+    try:
+        zoomzt2_shooking.main()
+    except SystemExit:
+        pass
+    elapsed = perf_counter() - start
+
+    result = session.report()
+    result['seconds'] = elapsed
+    result['recorded_seconds'] = records[-1][1] if records else 0
+    print(json.dumps(result, indent = 4))
+
+
+if __name__ == "__main__":
+    main()
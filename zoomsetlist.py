@@ -0,0 +1,178 @@
+#!/usr/bin/python
+#
+# Setlist engine for live patch switching.
+# Each entry is compiled once into its MIDI messages (bank select +
+# program change), bank selects are skipped when the bank does not
+# change and the trigger to sent time of every switch is recorded.
+#
+# Setlist file is json, a list of patch numbers or {"patch": n, "name": ".."}
+#
+import json
+import logging
+import sys
+from time import perf_counter
+import mido
+
+from zoomdevice import find_ports, MIDINAME
+
+
+class Setlist(object):
+    def __init__(self, entries, bankSize, channel = 0):
+        self.entries = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                self.entries.append({'patch': int(entry['patch']), 'name': entry.get('name', "")})
+            else:
+                self.entries.append({'patch': int(entry), 'name': ""})
+        self.bankSize = bankSize
+        self.channel = channel
+        self.position = -1
+        # bank the pedal is on, None when we don't know
+        self.currentBank = None
+        self.timings = []
+        self.skippedBanks = 0
+        self.compiled = [self.compile(entry['patch']) for entry in self.entries]
+
+    @classmethod
+    def load(cls, name, bankSize, channel = 0):
+        with open(name, 'r') as setFile:
+            return cls(json.load(setFile), bankSize, channel)
+
+    def compile(self, theIndex):
+        # same messages as LoadPatch, made once rather than per switch
+        bank = int(theIndex / self.bankSize)
+        return {
+            'bank': bank,
+            'bankMsgs': [mido.Message('control_change', channel = self.channel, control = 0x00, value = 0),
+                mido.Message('control_change', channel = self.channel, control = 0x20, value = bank)],
+            'programMsgs': [mido.Message('program_change', channel = self.channel,
+                program = theIndex % self.bankSize)],
+        }
+
+    def invalidate(self):
+        # something else switched patches, resend the bank next time
+        self.currentBank = None
+
+    def send(self, outport, position):
+        start = perf_counter()
+        entry = self.compiled[position]
+        if entry['bank'] != self.currentBank:
+            for m in entry['bankMsgs']:
+                outport.send(m)
+            self.currentBank = entry['bank']
+        else:
+            self.skippedBanks = self.skippedBanks + 1
+        for m in entry['programMsgs']:
+            outport.send(m)
+        elapsed = perf_counter() - start
+        self.timings.append(elapsed)
+        self.position = position
+        logging.info("setlist %d patch %d sent in %.3fms", position,
+            self.entries[position]['patch'], elapsed * 1000)
+        return self.entries[position]
+
+    def goto(self, outport, position):
+        if position < 0 or position >= len(self.entries):
+            return None
+        return self.send(outport, position)
+
+    def next(self, outport):
+        return self.goto(outport, min(self.position + 1, len(self.entries) - 1))
+
+    def prev(self, outport):
+        return self.goto(outport, max(self.position - 1, 0))
+
+    def report(self):
+        if not self.timings:
+            return {'switches': 0, 'skippedBanks': self.skippedBanks}
+        times = sorted(self.timings)
+        return {
+            'switches': len(times),
+            'skippedBanks': self.skippedBanks,
+            'min_ms': times[0] * 1000,
+            'mean_ms': sum(times) / len(times) * 1000,
+            'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+            'max_ms': times[-1] * 1000,
+        }
+
+
+def open_port(midiname = MIDINAME):
+    # output to the first pedal found, None if there is none
+    pairs = find_ports(midiname)
+    if not pairs:
+        return None
+    return mido.open_output(pairs[0][1])
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] SETLIST.JSON"
+    parser = OptionParser(usage)
+    parser.add_option("-m", "--model",
+        help="model.dat written by zoomzt2_shooking.py (for bankSize)",
+        dest="model", default="model.dat")
+    parser.add_option("-b", "--banksize",
+        help="patches per bank, overrides model.dat", dest="bankSize")
+    parser.add_option("-f", "--foot",
+        help="drive setlist from MIDI input port (foot controller)", dest="foot")
+    parser.add_option("-n", "--next-cc",
+        help="foot controller CC for next entry (default 80)", dest="nextCC", default="80")
+    parser.add_option("-p", "--prev-cc",
+        help="foot controller CC for previous entry (default 81)", dest="prevCC", default="81")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("SETLIST not specified")
+
+    if options.bankSize:
+        bankSize = int(options.bankSize)
+    else:
+        with open(options.model, 'r') as modelFile:
+            bankSize = int(json.load(modelFile)['bankSize'])
+
+    setlist = Setlist.load(args[0], bankSize)
+
+    outport = open_port()
+    if outport is None:
+        sys.exit("Unable to find Pedal")
+
+    if options.foot:
+        # program change selects entry, CCs step through the list
+        inport = mido.open_input(options.foot)
+        for msg in inport:
+            if msg.type == 'program_change':
+                entry = setlist.goto(outport, msg.program)
+            elif msg.type == 'control_change' and msg.value > 0 and msg.control == int(options.nextCC):
+                entry = setlist.next(outport)
+            elif msg.type == 'control_change' and msg.value > 0 and msg.control == int(options.prevCC):
+                entry = setlist.prev(outport)
+            else:
+                continue
+            if entry is not None:
+                print("[{}] patch {} {}".format(setlist.position, entry['patch'], entry['name']))
+    else:
+        print("enter: next, p: previous, number: goto entry, q: quit")
+        while True:
+            cmd = sys.stdin.readline()
+            if not cmd or cmd.strip() == "q":
+                break
+            cmd = cmd.strip()
+            if cmd == "":
+                entry = setlist.next(outport)
+            elif cmd == "p":
+                entry = setlist.prev(outport)
+            elif cmd.isdigit():
+                entry = setlist.goto(outport, int(cmd))
+            else:
+                continue
+            if entry is not None:
+                print("[{}] patch {} {} ({:.3f}ms)".format(setlist.position, entry['patch'],
+                    entry['name'], setlist.timings[-1] * 1000))
+
+    print(json.dumps(setlist.report(), indent = 4))
+    outport.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+#
+# Find similar and near duplicate patches.
+#
+# Each decoded patch (allpatches.json) becomes a row of a matrix with a
+# column for each effect in the catalog (allfx.json), 1 if the patch
+# uses it (0.5 if it is off), followed by a column for each of its
+# parameters holding value / mmax. Patches are compared by euclidean
+# distance between rows, so the order of the effects does not matter.
+#
+#   python3 zoomsimilar.py mypedal                  list patches
+#   python3 zoomsimilar.py -l 12 mypedal otherpedal  patches like #12
+#   python3 zoomsimilar.py -d -t 0.05 mypedal otherpedal
+#
+# Needs numpy.
+#
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+
+def fx_key(fx):
+    return (fx['fxid'], fx['gid'])
+
+
+class PatchMatrix(object):
+    def __init__(self, patches, total_pedal, labels = None):
+        self.patches = patches
+        self.labels = labels or ["[{}] {}".format(i, p['patchname'].strip()) for i, p in enumerate(patches)]
+        # (fxid, gid) -> first column, number of parameter columns
+        self.columns = {}
+        scales = []
+        for entry in total_pedal:
+            key = fx_key(entry['FX'])
+            if key == (0, 0) or key in self.columns:
+                continue
+            self.columns[key] = (len(scales), len(entry['Parameters']))
+            scales.append(1.0)
+            scales.extend(max(1, p.get('mmax', 1)) for p in entry['Parameters'])
+        # effects the catalog did not know, we only know they are there
+        for patch in patches:
+            for fx in patch.get('FX', []):
+                key = fx_key(fx)
+                if key != (0, 0) and key not in self.columns:
+                    self.columns[key] = (len(scales), 0)
+                    scales.append(1.0)
+
+        self.matrix = np.zeros((len(patches), len(scales)), dtype = np.float32)
+        for row, patch in enumerate(patches):
+            for fx in patch.get('FX', []):
+                key = fx_key(fx)
+                if key == (0, 0):
+                    continue
+                col, numParams = self.columns[key]
+                self.matrix[row, col] += 1.0 if fx['enabled'] else 0.5
+                for q in range(min(numParams, len(fx.get('Parameters', [])))):
+                    value = fx['Parameters'][q].get("param{}".format(q + 1))
+                    if value is not None:
+                        self.matrix[row, col + 1 + q] += value
+        self.matrix /= np.array(scales, dtype = np.float32)
+        self.norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.patches)
+
+    def distances(self, rows):
+        # euclidean distance from each of rows to every patch
+        rows = np.asarray(rows)
+        d = self.norms[rows][:, None] + self.norms[None, :] - 2 * self.matrix[rows].dot(self.matrix.T)
+        np.maximum(d, 0, out = d)
+        return np.sqrt(d)
+
+    def nearest_many(self, rows, k = 5):
+        # (indices, distances) of the k nearest other patches, a row per query
+        rows = np.asarray(rows)
+        d = self.distances(rows)
+        d[np.arange(len(rows)), rows] = np.inf
+        k = min(k, len(self.patches) - 1)
+        if k <= 0:
+            return np.zeros((len(rows), 0), dtype = int), np.zeros((len(rows), 0))
+        idx = np.argpartition(d, k - 1, axis = 1)[:, :k]
+        part = np.take_along_axis(d, idx, axis = 1)
+        order = np.argsort(part, axis = 1)
+        return np.take_along_axis(idx, order, axis = 1), np.take_along_axis(part, order, axis = 1)
+
+    def nearest(self, row, k = 5):
+        idx, dist = self.nearest_many([row], k)
+        return [(int(j), float(v)) for j, v in zip(idx[0], dist[0])]
+
+    def duplicates(self, threshold = 0.05, block = 1024):
+        # pairs (i, j, distance), i < j, closer than threshold.
+        # done a block of rows at a time to keep memory bounded.
+        pairs = []
+        n = len(self.patches)
+        for start in range(0, n, block):
+            rows = np.arange(start, min(n, start + block))
+            d = self.distances(rows)
+            ii, jj = np.nonzero((d <= threshold) & (np.arange(n)[None, :] > rows[:, None]))
+            pairs.extend(zip(rows[ii].tolist(), jj.tolist(), d[ii, jj].tolist()))
+        return pairs
+
+
+def load_dirs(dirs):
+    # patches, merged catalog and labels from one or more sync directories
+    patches = []
+    total_pedal = []
+    labels = []
+    for dirname in dirs:
+        with open(os.path.join(dirname, "allfx.json"), "r") as fxFile:
+            total_pedal.extend(json.load(fxFile))
+        with open(os.path.join(dirname, "allpatches.json"), "r") as patchesFile:
+            these = json.load(patchesFile)
+        for i, patch in enumerate(these):
+            labels.append("{} [{}] {}".format(dirname, patch.get('location', i), patch['patchname'].strip()))
+        patches.extend(these)
+    return patches, total_pedal, labels
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] DIR..."
+    parser = OptionParser(usage)
+    parser.add_option("-l", "--like",
+        help="show patches like patch N (as numbered in the listing)", dest="like")
+    parser.add_option("-k", "--count",
+        help="number of similar patches to show (default 5)", dest="count", default="5")
+    parser.add_option("-d", "--duplicates",
+        help="show near duplicate patches", action="store_true", dest="duplicates")
+    parser.add_option("-t", "--threshold",
+        help="distance below which patches are duplicates (default 0.05)",
+        dest="threshold", default="0.05")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("DIR not specified")
+
+    patches, total_pedal, labels = load_dirs(args)
+    start = perf_counter()
+    matrix = PatchMatrix(patches, total_pedal, labels)
+    print("{} patches, {} features ({:.1f}ms)".format(len(matrix), matrix.matrix.shape[1],
+        (perf_counter() - start) * 1000))
+
+    if options.like is not None:
+        row = int(options.like)
+        start = perf_counter()
+        found = matrix.nearest(row, int(options.count))
+        print("Like {} ({:.1f}ms):".format(labels[row], (perf_counter() - start) * 1000))
+        for j, dist in found:
+            print("  {:6.3f} {:4} {}".format(dist, j, labels[j]))
+    elif options.duplicates:
+        start = perf_counter()
+        pairs = matrix.duplicates(float(options.threshold))
+        print("{} pairs ({:.1f}ms)".format(len(pairs), (perf_counter() - start) * 1000))
+        for i, j, dist in pairs:
+            print("  {:6.3f} {} == {}".format(dist, labels[i], labels[j]))
+    else:
+        for i, label in enumerate(labels):
+            print("{:4} {}".format(i, label))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+#
+# Snapshot and restore a whole pedal.
+#
+#   python3 zoomsnapshot.py save pedal.zarc
+#   python3 zoomsnapshot.py restore pedal.zarc          only what differs
+#   python3 zoomsnapshot.py restore -n pedal.zarc       show what would be
+#   python3 zoomsnapshot.py list pedal.zarc
+#
+# A snapshot is a compressed zoomarchive holding FLST_SEQ.ZT2, every
+# effect it lists, every patch (patch_N, as written by allpatches) and
+# snapshot.json, the pedal's profile (as model.dat) and what is in the
+# archive. Saving over an earlier snapshot of the same model only
+# downloads the effects whose version changed, the rest come from it.
+#
+# Restoring checks the archive's checksums, then compares it with the
+# pedal: effects missing from the pedal or listed with another version
+# are uploaded, then FLST_SEQ if it differs, then the patches which
+# differ. --prune also deletes effects the snapshot does not list.
+#
+import json
+import logging
+import os
+import sys
+from time import strftime
+
+from zoomzt2_shooking import zoomzt2, ZT2
+from zoomarchive import ZoomArchive, write_archive
+from zoomflow import FlowSettings
+
+SNAPSHOT = "snapshot.json"
+FLST = "FLST_SEQ.ZT2"
+# what connect() learns about the pedal
+PROFILE = ("model", "numPatches", "bankSize", "ptcSize", "version", "gce3version", "maxFX")
+
+
+def patch_member(location):
+    return "patch_{}".format(location)
+
+
+def listed_effects(flst):
+    # {name: version} of the effects FLST_SEQ lists
+    config = ZT2.parse(flst)
+    return dict((effect['effect'], effect['version'].strip())
+        for group in config[1] for effect in group['effects'])
+
+
+def read_file(pedal, name):
+    # a file from the pedal, None if it is not there
+    if not pedal.file_check(name):
+        return None
+    data = pedal.file_download(name)
+    pedal.file_close()
+    return bytes(data)
+
+
+def open_base(name, model):
+    # an earlier snapshot of the same model, None if there is none
+    if name is None or not os.path.exists(name):
+        return None
+    try:
+        archive = ZoomArchive(name)
+    except (IOError, OSError, ValueError) as e:
+        logging.warning("Not using %s: %s", name, e)
+        return None
+    if SNAPSHOT not in archive or FLST not in archive \
+            or archive.json(SNAPSHOT)['profile']['model'] != model:
+        archive.close()
+        return None
+    return archive
+
+
+def snapshot(pedal, name, base = None, workers = None):
+    # everything on a connected pedal into archive name. Effects with
+    # the same version in base (an earlier snapshot, name by default)
+    # are taken from it. Returns what was done.
+    if base is None:
+        base = name
+    counts = {'effects': 0, 'reused': 0, 'missing': 0, 'patches': 0}
+    old = open_base(base, pedal.model)
+    try:
+        oldEffects = listed_effects(old.read(FLST)) if old is not None else {}
+        flst = read_file(pedal, FLST)
+        if flst is None:
+            raise IOError("{} not found on pedal".format(FLST))
+        members = [(FLST, flst)]
+        effects = listed_effects(flst)
+        names = sorted(effects)
+        for n, effect in enumerate(names):
+            pedal.step("effects", n, len(names))
+            if old is not None and effect in old and oldEffects.get(effect) == effects[effect]:
+                data = old.read(effect)
+                counts['reused'] = counts['reused'] + 1
+            else:
+                data = read_file(pedal, effect)
+                if data is None:
+                    logging.warning("%s is listed but not on the pedal", effect)
+                    counts['missing'] = counts['missing'] + 1
+                    continue
+                counts['effects'] = counts['effects'] + 1
+            members.append((effect, data))
+        pedal.step("effects", len(names), len(names))
+    finally:
+        # it may be the file we are about to replace
+        if old is not None:
+            old.close()
+
+    locations = []
+    for i in range(pedal.numPatches):
+        pedal.step("patches", i, pedal.numPatches)
+        data = pedal.patch_download(i)
+        if data:
+            members.append((patch_member(i), bytes(data)))
+            locations.append(i)
+    pedal.step("patches", pedal.numPatches, pedal.numPatches)
+    counts['patches'] = len(locations)
+
+    manifest = {
+        'profile': dict((key, getattr(pedal, key)) for key in PROFILE),
+        'port': pedal.portName,
+        'written': strftime("%Y-%m-%d %H:%M:%S"),
+        'effects': dict((member, effects[member]) for member, data in members[1:] if member in effects),
+        'patches': locations,
+    }
+    members.insert(0, (SNAPSHOT, json.dumps(manifest, indent = 4).encode()))
+    write_archive(name, members, compress = True, workers = workers)
+    return counts
+
+
+def differences(pedal, archive, prune = False, force = False):
+    # what restore would change on a connected pedal
+    manifest = archive.json(SNAPSHOT)
+    model = manifest['profile']['model']
+    if model != pedal.model and not force:
+        raise ValueError("snapshot of a {}, not a {}".format(model, pedal.model))
+    wanted = listed_effects(archive.read(FLST))
+    current = read_file(pedal, FLST)
+    have = listed_effects(current) if current is not None else {}
+    files = set(pedal.file_list())
+
+    changes = {'effects': [], 'deleted': [], 'flst': current != archive.read(FLST), 'patches': []}
+    for effect in sorted(wanted):
+        if effect not in archive:
+            continue
+        if effect not in files or have.get(effect) != wanted[effect]:
+            changes['effects'].append(effect)
+    if prune:
+        changes['deleted'] = sorted(name for name in files
+            if name.upper().endswith(".ZD2") and name not in wanted)
+    for location in manifest['patches']:
+        if location >= pedal.numPatches:
+            continue
+        pedal.step("compare", location, pedal.numPatches)
+        if bytes(pedal.patch_download(location)) != archive.read(patch_member(location)):
+            changes['patches'].append(location)
+    return changes
+
+
+def restore(pedal, name, prune = False, force = False, dry = False):
+    # make a connected pedal match snapshot name, uploading only what
+    # differs. Returns the changes made (or, dry, that would be).
+    with ZoomArchive(name) as archive:
+        bad = archive.verify()
+        if bad:
+            raise ValueError("{}: bad checksum for {}".format(name, ", ".join(bad)))
+        changes = differences(pedal, archive, prune, force)
+        if dry:
+            return changes
+        effects = changes['effects']
+        for n, effect in enumerate(effects):
+            pedal.step("effects", n, len(effects))
+            pedal.file_check(effect)
+            pedal.file_upload(effect, archive.read(effect))
+            pedal.file_close()
+        for effect in changes['deleted']:
+            pedal.file_check(effect)
+            pedal.file_delete(effect)
+            pedal.file_close()
+        # once the effects it lists are there
+        if changes['flst']:
+            pedal.file_check(FLST)
+            pedal.file_upload(FLST, archive.read(FLST))
+            pedal.file_close()
+        pedal.step("patches", 0, len(changes['patches']))
+        pedal.patch_upload_many([(location, archive.read(patch_member(location)))
+            for location in changes['patches']])
+    return changes
+
+
+def describe(changes):
+    lines = []
+    for effect in changes['effects']:
+        lines.append("upload {}".format(effect))
+    for effect in changes['deleted']:
+        lines.append("delete {}".format(effect))
+    if changes['flst']:
+        lines.append("upload {}".format(FLST))
+    if changes['patches']:
+        lines.append("upload patches {}".format(" ".join(str(location) for location in changes['patches'])))
+    return lines or ["no changes"]
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] save ARCHIVE | restore ARCHIVE | list ARCHIVE"
+    parser = OptionParser(usage)
+    parser.add_option("-b", "--base",
+        help="earlier snapshot to take unchanged effects from (default ARCHIVE)", dest="base")
+    parser.add_option("-n", "--dry-run",
+        help="show what restore would change", action="store_true", dest="dry")
+    parser.add_option("--prune",
+        help="delete effects the snapshot does not list", action="store_true", dest="prune")
+    parser.add_option("--force",
+        help="restore a snapshot of another model", action="store_true", dest="force")
+    parser.add_option("--adaptive-flow",
+        help="tune upload block size and window to the pedal (see zoomflow.py)",
+        action="store_true", dest="adaptiveflow")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error("command and ARCHIVE required")
+    command, name = args
+
+    if command == "list":
+        with ZoomArchive(name) as archive:
+            manifest = archive.json(SNAPSHOT)
+        print("{} {} ({}), written {}".format(manifest['profile']['model'], manifest['profile']['version'],
+            manifest['port'], manifest['written']))
+        for effect, version in sorted(manifest['effects'].items()):
+            print("  {:16} {}".format(effect, version))
+        print("  {} patches".format(len(manifest['patches'])))
+        return
+    if command not in ("save", "restore"):
+        parser.error("unknown command")
+
+    pedal = zoomzt2()
+    if options.adaptiveflow:
+        pedal.flowSettings = FlowSettings()
+    if not pedal.connect():
+        sys.exit("Unable to find Pedal")
+    try:
+        if command == "save":
+            counts = snapshot(pedal, name, options.base)
+            print("{} effects downloaded, {} from the last snapshot, {} patches".format(
+                counts['effects'], counts['reused'], counts['patches']))
+        else:
+            changes = restore(pedal, name, options.prune, options.force, options.dry)
+            for line in describe(changes):
+                print(line)
+    finally:
+        pedal.disconnect()
+
+
+if __name__ == "__main__":
+    main()
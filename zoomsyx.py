@@ -0,0 +1,175 @@
+#!/usr/bin/python
+#
+# .syx import and export of patches.
+#
+#   python3 zoomsyx.py export -o bank.syx mypedal/patch_*
+#   python3 zoomsyx.py export -o bank.syx pedal.zarc       from a snapshot
+#   python3 zoomsyx.py export -o one.syx -l 12 mypedal/patch_3
+#   python3 zoomsyx.py list bank.syx
+#   python3 zoomsyx.py import bank.syx
+#
+# A .syx file is the sysex messages one after another, F0 ... F7. Each
+# patch is the message zoomzt2 sends to write it ('08 00 bank program',
+# packed and with its CRC), so the file can be sent by any sysex
+# librarian. The patches are preceded by PC mode on (6e 52) and
+# followed by PC mode off (6e 53), as they are written in PC mode.
+#
+# Export takes unpacked patches (patch_N as written by -R/--patch, the
+# location is N), patch dumps (see zoomdecode.py) or a snapshot (see
+# zoomsnapshot.py). Import sends the messages as they are in the file,
+# nothing is decoded or packed again, a window at a time as
+# patch_upload_many does (over the transport when there is one).
+#
+import json
+import mmap
+import os
+import sys
+
+from zoomzt2_shooking import zoomzt2
+from zoomdecode import read_dump, name_location, split_syx
+from zoomarchive import ZoomArchive
+from zoomflow import FlowSettings
+
+PC_MODE_ON = b"\x52\x00\x6e\x52"
+PC_MODE_OFF = b"\x52\x00\x6e\x53"
+
+
+def build_syx(patches, bankSize, pcMode = True):
+    # a .syx stream writing each (location, unpacked data)
+    codec = zoomzt2()
+    codec.bankSize = bankSize
+    out = bytearray()
+    if pcMode:
+        out += b"\xf0" + PC_MODE_ON + b"\xf7"
+    for location, data in patches:
+        out += b"\xf0" + codec.patch_packet(location, data) + b"\xf7"
+    if pcMode:
+        out += b"\xf0" + PC_MODE_OFF + b"\xf7"
+    return bytes(out)
+
+
+def read_patches(paths, bankSize = 10):
+    # (location, unpacked data) from patch files, dumps or snapshots,
+    # and the bank size a snapshot says its pedal has
+    patches = []
+    for path in paths:
+        if path.endswith(".zarc"):
+            with ZoomArchive(path) as archive:
+                manifest = archive.json("snapshot.json")
+                bankSize = manifest['profile']['bankSize']
+                for location in manifest['patches']:
+                    patches.append((location, archive.read("patch_{}".format(location))))
+            continue
+        with open(path, "rb") as infile:
+            location, data = read_dump(infile.read(), bankSize)
+        if location is None:
+            location = name_location(path)
+        if location is None:
+            raise ValueError("{}: no patch location, use -l".format(path))
+        if data:
+            patches.append((location, data))
+    return patches, bankSize
+
+
+def describe(message, bankSize = None):
+    # one line about a message of a .syx file
+    if message[:4] == PC_MODE_ON:
+        return "PC mode on"
+    if message[:4] == PC_MODE_OFF:
+        return "PC mode off"
+    if message[:5] == b"\x52\x00\x6e\x08\x00" and len(message) > 8:
+        length = message[8] * 128 + message[7]
+        if bankSize:
+            where = "patch {}".format(message[5] * bankSize + message[6])
+        else:
+            where = "bank {} program {}".format(message[5], message[6])
+        return "{}, {} bytes".format(where, length)
+    return " ".join("{:02x}".format(b) for b in message[:8]) + (" ..." if len(message) > 8 else "")
+
+
+def import_syx(pedal, name):
+    # send a .syx file's messages to a connected pedal. PC mode is left
+    # to the session. Returns the number of messages sent.
+    with open(name, "rb") as infile:
+        data = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            packets = [message for message in split_syx(data)
+                if message[:4] not in (PC_MODE_ON, PC_MODE_OFF)]
+        finally:
+            data.close()
+    for packet in packets:
+        if packet[:3] != b"\x52\x00\x6e":
+            raise ValueError("{}: not a Zoom message: {}".format(name, describe(packet)))
+        if packet[3] == 0x08 and (packet[6] >= pedal.bankSize
+                or packet[5] * pedal.bankSize + packet[6] >= pedal.numPatches):
+            raise ValueError("{}: {} is not on this pedal".format(name, describe(packet)))
+    pedal.send_packets(packets)
+    return len(packets)
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] export -o FILE.syx PATCH... | import FILE.syx | list FILE.syx"
+    parser = OptionParser(usage)
+    parser.add_option("-o", "--output",
+        help="file to export to", dest="output")
+    parser.add_option("-l", "--location",
+        help="export the patches to locations from N on, rather than their own", dest="location")
+    parser.add_option("-b", "--bank",
+        help="patches per bank (default from model.dat, or 10)", dest="bank")
+    parser.add_option("--no-pc-mode",
+        help="do not switch PC mode on and off around the patches", action="store_false",
+        dest="pcMode", default=True)
+    parser.add_option("--adaptive-flow",
+        help="tune upload block size and window to the pedal (see zoomflow.py)",
+        action="store_true", dest="adaptiveflow")
+    (options, args) = parser.parse_args()
+    if len(args) < 2:
+        parser.error("command and FILE required")
+    command = args[0]
+
+    bankSize = 10
+    if options.bank:
+        bankSize = int(options.bank)
+    elif os.path.exists("model.dat"):
+        with open("model.dat", "r") as infile:
+            bankSize = int(json.load(infile)['bankSize'])
+
+    if command == "export":
+        if not options.output:
+            parser.error("-o FILE.syx required")
+        patches, bankSize = read_patches(args[1:], bankSize)
+        if options.bank:
+            bankSize = int(options.bank)
+        if options.location is not None:
+            # in the order given
+            first = int(options.location)
+            patches = [(first + n, data) for n, (location, data) in enumerate(patches)]
+        else:
+            patches.sort(key = lambda patch: patch[0])
+        with open(options.output, "wb") as outfile:
+            outfile.write(build_syx(patches, bankSize, options.pcMode))
+        print("{} patches written to {}".format(len(patches), options.output))
+    elif command == "list":
+        with open(args[1], "rb") as infile:
+            for message in split_syx(infile.read()):
+                print(describe(message, bankSize))
+    elif command == "import":
+        pedal = zoomzt2()
+        if options.adaptiveflow:
+            pedal.flowSettings = FlowSettings()
+        if not pedal.connect():
+            sys.exit("Unable to find Pedal")
+        try:
+            n = import_syx(pedal, args[1])
+            print("{} messages sent".format(n))
+        finally:
+            pedal.disconnect()
+    else:
+        parser.error("unknown command")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+#
+# MIDI tracing for the Zoom tools.
+#
+# Logging to midi.log is off unless asked for, either with ZOOM_TRACE=n
+# in the environment or trace.set_level(n):
+#   0 - off (warnings only)
+#   1 - info, what we are doing plus one line per message
+#   2 - hex, full hex dump of every message
+#
+# Whatever the level every message is also kept in a small binary ring
+# buffer, which is written to midi_trace.bin when something goes wrong.
+# Decode it later with:
+#   python zoomtrace.py midi_trace.bin
+#
+import logging
+import os
+import struct
+import sys
+import threading
+
+TRACE_OFF = 0
+TRACE_INFO = 1
+TRACE_HEX = 2
+
+DIR_OUT = 0
+DIR_IN = 1
+
+MAGIC = b"ZTRC"
+RECORD = struct.Struct('<BH')
+
+
+class HexDump(object):
+    # formats only if the log record is actually written
+    def __init__(self, direct, data):
+        self.direct = direct
+        self.data = bytes(data)
+
+    def __str__(self):
+        lines = []
+        for i in range(0, len(self.data), 16):
+            lines.append(self.direct + " ".join("{0:#0{1}x}".format(m, 4) for m in self.data[i:i+16]))
+        return "\n".join(lines)
+
+
+class SysexRing(object):
+    # fixed size byte ring of [direction, length, data] records,
+    # the oldest records are dropped as new ones come in.
+    def __init__(self, size = 65536):
+        self.size = size
+        self.buf = bytearray(size)
+        # head and tail only grow, position in buf is modulo size
+        self.head = 0
+        self.tail = 0
+
+    def _read(self, pos, length):
+        pos = pos % self.size
+        end = pos + length
+        if end <= self.size:
+            return bytes(self.buf[pos:end])
+        return bytes(self.buf[pos:]) + bytes(self.buf[:end - self.size])
+
+    def _write(self, pos, data):
+        pos = pos % self.size
+        end = pos + len(data)
+        if end <= self.size:
+            self.buf[pos:end] = data
+        else:
+            split = self.size - pos
+            self.buf[pos:] = data[:split]
+            self.buf[:end - self.size] = data[split:]
+
+    def add(self, direction, data):
+        length = len(data)
+        needed = RECORD.size + length
+        if needed > self.size:
+            return
+        while self.head + needed - self.tail > self.size:
+            d, l = RECORD.unpack(self._read(self.tail, RECORD.size))
+            self.tail = self.tail + RECORD.size + l
+        self._write(self.head, RECORD.pack(direction, length))
+        self._write(self.head + RECORD.size, bytes(data))
+        self.head = self.head + needed
+
+    def clear(self):
+        self.head = 0
+        self.tail = 0
+
+    def raw(self):
+        return self._read(self.tail, self.head - self.tail)
+
+    def dump(self, name):
+        with open(name, "wb") as outfile:
+            outfile.write(MAGIC)
+            outfile.write(self.raw())
+
+
+def records(data):
+    # walk the records of a dumped ring
+    pos = 0
+    while pos + RECORD.size <= len(data):
+        direction, length = RECORD.unpack_from(data, pos)
+        pos = pos + RECORD.size
+        yield direction, data[pos:pos + length]
+        pos = pos + length
+
+
+class Trace(object):
+    def __init__(self, level = TRACE_OFF, dumpname = "midi_trace.bin"):
+        self.level = level
+        self.dumpname = dumpname
+        self.ring = SysexRing()
+        # optional full session recorder (see zoomreplay.py)
+        self.recorder = None
+        # several pedals may be talking at once (see zoomrack.py)
+        self.lock = threading.Lock()
+        # set by setup_logging, the log file is opened once tracing is on
+        self.logname = None
+        self.handler = None
+        self.console = None
+
+    def set_level(self, level):
+        self.level = int(level)
+        root = logging.getLogger()
+        if self.level >= TRACE_INFO and self.logname is not None and self.handler is None:
+            # from now on the log goes to the file rather than stderr
+            self.handler = logging.FileHandler(self.logname, delay = True)
+            self.handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+            root.addHandler(self.handler)
+            if self.console is not None:
+                root.removeHandler(self.console)
+                self.console = None
+        root.setLevel(logging.DEBUG if self.level > TRACE_OFF else logging.WARNING)
+
+    def enabled(self, level):
+        return self.level >= level
+
+    def message(self, direction, mtype, data):
+        # called for every MIDI message, keep it cheap when tracing is off.
+        # At TRACE_HEX this is the hex dump, callers should not add another
+        with self.lock:
+            if mtype == "sysex":
+                self.ring.add(direction, data)
+            if self.recorder is not None:
+                self.recorder.add(direction, mtype, data)
+        if self.level >= TRACE_INFO:
+            logging.info("MIDI %s %s %d bytes", "OUT" if direction == DIR_OUT else "IN", mtype, len(data))
+            if self.level >= TRACE_HEX:
+                logging.info("%s", HexDump("===>    " if direction == DIR_OUT else "<====    ", data))
+
+    def dump(self, reason = ""):
+        logging.warning("Dumping MIDI trace to %s %s", self.dumpname, reason)
+        with self.lock:
+            self.ring.dump(self.dumpname)
+
+    def excepthook(self, etype, value, tb):
+        self.dump("after {}".format(etype.__name__))
+        sys.__excepthook__(etype, value, tb)
+
+
+trace = Trace(int(os.environ.get("ZOOM_TRACE", TRACE_OFF)))
+
+
+def setup_logging(filename = 'midi.log'):
+    # filename is only created when tracing is on, until then warnings
+    # go to stderr
+    trace.logname = filename
+    root = logging.getLogger()
+    if not root.handlers:
+        # as basicConfig, unless logging is already set up
+        trace.console = logging.StreamHandler()
+        trace.console.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(trace.console)
+    trace.set_level(trace.level)
+
+
+#--------------------------------------------------
+def main():
+    from optparse import OptionParser
+
+    usage = "usage: %prog [options] TRACEFILE"
+    parser = OptionParser(usage)
+    parser.add_option("-o", "--out",
+        help="only show messages sent to the pedal",
+        action="store_true", dest="out")
+    parser.add_option("-i", "--in",
+        help="only show messages received from the pedal",
+        action="store_true", dest="inp")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("TRACEFILE not specified")
+
+    with open(args[0], "rb") as infile:
+        data = infile.read()
+    if data[:len(MAGIC)] != MAGIC:
+        sys.exit("Not a trace file")
+
+    for direction, payload in records(data[len(MAGIC):]):
+        if options.out and direction != DIR_OUT:
+            continue
+        if options.inp and direction != DIR_IN:
+            continue
+        direct = "===>    " if direction == DIR_OUT else "<====    "
+        print(direct + "0xf0")
+        print(HexDump(direct, payload))
+        print(direct + "0xf7")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+#
+# One MIDI port shared by the editor and background transfers.
+#
+# A Transport owns the pedal's input and output ports and a thread which
+# does all the talking. Anything wanting to send queues a request with a
+# priority: edits (FXM_*, program changes) are INTERACTIVE and go ahead
+# of a sync's file blocks (BULK) which queue behind them, a transfer is
+# only interrupted between its requests (or windows of requests, see
+# submit_many). A request waiting for a reply only takes a reply; edits
+# reported by the pedal (6e 64), program and control changes and
+# anything else nobody asked for are kept aside for pending().
+#
+#   transport = Transport(mido.open_input(name), mido.open_output(name))
+#   reply = transport.request([0x52, 0x00, 0x6e, 0x44])
+#   transport.send(msg)                  no reply, INTERACTIVE
+#   pedal.transport = transport          a zoomzt2 over the same port
+#
+import itertools
+import logging
+import queue
+import threading
+from collections import deque
+from time import perf_counter, sleep
+
+import mido
+
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+def is_reply(msg):
+    # could this be the answer to a request, rather than the pedal
+    # telling us something
+    if msg.type != 'sysex' or len(msg.data) < 4:
+        return False
+    if tuple(msg.data[:3]) == (0x52, 0x00, 0x6e):
+        # 6e 64 is an edit made on the pedal
+        return msg.data[3] != 0x64
+    # identity reply
+    return msg.data[0] == 0x7e and msg.data[2:4] == (0x06, 0x02)
+
+
+class Request(object):
+    def __init__(self, msgs, reply = True, end = None):
+        self.msgs = msgs
+        self.reply = reply
+        # once a reply is end(reply) the rest are not waited for long
+        self.end = end
+        self.replies = []
+        # seconds from sending each message to its reply
+        self.latencies = []
+        self.error = None
+        self.done = threading.Event()
+        self.queued = perf_counter()
+        self.seconds = 0.0
+
+    def wait(self, timeout = None):
+        # the replies, in order
+        if not self.done.wait(timeout):
+            raise IOError("transport: no reply")
+        if self.error is not None:
+            raise self.error
+        return self.replies
+
+
+class Transport(object):
+    def __init__(self, inport, outport, name = "transport", timeout = 5.0, grace = 0.05):
+        self.name = name
+        self.inport = inport
+        self.outport = outport
+        self.timeout = timeout
+        self.grace = grace
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.unsolicited = deque(maxlen = 1000)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'messages': 0, 'replies': 0, 'unsolicited': 0, 'errors': 0}
+        # seconds each priority waited in the queue
+        self.waits = {INTERACTIVE: [], NORMAL: [], BULK: []}
+        self.thread = threading.Thread(target = self.run, name = "transport", daemon = True)
+        self.thread.start()
+
+    def submit_many(self, msgs, priority = NORMAL, reply = True, end = None):
+        # queue msgs to be sent together, then their replies read. See
+        # Request for end.
+        if self.thread is None:
+            raise IOError("transport: closed")
+        request = Request(list(msgs), reply, end)
+        self.queue.put((priority, next(self.order), request))
+        return request
+
+    def submit(self, msg, priority = NORMAL, reply = True):
+        return self.submit_many([msg], priority, reply)
+
+    def request(self, data, priority = NORMAL):
+        # send sysex data and wait for the reply
+        msg = mido.Message('sysex', data = data)
+        return self.submit(msg, priority).wait()[0]
+
+    def send(self, msg, priority = INTERACTIVE):
+        # no reply expected, do not wait
+        self.submit(msg, priority, reply = False)
+
+    def pending(self):
+        # messages nobody asked for, oldest first
+        msgs = []
+        with self.lock:
+            while self.unsolicited:
+                msgs.append(self.unsolicited.popleft())
+        return msgs
+
+    def close(self):
+        if self.thread is not None:
+            # after anything already queued
+            self.queue.put((BULK + 1, next(self.order), None))
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        stats = dict(self.counters)
+        for priority, name in ((INTERACTIVE, 'interactive'), (NORMAL, 'normal'), (BULK, 'bulk')):
+            waits = sorted(self.waits[priority])
+            if waits:
+                stats[name + '_wait_max_ms'] = waits[-1] * 1000
+                stats[name + '_wait_p50_ms'] = waits[len(waits) // 2] * 1000
+        return stats
+
+    def keep(self, msg):
+        with self.lock:
+            self.unsolicited.append(msg)
+        self.counters['unsolicited'] = self.counters['unsolicited'] + 1
+
+    def read(self, deadline):
+        # next incoming message, None at deadline
+        if not hasattr(self.inport, 'poll'):
+            # eg. the emulator, which always has the reply ready
+            return self.inport.receive()
+        while perf_counter() < deadline:
+            msg = self.inport.poll()
+            if msg is not None:
+                return msg
+            sleep(0.0002)
+        return None
+
+    def run(self):
+        while True:
+            priority, order, request = self.queue.get()
+            if request is None:
+                break
+            start = perf_counter()
+            waits = self.waits[priority]
+            waits.append(start - request.queued)
+            if len(waits) > 10000:
+                del waits[:5000]
+            self.counters['requests'] = self.counters['requests'] + 1
+            try:
+                # anything which arrived since the last request is not a reply
+                if hasattr(self.inport, 'poll'):
+                    msg = self.inport.poll()
+                    while msg is not None:
+                        self.keep(msg)
+                        msg = self.inport.poll()
+                sent = []
+                for msg in request.msgs:
+                    self.outport.send(msg)
+                    sent.append(perf_counter())
+                    self.counters['messages'] = self.counters['messages'] + 1
+                if request.reply:
+                    deadline = perf_counter() + self.timeout
+                    ended = False
+                    expected = len(request.msgs)
+                    while expected:
+                        msg = self.read(deadline)
+                        if msg is None:
+                            if ended:
+                                # anything late is kept aside next time
+                                break
+                            raise IOError("transport: timed out waiting for reply")
+                        if not is_reply(msg):
+                            self.keep(msg)
+                            continue
+                        expected = expected - 1
+                        self.counters['replies'] = self.counters['replies'] + 1
+                        if ended:
+                            continue
+                        request.latencies.append(perf_counter() - sent[len(request.replies)])
+                        request.replies.append(msg)
+                        if request.end is not None and request.end(msg):
+                            ended = True
+                            deadline = min(deadline, perf_counter() + self.grace)
+            except Exception as e:
+                logging.warning("transport: %s", e)
+                self.counters['errors'] = self.counters['errors'] + 1
+                request.error = e
+            request.seconds = perf_counter() - start
+            request.done.set()
+
+
+class TransportPort(object):
+    # looks enough like a mido port for the editor (and CachedPort):
+    # sends are queued at priority, iter_pending gives what the pedal
+    # sent that was not a reply
+    def __init__(self, transport, priority = INTERACTIVE):
+        self.transport = transport
+        self.priority = priority
+
+    def send(self, msg):
+        self.transport.send(msg, self.priority)
+
+    def iter_pending(self):
+        for msg in self.transport.pending():
+            yield msg
+
+    def close(self):
+        self.transport.close()
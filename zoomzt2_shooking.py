@@ -11,7 +11,8 @@ import json5
 import json
 import math
 import logging
-logging.basicConfig(filename='midi.log', level=logging.DEBUG)
+from zoomtrace import trace, setup_logging, HexDump, TRACE_HEX, DIR_OUT, DIR_IN
+setup_logging()
 
 #gidMask = 0x0FFFFFFF
 gidMask = 0xFFFFFFFF
@@ -190,37 +191,227 @@ ZPTC = Padded(760, Struct(
     "PPRM" / PPRM,
 ))
 
+
+def zd2_describe(data, name):
+    # parse ZD2 data and build the catalog entry getfile writes to name.json
+    # returns the parsed ZD2 and the entry (None if there are no parameters)
+    binconfig = ZD2.parse(data)
+
+    # A1X has training ,. So use json5 to parse it.
+    x = json5.loads(binconfig['PRME']['data'])
+    # lets find the OnOff
+
+    # lets find the TXE1
+    TXdescription = (binconfig['TXE1']['name']).replace('\r','').replace('\n','')
+
+    logging.info("Desc %s", TXdescription)
+
+    
+    # lets find the OnOff
+    OnOffstart = data.find("OnOff".encode())
+    mmax = []
+    mdefault = []
+    if OnOffstart != 0:
+        logging.info("In OnOffstart")
+        for j in range(0, 10):
+            mmax.append(data[OnOffstart + j * 0x38 + 12] + 
+                data[OnOffstart + j * 0x38 + 13] * 256)
+            mdefault.append(data[OnOffstart + j * 0x38 + 16] + 
+            data[OnOffstart + j * 0x38 + 17] * 256);
+
+        numParams = len(x['Parameters'])
+        for j in range(numParams):
+            x['Parameters'][j]['mmax'] = mmax[j+2]
+            x['Parameters'][j]['mdefault'] = mdefault[j+2]
+        #print(x)
+        # get description the hard way.
+        # DIRTY SHOOKING HACK
+        # If we find a A1X4 MDL (gid 34) make it 162
+        myGid = ((binconfig['id'] & gidMask) >> 16) >> 5
+        if myGid == 34:
+            myGid = 34 + 128
+
+        xAdd = {
+            "FX" : 
+            { 
+                "name": binconfig['name'],
+                "description": TXdescription,
+                "version": binconfig['version'],
+                "fxid": (binconfig['id'] & fxidMask),
+                "gid": myGid,
+                "group": binconfig['group'], 
+                "groupname": "{}" .format( binconfig['groupname']),
+                "numParams": numParams,
+                "numSlots": math.ceil(numParams / 4),
+                "filename": name + '.BMP'
+            }
+        }
+        xAdd['Parameters'] = x['Parameters']
+        return binconfig, xAdd
+    return binconfig, None
+
+
+_ZPTC_cache = {}
+
+def ZPTC_sized(ptcSize):
+    # ZPTC for pedals whose patches are not 760 bytes (see 6e 44)
+    if ptcSize not in _ZPTC_cache:
+        _ZPTC_cache[ptcSize] = Padded(ptcSize, Struct(
+            Const(b"PTCF"),
+            Padding(8),
+            "fx_count" / Int32ul,
+            Padding(10),
+            "name" / PaddedString(10, "ascii"),
+            "ids" / Array(this.fx_count, Int32ul),
+            "TXJ1" / TXJ1,
+            "TXE1" / TXE1,
+            "EDTB" / EDTB,
+            "PPRM" / PPRM,
+        ))
+    return _ZPTC_cache[ptcSize]
+
+
+# first entry of every catalog (allfx.json)
+BYPASS = {
+    "FX": {
+        "name": "Bypass",
+        "description": "No effect.",
+        "version": "1.00",
+        "fxid": 0,
+        "gid": 0,
+        "group": 0,
+        "groupname": "BYPASS",
+        "numParams": 0,
+        "numSlots": 1,
+        "filename": ""
+    },
+    "Parameters": []
+}
+
+
+def decode_patch(data, ptcSize = 760, total_pedal = None, fxLookup = None):
+    # decode a patch into the form written to allpatches.json,
+    # FX are resolved against the catalog (allfx.json) if given.
+    thisPatch = {}
+    config = ZPTC_sized(ptcSize).parse(data)
+    #print("PatchNumber: {}".format(i))
+    numFX = (config['fx_count'])
+    thisPatch['numFX'] = numFX
+    patchName = (config['name'])
+    thisPatch['patchname'] = patchName
+    patchDescription = (config['TXE1']['name'])
+    thisPatch['description'] = patchDescription
+    logging.info ("Patch: %s", patchName)
+    logging.info ("Desc: %s", patchDescription)
+    theseFX = []
+    for fx in config['EDTB']['effects']:
+        thisFX={}
+        #logging.info("  enabled: {}".format(config['EDTB'][effectN]['reversed']['control']['enabled']))
+        currID = fx['reversed']['control']['id']
+        if currID == 1:
+            # this is part of a multiFX
+            continue
+        logging.info("  FXID=%d, GID=%d", currID & fxidMask, ((currID & gidMask)>>16)>>5)
+        thisFX['fxid'] = (currID & fxidMask)
+        thisFX['gid'] = (currID & gidMask)>>21
+        thisFX['enabled'] = fx['reversed']['control']['enabled']
+        # assume numParameters is 8, unless we already looked up FX and have a hit.
+        np = 8
+        npi = -1
+        fxName=""
+        fxDescription=""
+        fxVersion=""
+        fxFilename=""
+        fxnumSlots=1
+        if fxLookup is not None and total_pedal is not None:
+            try:
+                # DIRTY SHOOKING HACK
+                # we dont have name (it is in a patch)
+                # Mungewell's decoder things id is 28 bits
+                # but we need the full 32.
+                # GID of 34 (and maybe others) needs to be 162
+                if thisFX['gid'] == 34:
+                    thisFX['gid'] = 162 # 34 + 128
+
+                npi = fxLookup[thisFX['fxid'], thisFX['gid']]
+                baseFX = total_pedal[npi]['FX']
+                np = baseFX['numParams']
+                fxName = baseFX['name']
+                fxVersion = baseFX['version']
+                fxDescription = baseFX['description']
+                fxFilename = baseFX['filename']
+                fxnumSlots = baseFX['numSlots']
+            except KeyError:
+                logging.info("Exception looking up FXID: %s %s %s %s %s", thisFX['fxid'], \
+                        thisFX['gid'], patchName, currID, hex(int(currID)))
+                if trace.enabled(TRACE_HEX):
+                    logging.info(fxLookup)
+                # hack - often these are loopers or rhythm.
+                fxnumSlots = 2
+                np = 8
+        thisFX['name'] = fxName
+        thisFX['description'] = fxDescription
+        thisFX['version'] = fxVersion
+        thisFX['numSlots'] = fxnumSlots
+        thisFX['filename'] = fxFilename
+        thisFX['Parameters'] = []
+        # might not want to make param1 param2?
+        for j in range(1,np+1):
+            pj = "param{}".format(j)
+            thisParam = {}
+            if npi != -1:
+                baseP = total_pedal[npi]['Parameters'][j - 1]
+                thisParam = {
+                        pj: fx['reversed']['control'][pj],
+                        "name" : baseP['name'],
+                        "explanation": baseP['explanation'],
+                        "blackback": baseP['blackback'],
+                        "pedal": baseP['pedal'],
+                        "mmax": baseP['mmax'],
+                        "mdefault": baseP['mdefault']
+                        }
+            else:
+                logging.info("   %s = %s", pj, fx['reversed']['control'][pj])
+                thisParam = {pj: fx['reversed']['control'][pj]}
+            thisFX['Parameters'].append(thisParam)
+
+        theseFX.append(thisFX)
+    thisPatch['FX'] = theseFX        
+    if trace.enabled(TRACE_HEX):
+        logging.info(thisPatch)
+    return thisPatch
+
+
 #--------------------------------------------------
 import os
 import sys
 import mido
 import binascii
-from time import sleep
+import hashlib
+import mmap
+import shlex
+from time import sleep, perf_counter
+from zoommetrics import Metrics, timed
+from zoomdevice import profile, firmware, UNKNOWN, GCE3, IdentityCache, write_if_changed, find_ports
+from zoomflow import FlowControl, FlowSettings
+from zoomtransport import is_reply, NORMAL
+from collections import deque
 
 def printhex(direct, msg):
-    logging.info(direct)
-    l = []
-    numchar=0
-    for n in msg:
-        l.append(n)
-        numchar=numchar+1
-        if numchar % 16 == 0:
-            logging.info(" ".join( "{0:#0{1}x}".format(int( m ), 4) for m in l))
-            l = []
-    if l is not None:
-        logging.info(" ".join( "{0:#0{1}x}".format(int( m ), 4) for m in l))
+    # formatted only if midi.log is actually being written
+    logging.debug("%s", HexDump(direct, msg))
         
 def printExtrahex(direct, msg):
-    logging.info(direct + "0xf0 ")
+    logging.debug("%s0xf0 ", direct)
     printhex(direct, msg)
-    logging.info(direct + " 0xf7 ")
+    logging.debug("%s 0xf7 ", direct)
 
 
 def sniffMidiOut(mtype, data, printme = False):
 
-    logging.info("MIDI OUT")
-    if printme == True:
-        logging.info("sniffMidiOut")
+    trace.message(DIR_OUT, mtype, data)
+    # at TRACE_HEX trace.message has already dumped it
+    if printme == True and not trace.enabled(TRACE_HEX):
         if mtype == "sysex":
             printExtrahex("===>    ", data)
         else:
@@ -228,12 +419,24 @@ def sniffMidiOut(mtype, data, printme = False):
     return mido.Message(mtype, data = data)
 
 
-def sniffMidiIn(self, printme = False):
+def sniffMidiIn(self, printme = False, deadline = None):
+    # next message from the pedal, None if nothing came by deadline
+    # (ports without poll, the emulator and replays, always answer)
+    if deadline is None or not hasattr(self.inport, 'poll'):
+        return traceMidiIn(self.inport.receive(), printme)
+    while perf_counter() < deadline:
+        msg = self.inport.poll()
+        if msg is not None:
+            return traceMidiIn(msg, printme)
+        sleep(0.0002)
+    return None
+
+
+def traceMidiIn(msg, printme = False):
 
-    logging.info("MIDI IN")
-    msg = self.inport.receive()
-    if printme == True:
-        logging.info("sniffMidiIn")
+    trace.message(DIR_IN, msg.type, msg.data if msg.type == "sysex" else msg.bytes())
+    # at TRACE_HEX trace.message has already dumped it
+    if printme == True and not trace.enabled(TRACE_HEX):
         if msg.type == "sysex":
             printExtrahex("<====    ", msg.data)
         else:
@@ -247,6 +450,51 @@ if sys.platform == 'win32':
 else:
     midiname = "ZOOM G"
 
+class BytesSink(object):
+    # collects a download in memory
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, block):
+        self.data.extend(block)
+        return len(block)
+
+
+class BufferSink(object):
+    # writes a download into a preallocated buffer (bytearray, mmap...)
+    def __init__(self, buffer, offset = 0):
+        self.view = memoryview(buffer)
+        self.offset = offset
+
+    def write(self, block):
+        end = self.offset + len(block)
+        if end > len(self.view):
+            raise IOError("download does not fit in buffer")
+        self.view[self.offset:end] = block
+        self.offset = end
+        return len(block)
+
+
+def wild_name(data):
+    # the name in a reply to a 60 25/60 26 '*' request, None past the
+    # last file
+    if len(data) < 15 or data[4] != 4:
+        return None
+    for x in range(14, min(27, len(data))):
+        if data[x] == 0:
+            return bytes(data[14:x]).decode("utf-8")
+    return bytes(data[14:27]).decode("utf-8")
+
+
+def flst_check(data, names):
+    # compare FLST_SEQ.ZT2 with the files on the pedal, returns the
+    # effects it lists which are not there and the ZD2s it does not list
+    config = ZT2.parse(data)
+    listed = set(effect['effect'] for group in config[1] for effect in group['effects'])
+    installed = set(name for name in names if name.upper().endswith(".ZD2"))
+    return sorted(listed - installed), sorted(installed - listed)
+
+
 class zoomzt2(object):
     inport = None
     outport = None
@@ -257,195 +505,210 @@ class zoomzt2(object):
     version = 0
     gce3version = 0
     maxFX = 0
+    # something with ports() to talk to instead of a real pedal,
+    # a zoomreplay.ReplaySession or zoomemu.ZoomEmulator
+    backend = None
+    portName = None
+    # zoomdevice.IdentityCache, None to always probe the pedal
+    cache = None
+    # zoomdataset.DatasetStore, sync reuses effects we already have
+    datasets = None
+    refetch = False
+    # zoomflow.FlowSettings, uploads tune themselves and remember what
+    # worked. None sends 512 byte blocks one at a time, as always.
+    flowSettings = None
+    # zoomtransport.Transport when the port is shared (eg. with the
+    # editor), requests are queued at priority
+    transport = None
+    priority = NORMAL
+    # seconds to wait for a reply before giving up on the pedal, and for
+    # the rest of a window once a reply has ended it (see pipeline)
+    timeout = 5.0
+    grace = 0.05
+
+    def __init__(self, portNames = None, outdir = "."):
+        # portNames is an (input, output) pair from zoomdevice.find_ports,
+        # the first pedal found if not given. Files are written to outdir.
+        self.portNames = portNames
+        self.outdir = outdir
+        self.metrics = Metrics()
+        # called as progress(pedal, what, done, total), see zoomrack.py
+        self.progress = None
+        # file_list of this session, None once files change
+        self.listing = None
+        # FlowControl per kind of upload, see flow()
+        self.flows = {}
+        # messages read while waiting for a reply which were not one
+        self.unsolicited = deque(maxlen = 1000)
+
+    def path(self, name):
+        return os.path.join(self.outdir, name)
+
+    def step(self, what, done, total):
+        if self.progress is not None:
+            self.progress(self, what, done, total)
+
     def is_connected(self):
         if self.inport is None or self.outport is None:
             return(False)
         else:
             return(True)
 
+    def transact(self, data):
+        # send sysex to the pedal and wait for its reply
+        msg, seconds = self.pipeline([data])[0]
+        self.metrics.request(data, msg, seconds)
+        return(msg)
+
+    def keep(self, msg):
+        self.unsolicited.append(msg)
+        self.metrics.count("unsolicited")
+
+    def receive(self, timeout = None):
+        # the next reply, anything else the pedal sends meanwhile (edits
+        # made on it, program changes) is kept in unsolicited. None if
+        # there is none within timeout (default self.timeout).
+        deadline = perf_counter() + (self.timeout if timeout is None else timeout)
+        msg = sniffMidiIn(self, deadline = deadline)
+        while msg is not None and not is_reply(msg):
+            self.keep(msg)
+            msg = sniffMidiIn(self, deadline = deadline)
+        return msg
+
+    def pipeline(self, packets, end = None):
+        # send the packets, then read their replies. Returns (reply,
+        # seconds from sending its packet) for each. Over a transport they
+        # are one request, nothing else is sent between them. Once a reply
+        # is end(reply), those still to come are only waited for briefly
+        # and dropped, so fewer may be returned.
+        msgs = [sniffMidiOut("sysex", packet) for packet in packets]
+        if self.transport is not None:
+            request = self.transport.submit_many(msgs, self.priority, end = end)
+            return [(traceMidiIn(msg), seconds) for msg, seconds in zip(request.wait(), request.latencies)]
+        # anything which arrived since the last request is not a reply
+        if hasattr(self.inport, 'poll'):
+            for msg in self.inport.iter_pending():
+                self.keep(traceMidiIn(msg))
+        sent = []
+        for msg in msgs:
+            self.outport.send(msg)
+            sent.append(perf_counter())
+        sleep(0)
+        replies = []
+        ended = False
+        for msg in msgs:
+            if ended:
+                msg = self.receive(self.grace)
+                if msg is not None:
+                    self.metrics.count("replies_dropped")
+                continue
+            msg = self.receive()
+            if msg is None:
+                raise IOError("no reply from pedal")
+            replies.append((msg, perf_counter() - sent[len(replies)]))
+            ended = end is not None and end(msg)
+        return replies
+
+    @timed("connect")
     def connect(self):
-        for port in mido.get_input_names():
-            logging.info("{}, {}".format(port, midiname))
-            if port[:len(midiname)]==midiname:
-                self.inport = mido.open_input(port)
-                #print("Using Input:", port)
-                break
-        for port in mido.get_output_names():
-            logging.info("{}".format(port))
-            if port[:len(midiname)]==midiname:
-                self.outport = mido.open_output(port)
-                #print("Using Output:", port)
-                break
+        if self.transport is not None:
+            self.inport, self.outport = self.transport.inport, self.transport.outport
+            self.portName = self.transport.name
+        elif self.backend is not None:
+            self.inport, self.outport = self.backend.ports()
+            self.portName = type(self.backend).__name__
+        else:
+            if self.portNames is None:
+                pairs = find_ports(midiname)
+                logging.info("Found %s", pairs)
+                if pairs:
+                    self.portNames = pairs[0]
+            if self.portNames is not None:
+                self.inport = mido.open_input(self.portNames[0])
+                self.outport = mido.open_output(self.portNames[1])
+                self.portName = self.portNames[0]
 
         if self.inport is None or self.outport is None:
             #print("Unable to find Pedal")
             return(False)
 
         # ask pedal for some info
-
+        # the identity is enough if we have seen this pedal before
         logging.info("Grab Pedal Info")
         data = [0x52, 0x00, 0x6e, 0x50]
-        msg = sniffMidiOut("sysex", data)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        self.transact(data)
 
         data = [0x7e, 0x00, 0x06, 0x01]
-        msg = sniffMidiOut("sysex", data)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(data)
         d = msg.data
-        print(d)
+        logging.debug("Identity %s", d)
         if len(d) < 12:
-            print("odd - too short")
-            sys.exit(1)
-        if d[5] == 0x6e and d[6] == 0x00 and d[7] == 0x10:
+            raise ValueError("odd - identity reply too short")
+
+        state = None
+        if self.cache is not None:
+            state = self.cache.get(self.portName, d)
+        if state is not None:
+            logging.info("Using cached pedal info for %s", self.portName)
+            self.metrics.count("identity_cached")
+        else:
+            state = self.probe(d)
+            if self.cache is not None:
+                self.cache.put(self.portName, d, state)
+        for key in state:
+            setattr(self, key, state[key])
+
+        # write out pedal state
+        logging.debug("Pedal %s", state)
+        write_if_changed(self.path("model.dat"), state)
+
+        # Enable PC Mode
+        logging.info("Enable PC Mode")
+        data = [0x52, 0x00, 0x6e, 0x52]
+        #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x52])
+        msg = self.transact(data)
+        return(True)
+
+    def probe(self, d):
+        # work out model and sizes, d is the identity reply
+        model = UNKNOWN
+        version = self.version
+        gce3version = self.gce3version
+        if d[5] == 0x6e and d[6] == 0x00 and d[7] == GCE3:
             # a Zoom GCE-3
-            self.gce3version = chr(d[9]) + chr(d[10]) + chr(d[11]) + chr(d[12])
+            gce3version = firmware(d)
             # check model
             data = [0x52, 0x00, 0x6e, 0x58, 0x02]
-            msg = sniffMidiOut("sysex", data)
-            self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+            msg = self.transact(data)
             d = msg.data
             if d[5] == 0x6e and d[6] == 0x00:
-                if   d[7] == 0x00:
-                    self.model = "G5n"
-                    self.version = "3.00"
-                    self.maxFX = 9
-                elif d[7] == 0x02:
-                    self.model = "G3n"
-                    self.version = "2.20"
-                    self.maxFX = 7
-                elif d[7] == 0x03:
-                    self.model = "G3Xn"
-                    self.version = "2.20"
-                    self.maxFX = 7
-                elif d[7] == 0x04:
-                    self.model = "B3n"
-                    self.version = "2.20"
-                    self.maxFX = 7
-                elif d[7] == 0x0c:
-                    self.model = "G1 Four"
-                    self.version = "2.00"
-                    self.maxFX = 5
-                elif d[7] == 0x0d:
-                    self.model = "G1X Four"
-                    self.version = "2.00"
-                    self.maxFX = 5
-                elif d[7] == 0x0e:
-                    self.model = "B1 FOUR"
-                    self.version = "2.00"
-                    self.maxFX = 5
-                elif d[7] == 0x0f:
-                    self.model = "B1X Four"
-                    self.version = "2.00"
-                    self.maxFX = 5
-                elif d[7] == 0x10:
-                    self.model = "GCE-3" # aguess
-                    self.version = "1.20"
-                    self.maxFX = 5
-                elif d[7] == 0x11:
-                    self.model = "A1 Four"
-                    self.version = "1.01"
-                elif d[7] == 0x12:
-                    self.model = "A1X Four"
-                    self.version = "1.01"
-                    self.maxFX = 5
-                elif d[7] == 0x13:
-                    self.model = "??"
-                    self.version = "1.50"
-                    self.maxFX = 5
-                elif d[7] == 0x17:
-                    self.model = "??"
-                    self.version = "1.30"
-                    self.maxFX = 5
-                elif d[7] == 0x19:
-                    self.model = "??"
-                    self.version = "1.30"
-                    self.maxFX = 5
+                model = profile(d[7], gce3 = True)
+                version = model['version']
         elif d[5] == 0x6e and d[6] == 0x00:
-            self.version = chr(d[9]) + chr(d[10]) + chr(d[11]) + chr(d[12])
-            if   d[7] == 0x00:
-                self.model = "G5n"
-                self.maxFX = 9
-            elif d[7] == 0x02:
-                self.model = "G3n"
-                self.maxFX = 7
-            elif d[7] == 0x03:
-                self.model = "G3Xn"
-                self.maxFX = 7
-            elif d[7] == 0x04:
-                self.model = "B3n"
-                self.maxFX = 7
-            elif d[7] == 0x0c:
-                self.model = "G1 Four"
-                self.maxFX = 5
-            elif d[7] == 0x0d:
-                self.model = "G1X Four"
-                self.maxFX = 5
-            elif d[7] == 0x0e:
-                self.model = "B1 FOUR"
-                self.maxFX = 5
-            elif d[7] == 0x0f:
-                self.model = "B1X Four"
-                self.maxFX = 5
-            elif d[7] == 0x10:
-                self.model = "GCE-3" # aguess
-                self.version = "1.20"
-                self.maxFX = 5
-            elif d[7] == 0x11:
-                self.model = "A1 Four"
-                self.maxFX = 5
-            elif d[7] == 0x12:
-                self.model = "A1X Four"
-                self.maxFX = 5
-            elif d[7] == 0x13:
-                self.model = "??"
-                self.maxFX = 5
-            elif d[7] == 0x17:
-                self.model = "??"
-                self.maxFX = 5
-            elif d[7] == 0x19:
-                self.model = "??"
-                self.maxFX = 5
+            model = profile(d[7])
+            version = firmware(d)
+
         # how big is patch etc
         data = [0x52, 0x00, 0x6e, 0x44]
-        msg = sniffMidiOut("sysex", data)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(data)
         d = msg.data
-        self.numPatches = d[5] * 128 + d[4]
-        self.bankSize = d[11] * 128 + d[10]
-        self.ptcSize = d[7] * 128 + d[6]
-
-        # write out pedal state
-        out1 = open("model.dat", "w")
-        if not out1:
-            sys.exit("Unable to open FILE for writing")
-        tD = {
-                "model": self.model,
-                "numPatches": self.numPatches,
-                "bankSize": self.bankSize,
-                "ptcSize": self.ptcSize,
-                "version": self.version,
-                "gce3version": self.gce3version,
-                "maxFX": self.maxFX
+        return {
+                "model": model['model'],
+                "numPatches": d[5] * 128 + d[4],
+                "bankSize": d[11] * 128 + d[10],
+                "ptcSize": d[7] * 128 + d[6],
+                "version": version,
+                "gce3version": gce3version,
+                "maxFX": model['maxFX']
             }
-        print(tD)
-        json.dump(tD, out1, indent = 6)
-        out1.close()
-
-        # Enable PC Mode
-        logging.info("Enable PC Mode")
-        data = [0x52, 0x00, 0x6e, 0x52]
-        msg = sniffMidiOut("sysex", data)
-        #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x52])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
-        return(True)
 
+    @timed("disconnect")
     def disconnect(self):
         # Disable PC Mode
         logging.info("Disable PC Mode")
         data = [0x52, 0x00, 0x6e, 0x53]
-        msg = sniffMidiOut("sysex", data)
         #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x53])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        self.transact(data)
 
         self.inport = None
         self.outport = None
@@ -461,18 +724,35 @@ class zoomzt2(object):
             encode.append(byte & 0x7f)
 
             if len(encode) > 7:
-                packet = packet + encode
+                packet.extend(encode)
                 encode = bytearray(b"\x00")
 
         # don't forget to add last few bytes
         if len(encode) > 1:
-            packet = packet + encode
+            packet.extend(encode)
 
         return(packet)
 
+    def crc(self, data):
+        # CRC32 of the (unpacked) data as the 5 7bit bytes ending a packet
+        crc = binascii.crc32(data) ^ 0xFFFFFFFF
+        return bytearray([crc & 0x7f, (crc >> 7) & 0x7f, (crc >> 14) & 0x7f,
+            (crc >> 21) & 0x7f, (crc >> 28) & 0x0f])
+
+    def crc_ok(self, packet, data):
+        # confirm checksum (last 5 bytes of packet)
+        # note: mido packet does not have SysEx prefix/postfix
+        checksum = packet[-5] + (packet[-4] << 7) + (packet[-3] << 14) \
+                + (packet[-2] << 21) + ((packet[-1] & 0x0F) << 28) 
+        if (checksum ^ 0xFFFFFFFF) == binascii.crc32(data):
+            return(True)
+        logging.warning("Checksum error %s", hex(checksum))
+        self.metrics.count("checksum_errors")
+        return(False)
+
     def unpack(self, packet):
         # Unpack data 7bit to 8bit, MSBs in first byte
-        logging.info("Packet length {}".format(len(packet)))
+        logging.debug("Packet length %d", len(packet))
         data = bytearray(b"")
         loop = -1
         hibits = 0
@@ -494,6 +774,11 @@ class zoomzt2(object):
     def add_effect(self, data, name, version, id):
         logging.info("add_effect")
         config = ZT2.parse(data)
+        self.add_effect_config(config, name, version, id)
+        return ZT2.build(config)
+
+    def add_effect_config(self, config, name, version, id):
+        # add_effect on an already parsed FLST_SEQ
         head, tail = os.path.split(name)
         
         group_new = (id & 0xFF000000) >> 24
@@ -519,8 +804,6 @@ class zoomzt2(object):
             new = dict(group=group_new, groupname=group_new, effects=effects, groupend=group_new)
             config[1].append(new)
 
-        return ZT2.build(config)
-
     def add_effect_from_filename(self, data, name):
         binfile = open(name, "rb")
         if binfile:
@@ -536,6 +819,10 @@ class zoomzt2(object):
 
     def remove_effect(self, data, name):
         config = ZT2.parse(data)
+        self.remove_effect_config(config, name)
+        return ZT2.build(config)
+
+    def remove_effect_config(self, config, name):
         head, tail = os.path.split(name)
         
         for group in config[1]:
@@ -546,8 +833,6 @@ class zoomzt2(object):
                     del effects[slice]
                 slice = slice + 1
 
-        return ZT2.build(config)
-
     def filename(self, packet, name):
         # send filename (with different packet headers)
         logging.info(" send filename (with different packet headers")
@@ -556,11 +841,11 @@ class zoomzt2(object):
             packet.append(ord(tail[x]))
         packet.append(0x00)
 
-        msg = sniffMidiOut("sysex", data = packet)
         #msg = mido.Message("sysex", data = packet)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(packet)
         return(msg)
 
+    @timed("file_check")
     def file_check(self, name):
         # check file is present on device
         logging.info(" Checking file is present on device")
@@ -569,63 +854,100 @@ class zoomzt2(object):
         self.filename(packet, tail)
 
         data = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00]
-        msg = sniffMidiOut("sysex", data)
         #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(data)
         logging.info(msg)
         if msg.data[6] == 127 and msg.data[7] == 127:
             return(False)
         logging.info("We are checking the file HERE")
         data = [0x52, 0x00, 0x6e, 0x60, 0x27]
-        msg = sniffMidiOut("sysex", data = data)
         #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x27])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(data)
         logging.info(msg)
         return(True)
     
+    @timed("file_wild")
     def file_wild(self, first):
         if first:
             packet = bytearray(b"\x52\x00\x6e\x60\x25\x00\x00")
         else:
             packet = bytearray(b"\x52\x00\x6e\x60\x26\x00\x00")
         msg = self.filename(packet, "*")
-
-        if msg.data[4] == 4:
-            for x in range(14,27):
-                if msg.data[x] == 0:
-                    return bytes(msg.data[14:x]).decode("utf-8")
-        return ""
+        return wild_name(msg.data) or ""
+
+    @timed("file_list")
+    def file_list(self, window = 8):
+        # names of every file on the pedal. Instead of a round trip per
+        # name (file_wild) window 'next' requests are sent before reading
+        # their replies, those past the last file are answered 60 01 and
+        # dropped. Kept for the session until a file is uploaded or deleted.
+        if self.listing is not None:
+            self.metrics.count("file_list_cached")
+            return list(self.listing)
+        names = []
+        name = self.file_wild(True)
+        if name:
+            names.append(name)
+            request = [0x52, 0x00, 0x6e, 0x60, 0x26, 0x00, 0x00, ord("*"), 0x00]
+            done = False
+            while not done:
+                # the window stops at the first 60 01
+                for msg, seconds in self.pipeline([request] * window,
+                        end = lambda msg: wild_name(msg.data) is None):
+                    self.metrics.request(request, msg, seconds)
+                    name = wild_name(msg.data)
+                    if name is None:
+                        done = True
+                    else:
+                        names.append(name)
+        self.listing = names
+        return list(names)
+
+    def check_effects(self):
+        # FLST_SEQ against the ZD2s on the pedal, see flst_check
+        self.file_check("FLST_SEQ.ZT2")
+        data = self.file_download("FLST_SEQ.ZT2")
+        self.file_close()
+        return flst_check(data, self.file_list())
 
     def file_download(self, name):
         # download file from pedal to PC
-        logging.info("In file_download {}".format(name))
+        sink = BytesSink()
+        self.file_download_to(name, sink)
+        return(sink.data)
+
+    @timed("file_download")
+    def file_download_to(self, name, sink, digest = "sha1"):
+        # download file from pedal, each block is written to sink as it
+        # arrives. sink is anything with write(), a file, an mmap or a
+        # BufferSink. Returns the length and hex digest of the file.
+        logging.info("In file_download %s", name)
         packet = bytearray(b"\x52\x00\x6e\x60\x20\x02\x00\x00\x00\x00\x00\x00\x00\x00\x00")
         logging.info("packet")
         head, tail = os.path.split(name)
+        stats = self.metrics.file(tail, "download")
+        start = perf_counter()
         self.filename(packet, tail)
 
-        msg = sniffMidiOut("sysex", data = packet)
         # msg = mido.Message("sysex", data = packet)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(packet)
         
         # Read parts 1 through 17 - refers to FLST_SEQ, possibly larger
-        data = bytearray(b"")
+        hasher = hashlib.new(digest)
+        total = 0
         while True:
             sData = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00]
-            msg = sniffMidiOut("sysex", data=sData)
             #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00])
-            self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+            msg = self.transact(sData)
 
             #sData = [0x52, 0x00, 0x6e, 0x60, 0x22, 0x14, 0x2f, 0x60, 0x00, 0x0c, 0x00, 0x04, 0x00, 0x00, 0x00]
             sData = [0x52, 0x00, 0x6e, 0x60, 0x22, 0x14, 0x2f, 0x60, 0x00, 0x0c, 0x00, 0x02, 0x00, 0x00, 0x00]
-            msg = sniffMidiOut("sysex", data=sData)
             #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x22, 0x14, 0x2f, 0x60, 0x00, 0x0c, 0x00, 0x04, 0x00, 0x00, 0x00])
-            self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+            msg = self.transact(sData)
 
             sData = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00]
-            msg = sniffMidiOut("sysex", data=sData)
             #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00])
-            self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+            msg = self.transact(sData)
 
             #decode received data
             packet = msg.data
@@ -638,80 +960,133 @@ class zoomzt2(object):
 
             #print("HERE IS THE BLOCK!! {} from {}".format(len(block), len(packet)+2))
             #printhex("BLOCK ", block, False)
-            # confirm checksum (last 5 bytes of packet)
-            # note: mido packet does not have SysEx prefix/postfix
-            checksum = packet[-5] + (packet[-4] << 7) + (packet[-3] << 14) \
-                    + (packet[-2] << 21) + ((packet[-1] & 0x0F) << 28) 
-            if (checksum ^ 0xFFFFFFFF) == binascii.crc32(block):
-                data = data + block
+            if self.crc_ok(packet, block):
+                sink.write(block)
+                hasher.update(block)
+                total = total + len(block)
+                stats['blocks'] = stats['blocks'] + 1
+                stats['bytes'] = stats['bytes'] + len(block)
             else:
-                logging.info("Checksum error {}".format(hex(checksum)))
+                trace.dump("checksum error in {}".format(tail))
                 break
-        return(data)
+        stats['seconds'] = stats['seconds'] + perf_counter() - start
+        stats[digest] = hasher.hexdigest()
+        return(total, stats[digest])
+
+    def flow(self, kind):
+        # FlowControl for "upload" (file blocks) or "patch" uploads
+        if kind not in self.flows:
+            if self.flowSettings is not None:
+                self.flows[kind] = self.flowSettings.flow(self.model, kind)
+            else:
+                self.flows[kind] = FlowControl(settled = True)
+        return self.flows[kind]
 
+    def flow_done(self, kind):
+        # remember what worked for this model
+        if self.flowSettings is not None and kind in self.flows:
+            self.flowSettings.put(self.model, kind, self.flows[kind])
+
+    def upload_packet(self, block):
+        packet = bytearray(b"\x52\x00\x6e\x60\x23\x40\x00\x00\x00\x00")
+        length = len(block)
+        packet.append(length & 0x7f)
+        packet.append((length >> 7) & 0x7f)
+        packet = packet + bytearray(b"\x00\x00\x00")
+
+        packet = packet + self.pack(block)
+
+        # Compute CRC32
+        packet = packet + self.crc(block)
+        return packet
+
+    def status_ok(self, msg):
+        # reply to 60 05, 7f 7f is the pedal saying no
+        d = msg.data
+        return not (len(d) > 7 and d[6] == 127 and d[7] == 127)
+
+    @timed("file_upload")
     def file_upload(self, name, data):
-        packet = bytearray(b"\x52\x00\x6e\x60\x24")
         head, tail = os.path.split(name)
+        self.listing = None
+        stats = self.metrics.file(tail, "upload")
+        start = perf_counter()
+        flow = self.flow("upload")
+        # a tuned flow the pedal refuses is tried once more at the safe
+        # 512/1, as it has always been sent
+        for attempt in range(2):
+            if self.upload_blocks(tail, data, flow, stats):
+                break
+            self.metrics.count("flow_errors")
+            if flow.failed or flow.is_safe():
+                raise IOError("upload of {} refused".format(tail))
+            flow.fail()
+            self.flow_done("upload")
+            self.file_close()
+        stats['seconds'] = stats['seconds'] + perf_counter() - start
+        stats['block'] = flow.block
+        stats['window'] = flow.window
+        self.flow_done("upload")
+
+    def upload_blocks(self, tail, data, flow, stats):
+        # open tail and send data, False if the pedal refused a block
+        packet = bytearray(b"\x52\x00\x6e\x60\x24")
         self.filename(packet, tail)
 
         packet = bytearray(b"\x52\x00\x6e\x60\x20\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00")
-        head, tail = os.path.split(name)
         self.filename(packet, tail)
 
         d1 = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00]
-        msg = sniffMidiOut("sysex", d1 )
         # msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
-
-        while len(data):
-            packet = bytearray(b"\x52\x00\x6e\x60\x23\x40\x00\x00\x00\x00")
-            if len(data) > 512:
-                length = 512
-            else:
-                length = len(data)
-            packet.append(length & 0x7f)
-            packet.append((length >> 7) & 0x7f)
-            packet = packet + bytearray(b"\x00\x00\x00")
-
-            packet = packet + self.pack(data[:length])
-
-            # Compute CRC32
-            crc = binascii.crc32(data[:length]) ^ 0xFFFFFFFF
-            packet.append(crc & 0x7f)
-            packet.append((crc >> 7) & 0x7f)
-            packet.append((crc >> 14) & 0x7f)
-            packet.append((crc >> 21) & 0x7f)
-            packet.append((crc >> 28) & 0x0f)
-
-            data = data[length:]
-            #print(hex(len(packet)), binascii.hexlify(packet))
-
-            msg = sniffMidiOut("sysex", data = packet)
-            # msg = mido.Message("sysex", data = packet)
-            self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        self.transact(d1)
+
+        # window blocks are sent before reading their replies, then the
+        # status is polled once for the lot
+        offset = 0
+        while offset < len(data):
+            sent = []
+            windowStart = perf_counter()
+            for n in range(flow.window):
+                if offset >= len(data):
+                    break
+                length = min(flow.block, len(data) - offset)
+                packet = self.upload_packet(data[offset:offset + length])
+                sent.append((packet, length))
+                offset = offset + length
+            replies = self.pipeline([packet for packet, length in sent])
+            for (packet, length), (msg, seconds) in zip(sent, replies):
+                self.metrics.request(packet, msg, seconds)
+                stats['blocks'] = stats['blocks'] + 1
+                stats['bytes'] = stats['bytes'] + length
 
             sData = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00]
-            msg = sniffMidiOut("sysex", data = sData)
             # msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x05, 0x00])
-            self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+            msg = self.transact(sData)
+            # only a tuned flow can be refused, the safe path ignores
+            # the status as it always has
+            if self.flowSettings is not None and not self.status_ok(msg):
+                return False
+            flow.measure(sum(length for packet, length in sent), perf_counter() - windowStart)
+        return True
 
     def file_delete(self, name):
         packet = bytearray(b"\x52\x00\x6e\x60\x24")
         head, tail = os.path.split(name)
+        self.listing = None
         self.filename(packet, tail)
 
+    @timed("file_close")
     def file_close(self):
         data = [0x52, 0x00, 0x6e, 0x60, 0x21, 0x40, 0x00, 0x00, 0x00, 0x00]
-        msg = sniffMidiOut("sysex", data)
         #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x21, 0x40, 0x00, 0x00, 0x00, 0x00])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        self.transact(data)
         
         data = [0x52, 0x00, 0x6e, 0x60, 0x09]
-        msg = sniffMidiOut("sysex", data)
         #msg = mido.Message("sysex", data = [0x52, 0x00, 0x6e, 0x60, 0x09])
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        self.transact(data)
  
  
+    @timed("patch_download")
     def patch_download(self, location):
         logging.info("patch_download")
         packet = bytearray(b"\x52\x00\x6e\x09\x00")
@@ -722,9 +1097,8 @@ class zoomzt2(object):
         packet.append(a1)
         packet.append(b1)
 
-        msg = sniffMidiOut("sysex", data = packet)
         #msg = mido.Message("sysex", data = packet)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        msg = self.transact(packet)
 
         # decode received data
         packet = msg.data
@@ -733,17 +1107,17 @@ class zoomzt2(object):
             return()
         data = self.unpack(packet[9:9 + length + int(length/7) + 1])
 
-        # confirm checksum (last 5 bytes of packet)
-        checksum = packet[-5] + (packet[-4] << 7) + (packet[-3] << 14) \
-                + (packet[-2] << 21) + ((packet[-1] & 0x0F) << 28) 
-
-        if (checksum ^ 0xFFFFFFFF) != binascii.crc32(data):
-            logging.info("Checksum error {}".format( hex(checksum)) )
+        stats = self.metrics.file("patch_{}".format(location), "download")
+        stats['blocks'] = stats['blocks'] + 1
+        stats['bytes'] = stats['bytes'] + len(data)
+        if not self.crc_ok(packet, data):
+            trace.dump("checksum error in patch {}".format(location))
 
         return(data)
 
 
-    def patch_upload(self, location, data):
+    def patch_packet(self, location, data):
+        # the sysex (without F0/F7) writing data to patch location
         packet = bytearray(b"\x52\x00\x6e\x08\x00")
         a1=int(location / self.bankSize)
         b1=location % self.bankSize
@@ -757,18 +1131,47 @@ class zoomzt2(object):
         packet = packet + self.pack(data[:length])
 
         # Compute CRC32
-        crc = binascii.crc32(data[:length]) ^ 0xFFFFFFFF
-        packet.append(crc & 0x7f)
-        packet.append((crc >> 7) & 0x7f)
-        packet.append((crc >> 14) & 0x7f)
-        packet.append((crc >> 21) & 0x7f)
-        packet.append((crc >> 28) & 0x0f)
+        packet = packet + self.crc(data[:length])
+        return packet
+
+    @timed("patch_upload")
+    def patch_upload(self, location, data):
+        packet = self.patch_packet(location, data)
 
         #print(hex(len(packet)), binascii.hexlify(packet))
 
-        msg = sniffMidiOut("sysex", data = packet)
         #msg = mido.Message("sysex", data = packet)
-        self.outport.send(msg); sleep(0); msg = sniffMidiIn(self)
+        self.transact(packet)
+        stats = self.metrics.file("patch_{}".format(location), "upload")
+        stats['blocks'] = stats['blocks'] + 1
+        stats['bytes'] = stats['bytes'] + len(data)
+
+    def send_packets(self, packets, kind = "patch", what = "patches"):
+        # send ready made sysex packets (eg. from a .syx file) a window at
+        # a time, see flow(). Returns the replies.
+        flow = self.flow(kind)
+        replies = []
+        while len(replies) < len(packets):
+            sent = packets[len(replies):len(replies) + flow.window]
+            windowStart = perf_counter()
+            for packet, (msg, seconds) in zip(sent, self.pipeline(sent)):
+                self.metrics.request(packet, msg, seconds)
+                replies.append(msg)
+            self.step(what, len(replies), len(packets))
+            flow.measure(sum(len(packet) for packet in sent), perf_counter() - windowStart)
+        self.flow_done(kind)
+        return replies
+
+    @timed("patch_upload_many")
+    def patch_upload_many(self, patches):
+        # patch_upload for each (location, data), window patches at a time
+        patches = [(location, data) for location, data in patches if len(data)]
+        self.send_packets([self.patch_packet(location, data) for location, data in patches])
+        for location, data in patches:
+            stats = self.metrics.file("patch_{}".format(location), "upload")
+            stats['blocks'] = stats['blocks'] + 1
+            stats['bytes'] = stats['bytes'] + len(data)
+        return len(patches)
 
     '''
     def patch_download_current(self):
@@ -777,205 +1180,277 @@ class zoomzt2(object):
     def patch_upload_current(self, data):
         packet = bytearray(b"\x52\x00\x6e\x28")
     '''
+    @timed("getfile")
     def getfile(self, name):
-        logging.info("options.receive - getting {}".format(name))
+        logging.info("options.receive - getting %s", name)
         state = self.file_check(name)
         if (state == False):
-            self.disconnect()
-            sys.exit("Filename doesnt exist")
-        data = self.file_download(name)        
-        self.file_close()
-        binconfig = ZD2.parse(data)
-
+            raise IOError("{}: Filename doesnt exist".format(name))
         # print("Writing ZD2")
-        outfile = open(name, "wb")
+        outfile = open(self.path(name), "w+b")
         if not outfile:
-            sys.exit("Unable to open FILE for writing")
-        # print("data is ", len(data))
-        outfile.write(data)
+            raise IOError("Unable to open FILE for writing")
+        length, digest = self.file_download_to(name, outfile)
+        self.file_close()
+        outfile.flush()
+        # describe the file we just wrote rather than keeping a copy
+        if length:
+            data = mmap.mmap(outfile.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            data = b""
+        binconfig, xAdd = zd2_describe(data, name)
+        if length:
+            data.close()
         outfile.close()
 
         # writing BMP
-        outBMfile = open(name + ".BMP", "wb")
+        outBMfile = open(self.path(name + ".BMP"), "wb")
         if not outBMfile:
-            sys.exit("Unable to open FILE for writing")
+            raise IOError("Unable to open FILE for writing")
         outBMfile.write(binconfig['ICON']['data'])
         outBMfile.close()
 
-        # A1X has training ,. So use json5 to parse it.
-        x = json5.loads(binconfig['PRME']['data'])
-        # lets find the OnOff
-
-        # lets find the TXE1
-        TXdescription = (binconfig['TXE1']['name']).replace('\r','').replace('\n','')
-
-        logging.info("Desc {}".format( TXdescription))
-
-        
-        # lets find the OnOff
-        OnOffstart = data.find("OnOff".encode())
-        mmax = []
-        mdefault = []
-        if OnOffstart != 0:
-            logging.info("In OnOffstart")
-            for j in range(0, 10):
-                mmax.append(data[OnOffstart + j * 0x38 + 12] + 
-                    data[OnOffstart + j * 0x38 + 13] * 256)
-                mdefault.append(data[OnOffstart + j * 0x38 + 16] + 
-                data[OnOffstart + j * 0x38 + 17] * 256);
-
-            numParams = len(x['Parameters'])
-            for j in range(numParams):
-                x['Parameters'][j]['mmax'] = mmax[j+2]
-                x['Parameters'][j]['mdefault'] = mdefault[j+2]
-            #print(x)
-            # get description the hard way.
-            # DIRTY SHOOKING HACK
-            # If we find a A1X4 MDL (gid 34) make it 162
-            myGid = ((binconfig['id'] & gidMask) >> 16) >> 5
-            if myGid == 34:
-                myGid = 34 + 128
-
-            xAdd = {
-                "FX" : 
-                { 
-                    "name": binconfig['name'],
-                    "description": TXdescription,
-                    "version": binconfig['version'],
-                    "fxid": (binconfig['id'] & fxidMask),
-                    "gid": myGid,
-                    "group": binconfig['group'], 
-                    "groupname": "{}" .format( binconfig['groupname']),
-                    "numParams": numParams,
-                    "numSlots": math.ceil(numParams / 4),
-                    "filename": name + '.BMP'
-                }
-            }
-            xAdd['Parameters'] = x['Parameters']
-            out_file = open(name + ".json", "w")
+        if xAdd is not None:
+            out_file = open(self.path(name + ".json"), "w")
             json.dump(xAdd, out_file, indent = 6)
             out_file.close()
-            return xAdd
-        return None
-
+        return xAdd
+
+    def getfile_stored(self, dataset, name, version):
+        # write out an effect we already have from a zoomdataset, as
+        # getfile would. None if we have not got it (or it differs).
+        if name + ".json" not in dataset or name not in dataset:
+            return None
+        xAdd = dataset.json(name + ".json")
+        if xAdd['FX']['version'].strip() != version.strip():
+            return None
+        logging.info("Using stored %s", name)
+        self.metrics.count("effects_stored")
+        for member in (name, name + ".BMP", name + ".json"):
+            if member in dataset:
+                with open(self.path(member), "wb") as outfile:
+                    outfile.write(dataset.read(member))
+        return xAdd
+
+    @timed("allpatches")
     def allpatches(self, total_pedal = None, fxLookup = None):
+        # returns the names of the patch files written
         thesePatches = []
+        written = []
         for i in range(0, self.numPatches):
             print("processing patch {}".format(i))
+            self.step("patches", i, self.numPatches)
             data = self.patch_download(i)
-            outfile = open("patch_{}".format(i), "wb")
+            outfile = open(self.path("patch_{}".format(i)), "wb")
             if not outfile:
                 sys.exit("Unable to open FILE for writing")
             outfile.write(data)
             outfile.close()
-            thisPatch = {}
+            written.append("patch_{}".format(i))
             if data:
-                ZPTC = Padded(self.ptcSize, Struct(
-                    Const(b"PTCF"),
-                    Padding(8),
-                    "fx_count" / Int32ul,
-                    Padding(10),
-                    "name" / PaddedString(10, "ascii"),
-                    "ids" / Array(this.fx_count, Int32ul),
-                    "TXJ1" / TXJ1,
-                    "TXE1" / TXE1,
-                    "EDTB" / EDTB,
-                    "PPRM" / PPRM,
-                ))
-
-                config = ZPTC.parse(data)
-                #print("PatchNumber: {}".format(i))
-                numFX = (config['fx_count'])
-                thisPatch['numFX'] = numFX
-                patchName = (config['name'])
-                thisPatch['patchname'] = patchName
-                patchDescription = (config['TXE1']['name'])
-                thisPatch['description'] = patchDescription
-                logging.info ("Patch: {}".format(patchName))
-                logging.info ("Desc: {}".format(patchDescription))
-                theseFX = []
-                for fx in config['EDTB']['effects']:
-                    thisFX={}
-                    idN = "id{}".format(fx)
-                    effectN = "effect{}".format(fx)
-                    #logging.info("  enabled: {}".format(config['EDTB'][effectN]['reversed']['control']['enabled']))
-                    currID = fx['reversed']['control']['id']
-                    if currID == 1:
-                        # this is part of a multiFX
-                        continue
-                    logging.info("  FXID={}, GID={}".format(str(currID & fxidMask), str( ( (currID & gidMask)>>16)>>5) ) )
-                    thisFX['fxid'] = (currID & fxidMask)
-                    thisFX['gid'] = (currID & gidMask)>>21
-                    thisFX['enabled'] = fx['reversed']['control']['enabled']
-                    # assume numParameters is 8, unless we already looked up FX and have a hit.
-                    np = 8
-                    npi = -1
-                    fxName=""
-                    fxDescription=""
-                    fxVersion=""
-                    fxFilename=""
-                    fxnumSlots=1
-                    if fxLookup is not None and total_pedal is not None:
-                        try:
-                            # DIRTY SHOOKING HACK
-                            # we dont have name (it is in a patch)
-                            # Mungewell's decoder things id is 28 bits
-                            # but we need the full 32.
-                            # GID of 34 (and maybe others) needs to be 162
-                            if thisFX['gid'] == 34:
-                                thisFX['gid'] = 162 # 34 + 128
-
-                            npi = fxLookup[thisFX['fxid'], thisFX['gid']]
-                            baseFX = total_pedal[npi]['FX']
-                            np = baseFX['numParams']
-                            fxName = baseFX['name']
-                            fxVersion = baseFX['version']
-                            fxDescription = baseFX['description']
-                            fxFilename = baseFX['filename']
-                            fxnumSlots = baseFX['numSlots']
-                        except KeyError:
-                            logging.info("Exception looking up FXID: {} {} {} {} {}".format(thisFX['fxid'], \
-                                    thisFX['gid'], patchName, currID, hex(int(currID))))
-                            logging.info(fxLookup)
-                            # hack - often these are loopers or rhythm.
-                            fxnumSlots = 2
-                            np = 8
-                    thisFX['name'] = fxName
-                    thisFX['description'] = fxDescription
-                    thisFX['version'] = fxVersion
-                    thisFX['numSlots'] = fxnumSlots
-                    thisFX['filename'] = fxFilename
-                    thisFX['Parameters'] = []
-                    # might not want to make param1 param2?
-                    for j in range(1,np+1):
-                        pj = "param{}".format(j)
-                        thisParam = {}
-                        if npi != -1:
-                            baseP = total_pedal[npi]['Parameters'][j - 1]
-                            thisParam = {
-                                    pj: fx['reversed']['control'][pj],
-                                    "name" : baseP['name'],
-                                    "explanation": baseP['explanation'],
-                                    "blackback": baseP['blackback'],
-                                    "pedal": baseP['pedal'],
-                                    "mmax": baseP['mmax'],
-                                    "mdefault": baseP['mdefault']
-                                    }
-                        else:
-                            logging.info("   {} = {}".format(pj, fx['reversed']['control'][pj]))
-                            thisParam = {pj: fx['reversed']['control'][pj]}
-                        thisFX['Parameters'].append(thisParam)
- 
-                    theseFX.append(thisFX)
-                thisPatch['FX'] = theseFX        
-                logging.info(thisPatch)
+                thisPatch = decode_patch(data, self.ptcSize, total_pedal, fxLookup)
+                # empty locations are skipped, so keep where it came from
+                thisPatch['location'] = i
                 thesePatches.append(thisPatch)
-        logging.info("PRINTING THESE PATCHES")
-        logging.info(thesePatches)
-        out_file = open("allpatches.json", "w")
+        if trace.enabled(TRACE_HEX):
+            logging.info("PRINTING THESE PATCHES")
+            logging.info(thesePatches)
+        out_file = open(self.path("allpatches.json"), "w")
         json.dump(thesePatches, out_file, indent = 4)
         out_file.close()
-        
+        self.step("patches", self.numPatches, self.numPatches)
+        return written
+
+    @timed("sync")
+    def sync(self):
+        # everything -R does: FLST_SEQ, every effect (getfile) and every
+        # patch, returns the FLST_SEQ data
+        self.file_check("FLST_SEQ.ZT2")
+        data = self.file_download("FLST_SEQ.ZT2")
+        logging.info("options.receive - getting FLST_SEQ.ZT2")
+        self.file_close()
+
+        dataset = None
+        if self.datasets is not None and not self.refetch:
+            dataset = self.datasets.open(self.model, self.version)
+
+        # so now interpret the data to get the ZD2's.
+        # and for each call getfile(name)
+        # we also create a total pedal JSON
+        # we need to create a "blank" entry for BYPASS
+        total_pedal = [BYPASS]
+
+        fxLookup = {}
+        fxLookup[0, 0] = 0
+        j = 1
+        config = ZT2.parse(data)
+        numEffects = sum(len(group["effects"]) for group in config[1])
+        for group in config[1]:
+            logging.info("Group%s: %s", dict(group)["group"], dict(group)["groupname"])
+    
+            for effect in dict(group)["effects"]:
+                myG = dict(effect)["id"]
+                myGID = ((myG & gidMask) >> 16) >> 5
+                myID = (myG & fxidMask)
+                logging.info("myID is %s %s", myID, hex(myID))
+                logging.info("myGID is %s %s", int(myGID), hex(int(myGID)))
+                logging.info("   %s (ver=%s), group=%s, id=%s, fxid=%s, gid=%s, installed=%s", dict(effect)["effect"], dict(effect)["version"], \
+                    dict(effect)["group"], hex(dict(effect)["id"]), \
+                    hex(myID), \
+                    hex(int(myGID)), \
+                    dict(effect)["installed"])
+                logging.info("Getting %s", dict(effect)["effect"])
+                self.step("effects", j - 1, numEffects)
+                currFX = None
+                if dataset is not None:
+                    currFX = self.getfile_stored(dataset, dict(effect)["effect"], dict(effect)["version"])
+                if currFX is None:
+                    currFX = self.getfile(dict(effect)["effect"])
+                total_pedal.append(currFX)
+                fxLookup[myID, myGID] = j 
+                j = j + 1
+        self.step("effects", numEffects, numEffects)
+        out_file = open(self.path("allfx.json"), "w")
+        json.dump(total_pedal, out_file, indent = 6)
+        out_file.close()
+
+        # now find list of Patches, pass in the fxLookup and total_pedal
+        # we should use 6e 44 to determine how name patches.
+        written = self.allpatches(total_pedal = total_pedal, fxLookup = fxLookup)
+
+        if self.datasets is not None:
+            files, new = self.datasets.add(self.model, self.version, self.outdir,
+                flst = data, patches = written)
+            logging.info("Stored %s %s, %d files %d new", self.model, self.version, files, new)
+        return data
+
+#--------------------------------------------------
+class Batch(object):
+    # runs a script of commands over one connection, one per line:
+    #
+    #   getfile NAME            download effect NAME (as -g)
+    #   install FILE.ZD2        upload an effect and add it to FLST_SEQ
+    #   uninstall NAME          delete an effect and remove it from FLST_SEQ
+    #   add NAME VERSION ID     add effect to FLST_SEQ (as -A -v -i)
+    #   delete NAME             remove effect from FLST_SEQ (as -D)
+    #   patch get N FILE        download patch N (as -p)
+    #   patch put N FILE        upload patch N (as -P)
+    #   send FILE               use FILE as FLST_SEQ
+    #   receive FILE            write FLST_SEQ to FILE
+    #
+    # '#' starts a comment. Lines as printed by --build work too, only
+    # their -A/-v/-i and -D are used. FLST_SEQ is downloaded and parsed
+    # when first needed, edited in memory and built and sent once at
+    # the end if it changed, also when a line fails, so it lists the
+    # effects installed and uninstalled before it.
+    def __init__(self, pedal, parser = None):
+        self.pedal = pedal
+        # main's OptionParser, for --build lines
+        self.parser = parser
+        self.config = None
+        self.changed = False
+        self.timings = []
+
+    def flst(self):
+        if self.config is None:
+            self.pedal.file_check("FLST_SEQ.ZT2")
+            data = self.pedal.file_download("FLST_SEQ.ZT2")
+            self.pedal.file_close()
+            self.config = ZT2.parse(data)
+        return self.config
+
+    def command(self, words):
+        pedal = self.pedal
+        cmd = words[0]
+        if cmd.startswith("python") or cmd.endswith("zoomzt2_shooking.py") or cmd.startswith("-"):
+            return self.options(words)
+        if cmd == "getfile" and len(words) == 2:
+            pedal.getfile(words[1])
+        elif cmd == "install" and len(words) == 2:
+            with open(words[1], "rb") as binfile:
+                bindata = binfile.read()
+            binconfig = ZD2.parse(bindata)
+            head, tail = os.path.split(words[1])
+            pedal.file_check(tail)
+            pedal.file_upload(tail, bindata)
+            pedal.file_close()
+            pedal.add_effect_config(self.flst(), tail, binconfig['version'], binconfig['id'])
+            self.changed = True
+        elif cmd == "uninstall" and len(words) == 2:
+            pedal.file_check(words[1])
+            pedal.file_delete(words[1])
+            pedal.file_close()
+            pedal.remove_effect_config(self.flst(), words[1])
+            self.changed = True
+        elif cmd == "add" and len(words) == 4:
+            pedal.add_effect_config(self.flst(), words[1], words[2], int(words[3], 0))
+            self.changed = True
+        elif cmd == "delete" and len(words) == 2:
+            pedal.remove_effect_config(self.flst(), words[1])
+            self.changed = True
+        elif cmd == "patch" and len(words) == 4 and words[1] == "get":
+            data = pedal.patch_download(int(words[2]))
+            with open(words[3], "wb") as outfile:
+                outfile.write(data)
+        elif cmd == "patch" and len(words) == 4 and words[1] == "put":
+            with open(words[3], "rb") as infile:
+                data = infile.read()
+            if len(data):
+                pedal.patch_upload(int(words[2]), data)
+        elif cmd == "send" and len(words) == 2:
+            with open(words[1], "rb") as infile:
+                self.config = ZT2.parse(infile.read())
+            self.changed = True
+        elif cmd == "receive" and len(words) == 2:
+            with open(words[1], "wb") as outfile:
+                outfile.write(ZT2.build(self.flst()))
+        else:
+            raise ValueError("unknown command: {}".format(" ".join(words)))
+
+    def options(self, words):
+        # a zoomzt2_shooking.py command line, eg. from --build
+        while words and not words[0].startswith("-"):
+            words = words[1:]
+        try:
+            (options, args) = self.parser.parse_args(words)
+        except SystemExit:
+            # OptionParser has printed why, do not end the batch here
+            raise ValueError("bad options: {}".format(" ".join(words)))
+        if options.add and options.ver and options.id:
+            self.pedal.add_effect_config(self.flst(), options.add, options.ver, int(options.id, 0))
+            self.changed = True
+        if options.delete:
+            self.pedal.remove_effect_config(self.flst(), options.delete)
+            self.changed = True
+
+    def run(self, lines):
+        # returns [(line, seconds)], stops at the first failing line
+        try:
+            for line in lines:
+                words = shlex.split(line, comments = True)
+                if not words:
+                    continue
+                start = perf_counter()
+                with self.pedal.metrics.phase("batch " + words[0]):
+                    self.command(words)
+                self.timings.append((line.strip(), perf_counter() - start))
+                print("{:9.1f}ms  {}".format(self.timings[-1][1] * 1000, line.strip()))
+        finally:
+            self.flush()
+        return self.timings
+
+    def flush(self):
+        # send FLST_SEQ if the batch changed it
+        if self.changed:
+            start = perf_counter()
+            self.pedal.file_check("FLST_SEQ.ZT2")
+            self.pedal.file_upload("FLST_SEQ.ZT2", ZT2.build(self.config))
+            self.pedal.file_close()
+            self.changed = False
+            self.timings.append(("send FLST_SEQ.ZT2", perf_counter() - start))
+            print("{:9.1f}ms  {}".format(self.timings[-1][1] * 1000, "(send FLST_SEQ.ZT2)"))
+
+
 #--------------------------------------------------
 def main():
     from optparse import OptionParser
@@ -1035,10 +1510,86 @@ def main():
     parser.add_option("-P", "--upload",
         help="upload specific patch (10..59)", dest="upload")
 
+    # attached device's file system
+    parser.add_option("-l", "--ls",
+        help="list files on attached device", action="store_true", dest="ls")
+    parser.add_option("-C", "--check",
+        help="check FLST_SEQ against the effects on attached device",
+        action="store_true", dest="check")
+
+    parser.add_option("--batch",
+        help="run the commands in file (- for stdin) over one connection, see Batch",
+        dest="batch")
+
+    parser.add_option("--record",
+        help="record the MIDI session to file (see zoomreplay.py)", dest="record")
+    parser.add_option("--replay",
+        help="run against a recorded MIDI session instead of the pedal", dest="replay")
+    parser.add_option("--speed",
+        help="replay speed, 1 original, 0 as fast as possible (use with --replay)",
+        dest="speed", default="1")
+
+    parser.add_option("-M", "--metrics",
+        help="write transport metrics report to file (default metrics.json)",
+        dest="metrics", default="metrics.json")
+
+    parser.add_option("--probe",
+        help="ignore the cached pedal identity (~/.zoom_identity.json) and probe the pedal",
+        action="store_true", dest="probe")
+
+    parser.add_option("--adaptive-flow",
+        help="tune upload block size and window to the pedal (see zoomflow.py), "
+            "rather than 512 byte blocks one at a time",
+        action="store_true", dest="adaptiveflow")
+
+    parser.add_option("--refetch",
+        help="download every effect, even those already in the dataset store",
+        action="store_true", dest="refetch")
+
+    parser.add_option("-T", "--trace",
+        help="trace level for midi.log, 0 off, 1 info, 2 hex (default $ZOOM_TRACE or 0)",
+        dest="trace")
+
     (options, args) = parser.parse_args()
+    if options.trace is not None:
+        trace.set_level(options.trace)
+    # keep the last MIDI traffic if we fall over
+    sys.excepthook = trace.excepthook
+
+    # report where the time went, however we exit
+    import atexit
+    def write_metrics():
+        if pedal.metrics.requests():
+            pedal.metrics.dump(options.metrics)
+    atexit.register(write_metrics)
+
+    if options.record:
+        from zoomreplay import Recorder
+        # the replay should not record itself
+        argv = []
+        skip = False
+        for arg in sys.argv:
+            if skip or arg.startswith("--record"):
+                skip = (arg == "--record")
+                continue
+            argv.append(arg)
+        trace.recorder = Recorder(options.record, argv)
+        atexit.register(trace.recorder.close)
+    if options.replay:
+        from zoomreplay import ReplaySession
+        zoomzt2.backend = ReplaySession.load(options.replay, float(options.speed))
+    # recordings must hold the full probe to replay it
+    if not (options.probe or options.record or zoomzt2.backend is not None):
+        pedal.cache = IdentityCache()
+    if not (options.record or zoomzt2.backend is not None):
+        from zoomdataset import DatasetStore
+        pedal.datasets = DatasetStore()
+        pedal.refetch = options.refetch
+        if options.adaptiveflow:
+            pedal.flowSettings = FlowSettings()
     logging.info(options)
     logging.info(args)
-    if len(args) != 1:
+    if len(args) != 1 and not (options.ls or options.check or options.batch):
         parser.error("FILE not specified")
 
     if options.getfile:
@@ -1056,10 +1607,60 @@ def main():
         if int(options.upload) < 10 or int(options.upload) > 59:
             sys.exit("Patch number should be between 10 and 59")
 
-    if options.receive or options.send or options.install or options.patch or options.upload or options.getfile:
-        if not pedal.connect():
+    if options.receive or options.send or options.install or options.patch or options.upload or options.getfile \
+            or options.ls or options.check or options.batch:
+        try:
+            connected = pedal.connect()
+        except (IOError, ValueError) as e:
+            sys.exit("Unable to talk to Pedal: {}".format(e))
+        if not connected:
             sys.exit("Unable to find Pedal")
 
+    def give_up(e):
+        # leave PC mode if the pedal still answers
+        try:
+            pedal.disconnect()
+        except IOError:
+            pass
+        sys.exit(str(e))
+
+    if options.batch:
+        if options.batch == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(options.batch, "r") as script:
+                lines = script.readlines()
+        batch = Batch(pedal, parser)
+        status = 0
+        start = perf_counter()
+        try:
+            batch.run(lines)
+        except Exception as e:
+            logging.exception("batch failed")
+            print("Failed: {}".format(e))
+            status = 1
+        print("{:9.1f}ms  total, {} steps".format((perf_counter() - start) * 1000, len(batch.timings)))
+        pedal.disconnect()
+        exit(status)
+
+    if options.ls or options.check:
+        status = 0
+        if options.ls:
+            for name in pedal.file_list():
+                print(name)
+        if options.check:
+            missing, unlisted = pedal.check_effects()
+            for name in missing:
+                print("in FLST_SEQ but not installed: {}".format(name))
+            for name in unlisted:
+                print("installed but not in FLST_SEQ: {}".format(name))
+            if missing or unlisted:
+                status = 1
+            else:
+                print("FLST_SEQ matches the installed effects")
+        pedal.disconnect()
+        exit(status)
+
     if options.patch:
         logging.info("options.patch")
         data = pedal.patch_download(int(options.patch))
@@ -1098,65 +1699,16 @@ def main():
         exit(0)
 
     if options.getfile:
-        pedal.getfile(options.getfile)
+        try:
+            pedal.getfile(options.getfile)
+        except IOError as e:
+            give_up(e)
 
     if options.receive:
-        pedal.file_check("FLST_SEQ.ZT2")
-        data = pedal.file_download("FLST_SEQ.ZT2")
-        logging.info("options.receive - getting FLST_SEQ.ZT2")
-        pedal.file_close()
-
-        # so now interpret the data to get the ZD2's.
-        # and for each call getfile(name)
-        # we also create a total pedal JSON
-        # we need to create a "blank" entry for BYPASS
-        total_pedal = [{
-            "FX": {
-                "name": "Bypass",
-                "description": "No effect.",
-                "version": "1.00",
-                "fxid": 0,
-                "gid": 0,
-                "group": 0,
-                "groupname": "BYPASS",
-                "numParams": 0,
-                "numSlots": 1,
-                "filename": ""
-            },
-            "Parameters": []
-            }
-        ]
-
-        fxLookup = {}
-        fxLookup[0, 0] = 0
-        j = 1
-        config = ZT2.parse(data)
-        for group in config[1]:
-            logging.info("Group{}: {}".format( dict(group)["group"],  dict(group)["groupname"]))
-    
-            for effect in dict(group)["effects"]:
-                myG = dict(effect)["id"]
-                myGID = ((myG & gidMask) >> 16) >> 5
-                myID = (myG & fxidMask)
-                logging.info("myID is {} {}".format( myID, hex(myID)))
-                logging.info("myGID is {} {}".format( int(myGID), hex(int(myGID))))
-                logging.info("   {} (ver={}), group={}, id={}, fxid={}, gid={}, installed={}".format(dict(effect)["effect"], dict(effect)["version"], \
-                    dict(effect)["group"], hex(dict(effect)["id"]), \
-                    hex(myID), \
-                    hex(int(myGID)), \
-                    dict(effect)["installed"]))
-                logging.info("Getting {}".format(dict(effect)["effect"]))
-                currFX = pedal.getfile(dict(effect)["effect"])
-                total_pedal.append(currFX)
-                fxLookup[myID, myGID] = j 
-                j = j + 1
-        out_file = open("allfx.json", "w")
-        json.dump(total_pedal, out_file, indent = 6)
-        out_file.close()
-
-        # now find list of Patches, pass in the fxLookup and total_pedal
-        # we should use 6e 44 to determine how name patches.
-        pedal.allpatches(total_pedal = total_pedal, fxLookup = fxLookup)
+        try:
+            data = pedal.sync()
+        except IOError as e:
+            give_up(e)
     else:
         # Read data from file
         infile = open(args[0], "rb")
@@ -1199,6 +1751,7 @@ def main():
     if options.summary and data:
         logging.info("summary")
         config = ZT2.parse(data)
+        total_pedal = []
         for group in config[1]:
             logging.info("Group{}: {}".format( dict(group)["group"],  dict(group)["groupname"]))
     